@@ -0,0 +1,25 @@
+-- Add content_hash to an existing documents table without dropping it.
+-- The hash is sha256 of sha256('models/embedding-001' || content) in hex
+-- followed by the chunk's source, the same key replica/utils/content_store.py
+-- computes (chunk_hash), so re-uploading these chunks is skipped.
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash text;
+
+-- Backfill one row per distinct text and source; exact duplicates already in the table keep a NULL hash.
+UPDATE documents d
+SET content_hash = h.hash
+FROM (
+  SELECT DISTINCT ON (hash) id, hash
+  FROM (
+    SELECT id, encode(sha256(convert_to(
+      encode(sha256(convert_to('models/embedding-001' || content, 'UTF8')), 'hex') || coalesce(metadata->>'source', ''),
+      'UTF8')), 'hex') AS hash
+    FROM documents
+    WHERE content_hash IS NULL AND content IS NOT NULL
+  ) hashed
+  WHERE NOT EXISTS (SELECT 1 FROM documents e WHERE e.content_hash = hashed.hash)
+  ORDER BY hash, id
+) h
+WHERE d.id = h.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS documents_content_hash_idx
+ON documents (content_hash);
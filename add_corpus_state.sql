@@ -0,0 +1,25 @@
+-- Add the shared corpus version to an existing database. A statement-level
+-- trigger bumps corpus_state.version on every write to documents, whichever
+-- process makes it, and the retrieval and answer caches drop their entries
+-- when it changes (see replica/utils/corpus_sync.py).
+CREATE TABLE IF NOT EXISTS corpus_state (
+  id int primary key default 1 check (id = 1),
+  version bigint not null default 0,
+  updated_at timestamptz default now()
+);
+
+INSERT INTO corpus_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_corpus_version() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE corpus_state SET version = version + 1, updated_at = now() WHERE id = 1;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS documents_corpus_version ON documents;
+CREATE TRIGGER documents_corpus_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON documents
+FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
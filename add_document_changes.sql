@@ -0,0 +1,48 @@
+-- Add the document change log to an existing database. Statement-level
+-- triggers record the id of every row inserted, updated or deleted in
+-- documents, so each process applies other processes' writes to its
+-- in-process BM25 and vector indexes, and a prebuilt embedding segment is
+-- reconciled from the entries logged since its build (see
+-- replica/utils/change_log.py). Entries can be pruned once no running
+-- process or segment predates them.
+CREATE TABLE IF NOT EXISTS document_changes (
+  seq bigserial primary key,
+  doc_id uuid,
+  op char(1) not null,
+  changed_at timestamptz default now()
+);
+
+CREATE OR REPLACE FUNCTION log_document_changes() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    INSERT INTO document_changes (doc_id, op) SELECT id, 'D' FROM old_rows;
+  ELSIF TG_OP = 'TRUNCATE' THEN
+    INSERT INTO document_changes (doc_id, op) VALUES (NULL, 'T');
+  ELSE
+    INSERT INTO document_changes (doc_id, op) SELECT id, 'U' FROM new_rows;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS documents_log_insert ON documents;
+CREATE TRIGGER documents_log_insert
+AFTER INSERT ON documents REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+DROP TRIGGER IF EXISTS documents_log_update ON documents;
+CREATE TRIGGER documents_log_update
+AFTER UPDATE ON documents REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+DROP TRIGGER IF EXISTS documents_log_delete ON documents;
+CREATE TRIGGER documents_log_delete
+AFTER DELETE ON documents REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+DROP TRIGGER IF EXISTS documents_log_truncate ON documents;
+CREATE TRIGGER documents_log_truncate
+AFTER TRUNCATE ON documents
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
@@ -0,0 +1,9 @@
+-- Add the per-source manifest table used by incremental ("sync") uploads
+-- to an existing database. Sources ingested before this have no manifest;
+-- their first sync re-records it without deleting anything.
+CREATE TABLE IF NOT EXISTS document_sources (
+  source text primary key,
+  fingerprint text,
+  chunk_hashes text[] not null default '{}',
+  updated_at timestamptz default now()
+);
@@ -0,0 +1,139 @@
+-- Bring an existing database up to the current match_documents without dropping
+-- documents: the HNSW and metadata GIN indexes, and the match_documents /
+-- match_documents_many signatures (match_count, filter, ef_search) that
+-- replica/utils/vector_search.py calls. Building the HNSW index on a large
+-- table takes a while; raise maintenance_work_mem first if it is slow.
+DROP FUNCTION IF EXISTS match_documents_many;
+DROP FUNCTION IF EXISTS match_documents;
+
+-- Approximate nearest-neighbour index for cosine distance.
+-- Raise m / ef_construction for better recall at the cost of build time and memory.
+CREATE INDEX IF NOT EXISTS documents_embedding_hnsw_idx
+ON documents USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- Containment index for metadata filters (source, file_type, upload_batch, tenant).
+-- jsonb_path_ops only supports @>, which is all match_documents uses, and is smaller than the default opclass.
+CREATE INDEX IF NOT EXISTS documents_metadata_gin_idx
+ON documents USING gin (metadata jsonb_path_ops);
+
+-- match_count limits the result set server-side. An HNSW scan returns at most
+-- hnsw.ef_search rows, and ef_search is capped at 1000, so NULL (every row) or a
+-- count above 1000 ranks the whole table exactly instead of using the index;
+-- ef_search is the HNSW candidate list size used otherwise (raised to match_count).
+-- A selective filter narrows to the matching rows through the GIN index and ranks
+-- them exactly; a broad one (10000+ rows) uses HNSW with the filter applied in the
+-- scan, iterative (pgvector 0.8+) or over-fetched, since an exact scan would be slow.
+CREATE FUNCTION match_documents (
+  query_embedding vector(768),
+  match_count int default null,
+  filter jsonb default '{}',
+  ef_search int default 40
+) RETURNS TABLE (
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+) LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+BEGIN
+  -- A selective filter (under 10000 matching rows, counted through the GIN index)
+  -- is ranked exactly; a broad one goes through HNSW with the filter applied
+  -- during the scan, over-fetching so enough matching rows survive.
+  IF filter IS NOT NULL AND filter <> '{}'::jsonb THEN
+    IF match_count IS NULL OR (
+      SELECT count(*) FROM (SELECT 1 FROM documents WHERE documents.metadata @> filter LIMIT 10000) matching
+    ) < 10000 THEN
+      RETURN QUERY
+      WITH candidates AS MATERIALIZED (
+        SELECT documents.id, documents.content, documents.metadata, documents.embedding
+        FROM documents
+        WHERE documents.metadata @> filter
+      )
+      SELECT
+        candidates.id,
+        candidates.content,
+        candidates.metadata,
+        1 - (candidates.embedding <=> query_embedding) AS similarity
+      FROM candidates
+      ORDER BY candidates.embedding <=> query_embedding
+      LIMIT match_count;
+      RETURN;
+    END IF;
+
+    PERFORM set_config('hnsw.ef_search', LEAST(1000, GREATEST(ef_search, match_count * 10))::text, true);
+    BEGIN
+      -- pgvector 0.8+ keeps scanning until match_count rows pass the filter
+      PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN OTHERS THEN
+      NULL; -- older pgvector: the larger ef_search is the over-fetch
+    END;
+    RETURN QUERY
+    WITH nearest AS MATERIALIZED (
+      SELECT
+        documents.id,
+        documents.content,
+        documents.metadata,
+        documents.embedding <=> query_embedding AS distance
+      FROM documents
+      WHERE documents.metadata @> filter
+      ORDER BY documents.embedding <=> query_embedding
+      LIMIT match_count
+    )
+    -- relaxed_order can return rows slightly out of order
+    SELECT nearest.id, nearest.content, nearest.metadata, 1 - nearest.distance AS similarity
+    FROM nearest
+    ORDER BY nearest.distance;
+    RETURN;
+  END IF;
+
+  IF match_count IS NULL OR match_count > 1000 THEN
+    -- "+ 0" keeps the planner off the HNSW index
+    RETURN QUERY
+    SELECT
+      id,
+      content,
+      metadata,
+      1 - (documents.embedding <=> query_embedding) AS similarity
+    FROM documents
+    ORDER BY (documents.embedding <=> query_embedding) + 0
+    LIMIT match_count;
+    RETURN;
+  END IF;
+
+  PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::text, true);
+  RETURN QUERY
+  SELECT
+    id,
+    content,
+    metadata,
+    1 - (documents.embedding <=> query_embedding) AS similarity
+  FROM documents
+  ORDER BY documents.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
+
+-- Several queries in one call (one result set, tagged with the 0-based query_index).
+-- Embeddings are passed in pgvector's text form, e.g. '[0.1,0.2,...]'.
+CREATE FUNCTION match_documents_many (
+  query_embeddings text[],
+  match_count int default 10,
+  filter jsonb default '{}',
+  ef_search int default 40
+) RETURNS TABLE (
+  query_index int,
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+) LANGUAGE sql AS $$
+  SELECT
+    (queries.ordinality - 1)::int AS query_index,
+    matches.id,
+    matches.content,
+    matches.metadata,
+    matches.similarity
+  FROM unnest(query_embeddings) WITH ORDINALITY AS queries(embedding, ordinality)
+  CROSS JOIN LATERAL match_documents(queries.embedding::vector(768), match_count, filter, ef_search) AS matches;
+$$;
@@ -0,0 +1,18 @@
+-- Scope content_hash to each chunk's source on a database that ran the
+-- earlier add_content_hash.sql, whose hash covered the text only. Identical
+-- text in two files then gets a row per file, each with its own source,
+-- upload_batch and chunk position. Run it once: it rehashes the stored hash.
+UPDATE documents
+SET content_hash = encode(sha256(convert_to(content_hash || coalesce(metadata->>'source', ''), 'UTF8')), 'hex')
+WHERE content_hash IS NOT NULL;
+
+-- The manifests list the same hashes, in chunk order
+UPDATE document_sources
+SET chunk_hashes = ARRAY(
+  SELECT encode(sha256(convert_to(hash || source, 'UTF8')), 'hex')
+  FROM unnest(chunk_hashes) WITH ORDINALITY AS listed(hash, position)
+  ORDER BY position
+);
+
+-- Rows are no longer shared between sources, so nothing checks manifests for overlaps
+DROP INDEX IF EXISTS document_sources_chunk_hashes_idx;
@@ -0,0 +1,17 @@
+-- Add update_chunk_metadata to an existing database. Uploads call it to move
+-- chunks that were already stored to their position in the file as ingested
+-- now (chunk_index, page), so neighbour expansion stays contiguous after a
+-- sync (see replica/utils/content_store.py). `updates` is a JSON array of
+-- {"content_hash": ..., "metadata": {...}} merged into each row's metadata;
+-- rows that already carry their patch are not written. Returns the rows changed.
+CREATE OR REPLACE FUNCTION update_chunk_metadata(updates jsonb)
+RETURNS SETOF documents
+LANGUAGE sql
+AS $$
+  UPDATE documents d
+  SET metadata = d.metadata || u.value->'metadata'
+  FROM jsonb_array_elements(updates) AS u
+  WHERE d.content_hash = u.value->>'content_hash'
+    AND NOT d.metadata @> u.value->'metadata'
+  RETURNING d.*;
+$$;
@@ -7,11 +7,11 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.agents import create_tool_calling_agent
 from langchain_core.prompts import PromptTemplate
-from langchain_community.vectorstores import SupabaseVectorStore
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain import hub
 
 from supabase.client import create_client
+from replica.utils.vector_search import TopKSupabaseVectorStore
 from langchain_core.tools import tool
 
 # load environment variables
@@ -30,7 +30,7 @@ embeddings = GoogleGenerativeAIEmbeddings(
 )
 
 # initiate vector store
-vector_store = SupabaseVectorStore(
+vector_store = TopKSupabaseVectorStore(
     embedding=embeddings,
     client=supabase,
     table_name="documents",
@@ -18,8 +18,6 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
 from langchain.agents import create_tool_calling_agent
 from langchain_core.prompts import PromptTemplate
-from langchain_community.vectorstores import SupabaseVectorStore
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.tools import tool
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -27,6 +25,15 @@ from langchain.chains import RetrievalQA
 
 # import supabase db
 from supabase.client import create_client
+from replica.utils.vector_search import TopKSupabaseVectorStore, PostProcessedRetriever
+from replica.utils.mmr import get_mmr_post_processor
+from replica.utils.vector_index import get_vector_index
+from replica.utils.reranker import get_rerank_post_processor
+from replica.utils.chunk_expansion import get_expansion_post_processor
+from replica.utils.context_packing import PackedRetriever, context_budget, context_route, pack_context
+from replica.utils.embedding_cache import get_cached_embeddings
+from replica.utils.content_store import ContentAddressedStore, get_document_embedding_cache
+from replica.utils.corpus_sync import clear_documents
 
 # load environment variables
 load_dotenv()
@@ -57,11 +64,8 @@ supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_SERVICE_KEY")
 supabase = create_client(supabase_url, supabase_key)
 
-# Initialize embeddings
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    google_api_key=os.environ.get("GEMINI_API_KEY"),
-)
+# Initialize embeddings (query vectors are cached across reruns)
+embeddings = get_cached_embeddings(os.environ.get("GEMINI_API_KEY"))
 
 # Voice agent functions
 def clean_text_for_speech(text):
@@ -231,10 +235,13 @@ def process_uploaded_files(uploaded_files):
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
         document_chunks = text_splitter.split_documents(documents)
         
+        # Positions count from 0 within each file, as in the replica's parse_files
+        positions = {}
         for i, chunk in enumerate(document_chunks):
             if "source" not in chunk.metadata:
                 chunk.metadata["source"] = f"unknown_source_{i}"
-            chunk.metadata["chunk_index"] = i
+            chunk.metadata["chunk_index"] = positions.get(chunk.metadata["source"], 0)
+            positions[chunk.metadata["source"]] = chunk.metadata["chunk_index"] + 1
         
         st.session_state.debug_info += f"Created {len(document_chunks)} chunks from {len(documents)} documents\n"
         st.session_state.debug_info += f"File details: {str(file_details)}\n"
@@ -245,27 +252,26 @@ def store_documents_in_supabase(docs, mode="append"):
         if mode == "replace":
             try:
                 st.session_state.debug_info += "Attempting to clear existing documents...\n"
-                supabase.table("documents").delete().execute()
+                clear_documents(supabase)
                 st.session_state.debug_info += "Successfully cleared existing documents\n"
             except Exception as e:
                 st.session_state.debug_info += f"Error clearing documents: {str(e)}\n"
         
+        # Chunks already stored for the same source are skipped; cached vectors are reused
+        store = ContentAddressedStore(supabase, embeddings.embed_documents, cache=get_document_embedding_cache())
         batch_size = 50
         for i in range(0, len(docs), batch_size):
             batch = docs[i:i+batch_size]
             st.session_state.debug_info += f"Processing batch {i//batch_size + 1}/{(len(docs)-1)//batch_size + 1} ({len(batch)} chunks)...\n"
             
-            vector_store = SupabaseVectorStore.from_documents(
-                batch,
-                embeddings,
-                client=supabase,
-                table_name="documents",
-                query_name="match_documents",
-            )
+            inserted = store.store(batch)
             
-            st.session_state.debug_info += f"Successfully stored batch {i//batch_size + 1}\n"
+            st.session_state.debug_info += f"Successfully stored batch {i//batch_size + 1}: {len(inserted)} new, {len(batch) - len(inserted)} already stored\n"
         
-        st.session_state.vector_store = SupabaseVectorStore(
+        # Chunks already stored move to their position in this upload, so neighbour expansion stays contiguous
+        store.update_positions(docs)
+        
+        st.session_state.vector_store = TopKSupabaseVectorStore(
             embedding=embeddings,
             client=supabase,
             table_name="documents",
@@ -283,7 +289,7 @@ def get_vector_store():
     if st.session_state.vector_store:
         return st.session_state.vector_store
     else:
-        vector_store = SupabaseVectorStore(
+        vector_store = TopKSupabaseVectorStore(
             embedding=embeddings,
             client=supabase,
             table_name="documents",
@@ -434,6 +440,10 @@ with tab4:
                     st.error(f"Embedding error: {str(e)}")
                     st.session_state.debug_info += f"Embedding test error: {str(e)}\n"
             
+            if st.button("Embedding Cache Stats"):
+                stats = embeddings.stats()
+                st.info(f"Query embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), {stats['size']} entries")
+            
             if st.button("Test Vector Search"):
                 try:
                     st.info("Testing vector search functionality...")
@@ -505,13 +515,27 @@ Question: {question}
 
 Detailed and Comprehensive Answer:"""
 
+def retrieval_post_processors(vs):
+    # Overlapping chunks often come back as near-duplicates; MMR trades a few of them for coverage,
+    # then the reranker keeps the handful that go to the LLM, widened with their neighbouring chunks
+    processors = (
+        get_mmr_post_processor(vector_index=get_vector_index(supabase)),
+        get_rerank_post_processor(),
+        get_expansion_post_processor(supabase_client=supabase),
+    )
+    return [processor for processor in processors if processor is not None]
+
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 4))
+
 @tool(response_format="content_and_artifact")
 def retrieve_documents(query: str):
     """ALWAYS use this tool to retrieve information from documents before answering any question."""
     st.session_state.debug_info += f"Retrieving documents for query: {query}\n"
     try:
-        retriever = get_vector_store().as_retriever(search_kwargs={"k": 15})
-        retrieved_docs = retriever.get_relevant_documents(query)
+        vs = get_vector_store()
+        retriever = PostProcessedRetriever(vector_store=vs, k=RETRIEVAL_TOP_K, post_processors=retrieval_post_processors(vs))
+        # Best passages first, overlap stripped, cut at the route's token budget
+        retrieved_docs = pack_context(retriever.search(query), context_budget("agent"))
         
         if not retrieved_docs:
             st.session_state.debug_info += "No documents retrieved!\n"
@@ -546,7 +570,10 @@ def retrieve_documents(query: str):
         st.session_state.debug_info += f"{error_msg}\n"
         return error_msg, []
 
-retriever = vector_store.as_retriever(search_kwargs={"k": 8})
+retriever = PackedRetriever(
+    retriever=PostProcessedRetriever(vector_store=vector_store, k=RETRIEVAL_TOP_K, post_processors=retrieval_post_processors(vector_store)),
+    route="direct_qa",
+)
 direct_qa = RetrievalQA.from_chain_type(
     llm=llm,
     chain_type="stuff",
@@ -617,7 +644,7 @@ with tab1:
                 elif command_type == "clear":
                     speak("Clearing all documents from the database.")
                     try:
-                        supabase.table("documents").delete().execute()
+                        clear_documents(supabase)
                         st.session_state.vector_store = None
                         st.session_state.docs_processed = False
                         st.success("All documents cleared from the database.")
@@ -653,15 +680,17 @@ with tab1:
                                     chat_history.append(("ai", message.content))
                             
                             try:
-                                result = agent_executor.invoke({
-                                    "input": user_input,
-                                    "chat_history": chat_history
-                                })
+                                with context_route("voice"):
+                                    result = agent_executor.invoke({
+                                        "input": user_input,
+                                        "chat_history": chat_history
+                                    })
                                 ai_message = result["output"]
                                 st.session_state.debug_info += "Agent generated answer\n"
                             except Exception as agent_error:
                                 st.session_state.debug_info += f"Agent error: {str(agent_error)}. Falling back to direct retrieval.\n"
-                                result = direct_qa.invoke({"question": user_input})
+                                with context_route("voice"):
+                                    result = direct_qa.invoke({"question": user_input})
                                 ai_message = result["result"]
                                 st.session_state.debug_info += "Direct retrieval generated answer\n"
                             
@@ -824,7 +853,7 @@ with tab2:
                 elif command_type == "clear":
                     speak("Clearing all documents from the database.")
                     try:
-                        supabase.table("documents").delete().execute()
+                        clear_documents(supabase)
                         st.session_state.vector_store = None
                         st.session_state.docs_processed = False
                         st.success("All documents cleared from the database.")
@@ -862,15 +891,17 @@ with tab2:
                                     chat_history.append(("ai", message["content"]))
                             
                             try:
-                                result = agent_executor.invoke({
-                                    "input": user_input,
-                                    "chat_history": chat_history
-                                })
+                                with context_route("voice"):
+                                    result = agent_executor.invoke({
+                                        "input": user_input,
+                                        "chat_history": chat_history
+                                    })
                                 ai_message = result["output"]
                                 st.session_state.debug_info += "Agent generated answer\n"
                             except Exception as agent_error:
                                 st.session_state.debug_info += f"Agent error: {str(agent_error)}. Falling back to direct retrieval.\n"
-                                result = direct_qa.invoke({"question": user_input})
+                                with context_route("voice"):
+                                    result = direct_qa.invoke({"question": user_input})
                                 ai_message = result["result"]
                                 st.session_state.debug_info += "Direct retrieval generated answer\n"
                             
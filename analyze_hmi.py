@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from supabase.client import create_client
+from replica.utils.table_scan import scan_table
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 # Load environment variables
@@ -15,8 +16,7 @@ print("🔍 Analyzing your HMI Poster content...")
 
 try:
     # Get all HMI document chunks
-    response = supabase.table("documents").select("*").eq("metadata->>source", "HMI Poster.pdf").execute()
-    hmi_docs = response.data
+    hmi_docs = list(scan_table(supabase, "id, content", filters={"metadata->>source": "HMI Poster.pdf"}))
     
     print(f"Found {len(hmi_docs)} chunks from HMI Poster.pdf")
     print("\n" + "="*80)
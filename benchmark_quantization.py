@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from replica.utils.embedding_segment import EmbeddingSegment, write_segment
+from replica.utils.quantization import quantize_segment, CODES_FILE
+
+def synthetic_segment(path, count=100000, dim=768, seed=0):
+    """Write a segment of clustered random vectors when no real segment is given."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(256, dim)).astype(np.float32)
+    def rows():
+        for i in range(count):
+            vector = centers[i % len(centers)] + 0.5 * rng.normal(size=dim).astype(np.float32)
+            yield {"id": f"synthetic-{i}", "content": "", "metadata": {}, "embedding": vector.tolist()}
+    write_segment(path, rows())
+
+def sample_queries(segment, n_queries, noise=0.3, seed=1):
+    """Perturbed corpus vectors stand in for real query embeddings."""
+    rng = np.random.default_rng(seed)
+    picks = np.sort(rng.choice(len(segment), size=min(n_queries, len(segment)), replace=False))
+    queries = np.asarray(segment.vectors[picks], dtype=np.float32)
+    queries = queries + noise * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(segment.dim)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def timed_search(segment, queries, k):
+    start = time.perf_counter()
+    results = segment.search_batch(queries, k)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return [{pos for _, pos in result} for result in results], elapsed_ms
+
+def run_benchmark(path, k=8, n_queries=200, rescore_ks=(8, 50, 100, 200, 400)):
+    if not os.path.exists(os.path.join(path, CODES_FILE)):
+        print("🗜️ Quantizing segment...")
+        quantize_segment(path)
+
+    exact = EmbeddingSegment(path, quantized=False)
+    queries = sample_queries(exact, n_queries)
+    truth, exact_ms = timed_search(exact, queries, k)
+
+    vector_bytes = exact.vectors.nbytes
+    code_bytes = len(exact) * exact.dim
+    print(f"\n📊 {len(exact)} vectors x {exact.dim} dims, {len(queries)} queries, recall@{k}")
+    print(f"Exact ({exact.dtype.name}): {vector_bytes / 2**20:.1f} MiB, {exact_ms:.2f} ms/query")
+    print(f"8-bit codes: {code_bytes / 2**20:.1f} MiB resident for the scan ({vector_bytes / code_bytes:.0f}x smaller)")
+
+    for rescore_k in rescore_ks:
+        quantized = EmbeddingSegment(path, rescore_k=rescore_k)
+        found, quantized_ms = timed_search(quantized, queries, k)
+        recall = np.mean([len(t & f) / len(t) for t, f in zip(truth, found) if t])
+        print(f"  rescore top {rescore_k:>4}: recall@{k} = {recall:.3f}, {quantized_ms:.2f} ms/query")
+
+if __name__ == "__main__":
+    # Usage: python benchmark_quantization.py [segment_path] [k]
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    if len(sys.argv) > 1:
+        run_benchmark(sys.argv[1], k=k)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "segment")
+            print("No segment given, generating a synthetic one...")
+            synthetic_segment(path, count=20000)
+            run_benchmark(path, k=k)
@@ -0,0 +1,36 @@
+import os
+import sys
+from dotenv import load_dotenv
+from supabase.client import create_client
+from replica.utils.change_log import latest_change
+from replica.utils.embedding_segment import write_segment
+from replica.utils.quantization import quantize_segment
+from replica.utils.table_scan import scan_table
+
+# Load environment variables
+load_dotenv()
+
+# Get supabase credentials
+supabase_url = os.environ.get("SUPABASE_URL")
+supabase_key = os.environ.get("SUPABASE_SERVICE_KEY")
+
+def build_segment(path, dtype, quantize=False):
+    supabase = create_client(supabase_url, supabase_key)
+    # Read before the scan: changes logged from here on are applied when the segment is opened
+    change_seq = latest_change(supabase)
+    print(f"📦 Writing {dtype} embedding segment to {path}...")
+    count = write_segment(path, scan_table(supabase, "id, content, metadata, embedding"), dtype=dtype, change_seq=change_seq)
+    print(f"✅ Wrote {count} vectors")
+    if quantize and count:
+        print("🗜️ Adding 8-bit codes for quantized search...")
+        quantize_segment(path)
+        print("✅ Quantized codes written")
+    return count
+
+if __name__ == "__main__":
+    # Usage: python build_embedding_segment.py [path] [float32|float16] [int8]
+    path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("VECTOR_SEGMENT_PATH", "embedding_segment")
+    dtype = sys.argv[2] if len(sys.argv) > 2 else "float32"
+    quantize = len(sys.argv) > 3 and sys.argv[3] == "int8"
+    build_segment(path, dtype, quantize=quantize)
+    print(f"Set VECTOR_SEGMENT_PATH={path} and LOCAL_VECTOR_INDEX=1 to serve retrieval from it.")
@@ -1,6 +1,8 @@
 import os
+from collections import deque
 from dotenv import load_dotenv
 from supabase.client import create_client
+from replica.utils.table_scan import scan_table
 
 # Load environment variables
 load_dotenv()
@@ -13,26 +15,27 @@ supabase = create_client(supabase_url, supabase_key)
 print("📊 Checking current documents in database...")
 
 try:
-    # Get all documents
-    response = supabase.table("documents").select("*").execute()
-    total_docs = len(response.data)
+    # Stream every document, keeping only per-source counts and the last 3 rows
+    total_docs = 0
+    sources = {}
+    recent_docs = deque(maxlen=3)
+    for doc in scan_table(supabase, "id, content, metadata"):
+        total_docs += 1
+        source = doc["metadata"].get("source", "unknown")
+        if source in sources:
+            sources[source] += 1
+        else:
+            sources[source] = 1
+        recent_docs.append(doc)
     print(f"Total documents in database: {total_docs}")
     
     if total_docs > 0:
         print("\nDocument sources:")
-        sources = {}
-        for doc in response.data:
-            source = doc["metadata"].get("source", "unknown")
-            if source in sources:
-                sources[source] += 1
-            else:
-                sources[source] = 1
-        
         for source, count in sources.items():
             print(f"  - {source}: {count} chunks")
             
         print("\nSample content from recent documents:")
-        for i, doc in enumerate(response.data[-3:]):  # Show last 3 documents
+        for i, doc in enumerate(recent_docs):  # Show last 3 documents
             content_preview = doc["content"][:150] + "..." if len(doc["content"]) > 150 else doc["content"]
             source = doc["metadata"].get("source", "unknown")
             print(f"{i+1}. Source: {source}")
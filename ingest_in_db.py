@@ -1,20 +1,21 @@
 # import basics
 import os
+import sys
+from glob import glob
 from dotenv import load_dotenv
 
-# import langchain
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import SupabaseVectorStore
 # Use Gemini embeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 # import supabase
 from supabase.client import create_client
 
+# import the replica's ingestion pipeline (parse, embed and insert in one stream)
+from replica.utils.ingest_pipeline import IngestPipeline
+from replica.utils.ingest_checkpoint import IngestCheckpoint, checkpoint_path as default_checkpoint_path, discard_checkpoint
+
 # load environment variables
-load_dotenv()  
+load_dotenv()
 
 # initiate supabase db
 supabase_url = os.environ.get("SUPABASE_URL")
@@ -27,20 +28,32 @@ embeddings = GoogleGenerativeAIEmbeddings(
     google_api_key=os.environ.get("GEMINI_API_KEY"),
 )
 
-# load pdf docs from folder 'documents'
-loader = PyPDFDirectoryLoader("documents")
-
-# split the documents in multiple chunks
-documents = loader.load()
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-docs = text_splitter.split_documents(documents)
-
-# store chunks in vector store
-vector_store = SupabaseVectorStore.from_documents(
-    docs,
-    embeddings,
-    client=supabase,
-    table_name="documents",
-    query_name="match_documents",
-    chunk_size=1000,
-)
\ No newline at end of file
+# pdf docs from folder 'documents'; the relative path is each chunk's source, as PyPDFDirectoryLoader set it
+named_paths = [(path, path) for path in sorted(glob(os.path.join("documents", "*.pdf")))]
+
+# progress is written here as it happens, so an interrupted run picks up where it stopped
+checkpoint_path = default_checkpoint_path()
+
+if __name__ == "__main__":
+    # "append" (default) adds the chunks not stored yet; "sync" skips files unchanged
+    # since the last run and replaces only the changed chunks of the others; "replace"
+    # clears the table first (rerunning it after a failure resumes instead)
+    mode = sys.argv[1] if len(sys.argv) > 1 else "append"
+
+    # store chunks in vector store
+    checkpoint = IngestCheckpoint(checkpoint_path)
+    try:
+        # chunk_overlap as this script has always split
+        result = IngestPipeline(supabase, embeddings, chunk_overlap=100).run(named_paths, mode=mode, checkpoint=checkpoint)
+    except Exception as e:
+        print(f"Ingestion stopped: {str(e)}", file=sys.stderr)
+        print(f"Progress is saved in {checkpoint_path}; run the script again to resume.", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        checkpoint.close()
+    if not result["errors"]:
+        discard_checkpoint(checkpoint_path)
+    print(f"{result['chunks']} chunks stored, {result['skipped']} already stored, {result['deleted']} stale deleted, "
+          f"{len(result['unchanged'])} files unchanged")
+    for name, message in result["errors"]:
+        print(f"Error processing {name}: {message}", file=sys.stderr)
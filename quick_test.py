@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from supabase.client import create_client
+from replica.utils.table_scan import scan_table
 
 # Load environment variables
 load_dotenv()
@@ -16,13 +17,13 @@ def quick_hmi_test():
         supabase = create_client(supabase_url, supabase_key)
         
         # Get HMI document
-        response = supabase.table("documents").select("content").eq("metadata->>source", "HMI Poster.pdf").execute()
+        hmi_docs = list(scan_table(supabase, "id, content", filters={"metadata->>source": "HMI Poster.pdf"}))
         
-        if response.data:
-            print(f"✅ Found {len(response.data)} HMI document chunks")
+        if hmi_docs:
+            print(f"✅ Found {len(hmi_docs)} HMI document chunks")
             
             # Combine all content
-            full_content = " ".join([doc["content"] for doc in response.data])
+            full_content = " ".join([doc["content"] for doc in hmi_docs])
             
             # Answer key questions directly from content
             questions_and_answers = [
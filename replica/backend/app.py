@@ -18,7 +18,12 @@ if parent_dir not in sys.path: # Ensure parent_dir is also in path for .env load
 
 
 from agent_utils import initialize_agent_and_qa
-from document_utils import process_files_from_paths, store_documents_in_supabase
+from document_utils import ingest_files
+from corpus_sync import clear_documents, get_corpus_version
+from embedding_cache import get_cached_embeddings
+from retrieval_cache import get_retrieval_cache
+from answer_cache import get_answer_cache
+from metadata_filter import FILTER_KEYS, build_filter, scoped_filter
 
 # Load environment variables from .env in the parent directory
 dotenv_path = os.path.join(parent_dir, '.env')
@@ -77,6 +82,9 @@ def chat_handler():
 
     if not user_input:
         return jsonify({'error': 'No user_input provided'}), 400
+
+    # ?source=...&file_type=...&upload_batch=...&tenant=... scopes retrieval to matching chunks
+    metadata_filter = build_filter(**{key: request.args.get(key) for key in FILTER_KEYS})
     
     if not agent_executor or not direct_qa:
         app.logger.error("Chat attempt when agent/QA not initialized.")
@@ -95,19 +103,38 @@ def chat_handler():
             chat_history_langchain.append(("ai", content))
         # else: # ignore other roles or handle as needed
 
+    # Follow-ups depend on the conversation and scoped questions on the filter,
+    # so only standalone, unfiltered questions use the answer cache
+    use_answer_cache = not chat_history_langchain and not metadata_filter
+    answer_cache = get_answer_cache(get_cached_embeddings(os.environ.get("GEMINI_API_KEY")))
+    cache_info = {'hit': False, 'skipped': 'filter' if metadata_filter else 'chat_history'}
+    if use_answer_cache:
+        try:
+            cached_answer, cache_info = answer_cache.lookup(user_input)
+            if cached_answer is not None:
+                app.logger.info(f"Answer cache hit (similarity {cache_info['similarity']:.3f}) for: '{user_input}'")
+                return jsonify({'ai_message': cached_answer, 'cache': cache_info})
+        except Exception as cache_error:
+            app.logger.warning(f"Answer cache lookup failed: {cache_error}")
+            cache_info = {'hit': False, 'error': str(cache_error)}
+    corpus_version = get_corpus_version()
+
     ai_message = "An unexpected error occurred."
+    answered = False
     # debug_log_for_request = [] # For request-specific debug info if needed beyond server logs
 
     try:
-        app.logger.info(f"Invoking agent with input: '{user_input}' and history: {chat_history_langchain}")
+        app.logger.info(f"Invoking agent with input: '{user_input}', filter: {metadata_filter} and history: {chat_history_langchain}")
         # debug_log_for_request.append(f"Invoking agent with input: {user_input}")
         
         # The agent_utils.retrieve_documents tool now uses print() for logging, which will go to server logs.
-        result = agent_executor.invoke({
-            "input": user_input,
-            "chat_history": chat_history_langchain
-        })
+        with scoped_filter(metadata_filter):
+            result = agent_executor.invoke({
+                "input": user_input,
+                "chat_history": chat_history_langchain
+            })
         ai_message = result.get("output", "Error: No output from agent.")
+        answered = "output" in result
         # debug_log_for_request.append(f"Agent raw output: {ai_message}")
         app.logger.info(f"Agent generated answer: {ai_message}")
 
@@ -117,8 +144,10 @@ def chat_handler():
         try:
             app.logger.info(f"Invoking direct QA with question: {user_input}")
             # debug_log_for_request.append(f"Invoking direct QA with question: {user_input}")
-            result = direct_qa.invoke({"question": user_input}) # Ensure direct_qa expects this format
+            with scoped_filter(metadata_filter):
+                result = direct_qa.invoke({"question": user_input}) # Ensure direct_qa expects this format
             ai_message = result.get("result", "Error: No result from direct QA.")
+            answered = "result" in result
             # debug_log_for_request.append(f"Direct QA raw output: {ai_message}")
             app.logger.info(f"Direct retrieval generated answer: {ai_message}")
         except Exception as qa_error:
@@ -126,7 +155,21 @@ def chat_handler():
             # debug_log_for_request.append(f"Direct QA error: {str(qa_error)}")
             ai_message = "I encountered an error with both the agent and direct retrieval. Please try again or check server logs."
     
-    return jsonify({'ai_message': ai_message}) # Removed debug_log from response, rely on server logs
+    if answered and use_answer_cache:
+        try:
+            answer_cache.store(user_input, ai_message, version=corpus_version)
+        except Exception as cache_error:
+            app.logger.warning(f"Answer cache store failed: {cache_error}")
+
+    return jsonify({'ai_message': ai_message, 'cache': cache_info}) # Removed debug_log from response, rely on server logs
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats_handler():
+    return jsonify({
+        'query_embeddings': get_cached_embeddings(os.environ.get("GEMINI_API_KEY")).stats(),
+        'retrieval_results': get_retrieval_cache().stats(),
+        'answers': get_answer_cache(get_cached_embeddings(os.environ.get("GEMINI_API_KEY"))).stats(),
+    })
 
 @app.route('/api/documents/count', methods=['GET'])
 def get_document_count():
@@ -155,6 +198,15 @@ def upload_documents_handler():
     if 'files' not in request.files:
         return jsonify({"error": "No files part in the request"}), 400
     
+    # "append" adds every new chunk; "sync" replaces only what changed in files uploaded before
+    mode = request.form.get('mode') or request.args.get('mode', 'append')
+    if mode not in ("append", "sync"):
+        return jsonify({"error": f"Unsupported mode: {mode}. Use 'append' or 'sync'."}), 400
+
+    # Optional comma-separated CSV columns to embed, e.g. columns=title,description
+    columns = request.form.get('columns') or request.args.get('columns')
+    columns = [column.strip() for column in columns.split(",") if column.strip()] if columns else None
+
     uploaded_files = request.files.getlist('files')
     if not uploaded_files or all(f.filename == '' for f in uploaded_files):
         return jsonify({"error": "No selected files"}), 400
@@ -177,12 +229,17 @@ def upload_documents_handler():
                 return jsonify({"error": "No files were successfully saved for processing."}), 400
 
             app.logger.info(f"Processing files: {processed_file_paths}")
-            document_chunks, file_details = process_files_from_paths(processed_file_paths) # This function is from your utils
+            # Parsing, embedding and inserting run as one bounded stream
+            named_paths = [(file_path, os.path.basename(file_path)) for file_path in processed_file_paths]
+            result = ingest_files(named_paths, mode=mode, columns=columns)
+            for name, message in result["errors"]:
+                app.logger.warning(f"Skipped {name}: {message}")
 
-            if document_chunks:
-                app.logger.info(f"Storing {len(document_chunks)} chunks in Supabase.")
-                # The mode can be "append" or "replace"
-                store_documents_in_supabase(document_chunks, mode="append") # This function is from your utils
+            if result["chunks"] or result["skipped"] or result["deleted"] or result["unchanged"]:
+                app.logger.info(f"Stored {result['chunks']} chunks in Supabase ({result['skipped']} already stored, "
+                                f"{result['deleted']} stale deleted, {len(result['unchanged'])} files unchanged).")
+                file_details = result["file_details"]
+                upload_batch = result["upload_batch"]
                 
                 # Re-initialize agent after new documents are added.
                 app.logger.info("Re-initializing agent and QA chain after document upload...")
@@ -193,8 +250,12 @@ def upload_documents_handler():
                     app.logger.error("Failed to re-initialize agent or QA chain after upload.")
 
                 return jsonify({
-                    "message": f"Successfully processed and stored {len(document_chunks)} chunks from {len(file_details)} files.", 
-                    "details": file_details
+                    "message": f"Successfully processed and stored {result['chunks']} chunks from {len(file_details)} files ({result['skipped']} unchanged chunks skipped).", 
+                    "details": file_details,
+                    "upload_batch": upload_batch,
+                    "skipped": result["skipped"],
+                    "deleted": result["deleted"],
+                    "unchanged": result["unchanged"]
                 }), 200
             else:
                 app.logger.warning("No document chunks to store after processing uploaded files.")
@@ -211,12 +272,8 @@ def clear_documents_handler():
     if not supabase:
         return jsonify({"error": "Supabase client not initialized. Cannot clear documents."}), 500
     try:
-        # Ensure the table name is correct, e.g., "documents"
-        # Delete all rows from the "documents" table.
-        # Use a nil UUID for the .neq filter, as the 'id' column is likely of UUID type.
-        # This effectively matches all rows if no row has this nil UUID as its id.
-        nil_uuid = "00000000-0000-0000-0000-000000000000"
-        response = supabase.table("documents").delete().neq("id", nil_uuid).execute()
+        # Deletes every row, and the source manifest, ingest checkpoint and local indexes with them
+        response = clear_documents(supabase)
         
         app.logger.info(f"Documents cleared from Supabase. Response: {response.data if hasattr(response, 'data') else 'No data in response'}")
         
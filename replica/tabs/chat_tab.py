@@ -1,7 +1,10 @@
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage
 from utils.agent_utils import initialize_agent_and_qa
-from utils.document_utils import get_vector_store
+from utils.document_utils import get_vector_store, get_env_var
+from utils.embedding_cache import get_cached_embeddings
+from utils.answer_cache import get_answer_cache
+from utils.corpus_sync import get_corpus_version
 
 def chat_tab(supabase):
     # Initialize vector store and agent
@@ -64,18 +67,36 @@ def process_query(user_input, agent_executor, direct_qa, supabase, count):
                 elif isinstance(message, AIMessage):
                     chat_history.append(("ai", message.content))
             
-            try:
-                result = agent_executor.invoke({
-                    "input": user_input,
-                    "chat_history": chat_history
-                })
-                ai_message = result["output"]
-                st.session_state.debug_info += "Agent generated answer\n"
-            except Exception as agent_error:
-                st.session_state.debug_info += f"Agent error: {str(agent_error)}. Falling back to direct retrieval.\n"
-                result = direct_qa.invoke({"question": user_input})
-                ai_message = result["result"]
-                st.session_state.debug_info += "Direct retrieval generated answer\n"
+            # Follow-ups depend on the conversation, so only standalone questions use the answer cache
+            answer_cache = get_answer_cache(get_cached_embeddings(get_env_var("GEMINI_API_KEY")))
+            ai_message = None
+            if not chat_history:
+                try:
+                    ai_message, cache_info = answer_cache.lookup(user_input)
+                    st.session_state.debug_info += f"Answer cache {'hit' if cache_info['hit'] else 'miss'} (similarity {cache_info['similarity']:.3f})\n"
+                except Exception as cache_error:
+                    st.session_state.debug_info += f"Answer cache lookup failed: {str(cache_error)}\n"
+            corpus_version = get_corpus_version()
+            
+            if ai_message is None:
+                try:
+                    result = agent_executor.invoke({
+                        "input": user_input,
+                        "chat_history": chat_history
+                    })
+                    ai_message = result["output"]
+                    st.session_state.debug_info += "Agent generated answer\n"
+                except Exception as agent_error:
+                    st.session_state.debug_info += f"Agent error: {str(agent_error)}. Falling back to direct retrieval.\n"
+                    result = direct_qa.invoke({"question": user_input})
+                    ai_message = result["result"]
+                    st.session_state.debug_info += "Direct retrieval generated answer\n"
+                
+                if not chat_history:
+                    try:
+                        answer_cache.store(user_input, ai_message, version=corpus_version)
+                    except Exception as cache_error:
+                        st.session_state.debug_info += f"Answer cache store failed: {str(cache_error)}\n"
             
             if "I don't have" not in ai_message and count < 3:
                 st.warning("⚠️ Warning: The assistant might be using information outside of your documents. Consider uploading more relevant documents.")
@@ -1,5 +1,8 @@
 import streamlit as st
 from utils.document_utils import get_vector_store
+from utils.embedding_cache import get_cached_embeddings
+from utils.retrieval_cache import get_retrieval_cache
+from utils.answer_cache import get_answer_cache
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 import os
 
@@ -83,6 +86,14 @@ def debug_info_tab(supabase):
                     st.error(f"Embedding error: {str(e)}")
                     st.session_state.debug_info += f"Embedding test error: {str(e)}\n"
             
+            if st.button("Cache Stats"):
+                stats = get_cached_embeddings(os.environ.get("GEMINI_API_KEY")).stats()
+                st.info(f"Query embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), {stats['size']} entries")
+                stats = get_retrieval_cache().stats()
+                st.info(f"Retrieval result cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), {stats['size']} entries at corpus version {stats['corpus_version']}")
+                stats = get_answer_cache(get_cached_embeddings(os.environ.get("GEMINI_API_KEY"))).stats()
+                st.info(f"Semantic answer cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), {stats['size']} entries")
+            
             if st.button("Test Vector Search"):
                 try:
                     st.info("Testing vector search functionality...")
@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.document_utils import process_uploaded_files, store_documents_in_supabase
+from utils.document_utils import ingest_uploaded_files
 
 def upload_documents_tab(supabase):
     st.header("Upload Documents")
@@ -7,9 +7,9 @@ def upload_documents_tab(supabase):
     
     doc_mode = st.radio(
         "Choose how to handle documents:",
-        ["Append to existing documents", "Replace all existing documents"],
+        ["Append to existing documents", "Update changed files only", "Replace all existing documents"],
         index=0,
-        help="Append will add documents to the existing knowledge base. Replace will clear all existing documents first."
+        help="Append will add documents to the existing knowledge base. Update skips files that haven't changed since they were last uploaded and replaces only the changed parts of the others. Replace will clear all existing documents first."
     )
     
     uploaded_files = st.file_uploader(
@@ -18,32 +18,41 @@ def upload_documents_tab(supabase):
         type=["pdf", "txt", "csv"]
     )
     
+    csv_columns = st.text_input(
+        "CSV columns to embed (optional)",
+        help="Comma-separated column names. Rows are grouped into chunks that repeat the header; leave empty to keep every column."
+    )
+    
     col1, col2 = st.columns([1, 1])
     with col1:
         if st.button("Process Documents"):
             if uploaded_files:
                 with st.spinner("Processing documents..."):
                     st.session_state.debug_info = "Starting document processing...\n"
-                    mode = "replace" if "Replace" in doc_mode else "append"
+                    mode = "replace" if "Replace" in doc_mode else "sync" if "Update" in doc_mode else "append"
                     st.session_state.debug_info += f"Using document mode: {mode}\n"
                     
-                    docs, file_details = process_uploaded_files(uploaded_files)
-                    if docs:
-                        progress_bar = st.progress(0)
-                        progress_text = st.empty()
-                        progress_text.text("Storing documents in database...")
-                        
-                        vector_store = store_documents_in_supabase(docs, mode=mode)
-                        progress_bar.progress(100)
-                        progress_text.text("Document processing complete!")
-                        
-                        if vector_store:
-                            st.session_state.docs_processed = True
-                            st.success(f"Successfully processed {len(docs)} document chunks from {len(file_details)} files!")
-                            for i, file_info in enumerate(file_details):
-                                st.info(f"File {i+1}: {file_info['name']} - {file_info['chunks']} chunks")
+                    # Parsing, embedding and inserting overlap, so large uploads start storing right away
+                    columns = [column.strip() for column in csv_columns.split(",") if column.strip()] or None
+                    result = ingest_uploaded_files(uploaded_files, mode=mode, columns=columns)
+                    for name, message in result["errors"]:
+                        if message.startswith("Unsupported file format"):
+                            st.warning(message)
                         else:
-                            st.error("Failed to store documents in the database.")
+                            st.error(f"Error processing {name}: {message}")
+                        st.session_state.debug_info += f"Error with {name}: {message}\n"
+                    
+                    file_details = result["file_details"]
+                    if result["unchanged"]:
+                        st.info(f"Unchanged since the last upload: {', '.join(result['unchanged'])}")
+                    if result["deleted"]:
+                        st.info(f"Removed {result['deleted']} chunks that are no longer in the updated files.")
+                    if result["chunks"] or result["skipped"] or result["deleted"] or result["unchanged"]:
+                        st.session_state.docs_processed = True
+                        st.session_state.debug_info += f"File details: {str(file_details)}\n"
+                        st.success(f"Successfully processed {result['chunks']} document chunks from {len(file_details)} files! ({result['skipped']} unchanged chunks were already stored)")
+                        for i, file_info in enumerate(file_details):
+                            st.info(f"File {i+1}: {file_info['name']} - {file_info['chunks']} chunks")
                     else:
                         st.warning("No documents were processed. Please upload valid files.")
             else:
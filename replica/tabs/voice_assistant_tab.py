@@ -2,6 +2,8 @@ import streamlit as st
 from utils.voice_utils import recognize_speech, speak, process_response_for_speech, process_voice_command
 from utils.agent_utils import initialize_agent_and_qa
 from utils.document_utils import get_vector_store
+from utils.context_packing import context_route
+from utils.corpus_sync import clear_documents
 
 def voice_assistant_tab(supabase):
     st.header("Voice Assistant")
@@ -44,7 +46,7 @@ def voice_assistant_tab(supabase):
                 elif command_type == "clear":
                     speak("Clearing all documents from the database.")
                     try:
-                        supabase.table("documents").delete().execute()
+                        clear_documents(supabase)
                         st.session_state.vector_store = None
                         st.session_state.docs_processed = False
                         st.success("All documents cleared from the database.")
@@ -81,16 +83,19 @@ def voice_assistant_tab(supabase):
                                 elif message["role"] == "assistant":
                                     chat_history.append(("ai", message["content"]))
                             
+                            # Spoken answers need far less context than the text chat
                             try:
-                                result = agent_executor.invoke({
-                                    "input": user_input,
-                                    "chat_history": chat_history
-                                })
+                                with context_route("voice"):
+                                    result = agent_executor.invoke({
+                                        "input": user_input,
+                                        "chat_history": chat_history
+                                    })
                                 ai_message = result["output"]
                                 st.session_state.debug_info += "Agent generated answer\n"
                             except Exception as agent_error:
                                 st.session_state.debug_info += f"Agent error: {str(agent_error)}. Falling back to direct retrieval.\n"
-                                result = direct_qa.invoke({"question": user_input})
+                                with context_route("voice"):
+                                    result = direct_qa.invoke({"question": user_input})
                                 ai_message = result["result"]
                                 st.session_state.debug_info += "Direct retrieval generated answer\n"
                             
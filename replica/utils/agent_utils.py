@@ -1,14 +1,41 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain_core.tools import tool
 from langchain_core.prompts import PromptTemplate
-from langchain_community.vectorstores import SupabaseVectorStore
 from langchain.chains import RetrievalQA
 import sys
+from typing import List, Optional
 import streamlit as st
 
+try:
+    from .lexical_index import get_lexical_index
+    from .vector_search import TopKSupabaseVectorStore
+    from .hybrid_retriever import HybridRetriever, doc_key
+    from .vector_index import get_vector_index
+    from .embedding_cache import get_cached_embeddings
+    from .retrieval_cache import get_retrieval_cache
+    from .corpus_sync import watch_shared_corpus_version
+    from .metadata_filter import build_filter
+    from .mmr import get_mmr_post_processor
+    from .reranker import get_rerank_post_processor
+    from .chunk_expansion import get_expansion_post_processor
+    from .context_packing import PackedRetriever, context_budget, pack_context
+except ImportError:
+    from lexical_index import get_lexical_index
+    from vector_search import TopKSupabaseVectorStore
+    from hybrid_retriever import HybridRetriever, doc_key
+    from vector_index import get_vector_index
+    from embedding_cache import get_cached_embeddings
+    from retrieval_cache import get_retrieval_cache
+    from corpus_sync import watch_shared_corpus_version
+    from metadata_filter import build_filter
+    from mmr import get_mmr_post_processor
+    from reranker import get_rerank_post_processor
+    from chunk_expansion import get_expansion_post_processor
+    from context_packing import PackedRetriever, context_budget, pack_context
+
 # Function to get environment variable or Streamlit secret
 def get_env_var(key):
     # First try environment variables
@@ -30,7 +57,7 @@ def get_cached_vector_store(supabase_client, embeddings_instance):
     global _vector_store_cache
     if _vector_store_cache is None:
         print("Initializing vector store for agent_utils...")
-        _vector_store_cache = SupabaseVectorStore(
+        _vector_store_cache = TopKSupabaseVectorStore(
             client=supabase_client,
             embedding=embeddings_instance,
             table_name="documents",
@@ -49,16 +76,39 @@ def initialize_agent_and_qa(supabase_client):
         max_output_tokens=4096,
         top_p=0.95,
     )
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/embedding-001",
-        google_api_key=get_env_var("GEMINI_API_KEY"),
-    )
+    embeddings = get_cached_embeddings(get_env_var("GEMINI_API_KEY"))
 
     vector_store = get_cached_vector_store(supabase_client, embeddings)
     if vector_store is None:
         print("Failed to initialize vector store for agent.", file=sys.stderr)
         return None, None, [] # Ensure three values are always returned
 
+    # Cached retrievals and answers must also expire when another process writes documents
+    watch_shared_corpus_version(supabase_client)
+
+    # Build the BM25 index once per process so the first question doesn't pay for it
+    lexical_index = get_lexical_index(supabase_client)
+
+    vector_index = get_vector_index(supabase_client)
+    # Neighbouring chunks overlap, so drop near-duplicates before they reach the prompt
+    mmr = get_mmr_post_processor(vector_index=vector_index)
+    # Over-fetch cheaply, then let the reranker pick the few chunks that go to the LLM
+    rerank = get_rerank_post_processor()
+    # Small chunks retrieve precisely; widen the survivors so the LLM sees their surroundings
+    expand = get_expansion_post_processor(lexical_index=lexical_index, supabase_client=supabase_client)
+
+    # One retriever for both the agent tool and the direct QA fallback
+    retriever = HybridRetriever(
+        lexical_index=lexical_index,
+        vector_store=vector_store,
+        vector_index=vector_index,
+        cache=get_retrieval_cache(),
+        post_processors=[processor for processor in (mmr, rerank, expand) if processor is not None],
+        k=int(get_env_var("RETRIEVAL_TOP_K") or 4),
+        lexical_weight=float(get_env_var("HYBRID_LEXICAL_WEIGHT") or 1.0),
+        vector_weight=float(get_env_var("HYBRID_VECTOR_WEIGHT") or 1.0),
+    )
+
     print("Initializing agent and QA chain...")
 
     AGENT_PROMPT = ChatPromptTemplate.from_messages([
@@ -108,14 +158,27 @@ def initialize_agent_and_qa(supabase_client):
     agent_debug_log = []
 
     @tool
-    def retrieve_documents(input: str) -> str:
+    def retrieve_documents(
+        input: str,
+        sub_queries: Optional[List[str]] = None,
+        source: Optional[str] = None,
+        file_type: Optional[str] = None,
+        upload_batch: Optional[str] = None,
+    ) -> str:
         """Retrieves relevant document excerpts from the vector store based on the user's query. 
         This tool should be used to gather information from the uploaded documents to answer user questions.
         The input should be a clear question or topic to search for in the documents.
+        For questions with several parts, pass the parts as sub_queries in this one call
+        instead of calling the tool again for each part.
+        Only pass source, file_type or upload_batch when the user asks about a specific file or upload.
         Returns a formatted string of the retrieved document sections.
         
         Args:
             input: A clear question or topic to search for in the documents
+            sub_queries: Optional extra questions or topics to search for in the same call
+            source: Optional file name to search within, e.g. "HMI Poster.pdf"
+            file_type: Optional file type to search within: "pdf", "txt" or "csv"
+            upload_batch: Optional upload batch id to search within
             
         Returns:
             str: Formatted string of the retrieved document sections
@@ -131,56 +194,38 @@ def initialize_agent_and_qa(supabase_client):
         else:
             user_query = str(input)
         
-        log_entry = f"Retrieving documents for query: {user_query}"
+        metadata_filter = build_filter(source=source, file_type=file_type, upload_batch=upload_batch)
+        log_entry = f"Retrieving documents for query: {user_query}, sub-queries: {sub_queries} (filter: {metadata_filter})"
         print(log_entry)
         agent_debug_log.append(log_entry)
         try:
-            # First, try to get documents using simple text search since vector search might not be working
-            from supabase.client import create_client
-            import os
-            
-            supabase_url = get_env_var("SUPABASE_URL")
-            supabase_key = get_env_var("SUPABASE_SERVICE_KEY")
-            supabase = create_client(supabase_url, supabase_key)
-            
-            # Get all documents and filter by content similarity
-            response = supabase.table("documents").select("*").execute()
-            all_docs = response.data
-            
-            if not all_docs:
-                log_entry = "No documents found in database!"
-                print(log_entry)
-                agent_debug_log.append(log_entry)
-                return "No documents found in the database. Please upload documents first."
-            
-            log_entry = f"Found {len(all_docs)} total documents in database"
+            log_entry = "Running hybrid search"
             print(log_entry)
             agent_debug_log.append(log_entry)
             
-            # Simple keyword matching for now (since vector search is not working)
-            query_words = user_query.lower().split()
-            scored_docs = []
-            
-            for doc in all_docs:
-                content = doc["content"].lower()
-                score = 0
-                for word in query_words:
-                    if word in content:
-                        score += content.count(word)
-                
-                if score > 0:
-                    scored_docs.append((score, doc))
-            
-            # Sort by score and take top results
-            scored_docs.sort(reverse=True, key=lambda x: x[0])
-            retrieved_docs = [doc for score, doc in scored_docs[:7]]  # Take top 7
+            queries = [user_query] + [query for query in (sub_queries or []) if query and query != user_query]
+            # All queries share one embedding call and one similarity round trip
+            retrieved, seen = [], set()
+            for results in retriever.retrieve_many(queries, filter=metadata_filter):
+                for doc, score in results:
+                    if doc_key(doc) not in seen:
+                        seen.add(doc_key(doc))
+                        retrieved.append((doc, score))
+            # Best passages first, overlap stripped, cut at the route's token budget
+            retrieved_docs = pack_context(retrieved, context_budget("agent"))
             
             if not retrieved_docs:
-                # If no keyword matches, return all documents
-                log_entry = "No keyword matches found, returning all documents"
+                # The local indexes can be empty while the table isn't (failed build,
+                # rows added by another process), so ask the table itself
+                if not supabase_client.table("documents").select("id").limit(1).execute().data:
+                    log_entry = "No documents found in database!"
+                    print(log_entry)
+                    agent_debug_log.append(log_entry)
+                    return "No documents found in the database. Please upload documents first."
+                log_entry = "No documents retrieved!"
                 print(log_entry)
                 agent_debug_log.append(log_entry)
-                retrieved_docs = all_docs[:7]  # Return first 7 documents
+                return "No relevant documents found in the database."
             
             log_entry = f"Retrieved {len(retrieved_docs)} relevant documents"
             print(log_entry)
@@ -189,7 +234,7 @@ def initialize_agent_and_qa(supabase_client):
             # Format the results
             sources = {}
             for doc in retrieved_docs:
-                source = doc["metadata"].get("source", "Unknown Source")
+                source = doc.metadata.get("source", "Unknown Source")
                 if source not in sources:
                     sources[source] = []
                 sources[source].append(doc)
@@ -198,7 +243,7 @@ def initialize_agent_and_qa(supabase_client):
             for source, docs in sources.items():
                 source_text = f"## Source: {source}\n\n"
                 for i, doc in enumerate(docs):
-                    source_text += f"### Excerpt {i+1}:\n{doc['content']}\n\n"
+                    source_text += f"### Excerpt {i+1}:\n{doc.page_content}\n\n"
                 formatted_results.append(source_text)
             
             serialized = "\n\n".join(formatted_results)
@@ -225,11 +270,10 @@ def initialize_agent_and_qa(supabase_client):
         return_direct_tool_output=False,
     )
     
-    retriever = vector_store.as_retriever(search_kwargs={"k": 8})
     _direct_qa = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=retriever,
+        retriever=PackedRetriever(retriever=retriever, route="direct_qa"),
         chain_type_kwargs={
             "prompt": PromptTemplate.from_template(DIRECT_RETRIEVAL_TEMPLATE),
             "verbose": True
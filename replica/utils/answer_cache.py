@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+import numpy as np
+
+try:
+    from .corpus_sync import get_corpus_version
+except ImportError:
+    from corpus_sync import get_corpus_version
+
+class SemanticAnswerCache:
+    """Answers to past questions, looked up by embedding similarity.
+
+    Question embeddings live in a fixed-size ring of normalized float32 rows,
+    so a lookup is one matrix-vector product. An entry is served only when its
+    cosine similarity clears `threshold`, it is younger than `ttl` seconds, and
+    the corpus hasn't changed since it was stored; a corpus change, including
+    one made by another process (see corpus_sync.get_corpus_version), drops
+    everything. Once full, the oldest entry is overwritten.
+    """
+
+    def __init__(self, embeddings, threshold=0.95, max_size=1000, ttl=86400):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._answers = [None] * max_size
+        self._created = np.zeros(max_size, dtype=np.float64)
+        self._next = 0
+        self._count = 0
+        self._version = get_corpus_version()
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_version_locked(self, version):
+        if version != self._version:
+            self._answers = [None] * self.max_size
+            self._created[:] = 0
+            self._next = 0
+            self._count = 0
+            self._version = version
+
+    def lookup(self, question):
+        """Return (answer or None, metadata) where metadata records the hit/miss decision."""
+        vector = self._embed(question)
+        # Read outside the lock: it may query corpus_state
+        version = get_corpus_version()
+        with self._lock:
+            self._sync_version_locked(version)
+            best_similarity = 0.0
+            if self._count:
+                similarities = self._matrix[:self._count] @ vector
+                similarities[time.time() - self._created[:self._count] > self.ttl] = -1.0
+                best = int(np.argmax(similarities))
+                best_similarity = float(similarities[best])
+                if best_similarity >= self.threshold:
+                    self.hits += 1
+                    return self._answers[best], {"hit": True, "similarity": best_similarity}
+            self.misses += 1
+            return None, {"hit": False, "similarity": best_similarity}
+
+    def store(self, question, answer, version=None):
+        """Remember an answer; pass the corpus version read before answering to avoid caching stale answers."""
+        vector = self._embed(question)
+        current = get_corpus_version()
+        with self._lock:
+            self._sync_version_locked(current)
+            if version is not None and version != self._version:
+                return
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._matrix[slot] = vector
+            self._answers[slot] = answer
+            self._created[slot] = time.time()
+            self._next = (slot + 1) % self.max_size
+            self._count = min(self._count + 1, self.max_size)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self._count,
+        }
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache(embeddings):
+    """Return the process-wide answer cache.
+
+    ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE and ANSWER_CACHE_TTL (seconds)
+    configure it.
+    """
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                embeddings,
+                threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95)),
+                max_size=int(os.environ.get("ANSWER_CACHE_SIZE", 1000)),
+                ttl=float(os.environ.get("ANSWER_CACHE_TTL", 86400)),
+            )
+    return _answer_cache
@@ -0,0 +1,61 @@
+import sys
+
+CHANGES_TABLE = "document_changes"
+
+def latest_change(supabase_client):
+    """seq of the newest document_changes entry (0 while it is empty), or None if the table is missing."""
+    try:
+        rows = (
+            supabase_client.table(CHANGES_TABLE)
+            .select("seq")
+            .order("seq", desc=True)
+            .limit(1)
+            .execute()
+            .data
+        )
+    except Exception as e:
+        print(f"Could not read {CHANGES_TABLE} ({str(e)}); in-process indexes only see this process's writes. "
+              "Run add_document_changes.sql to share them.", file=sys.stderr)
+        return None
+    return rows[0]["seq"] if rows else 0
+
+def changes_since(supabase_client, seq, page_size=1000):
+    """Collapse the document_changes entries after `seq` into what an index has to apply.
+
+    Returns (changed, newest_seq, truncated): `changed` maps each doc id to its
+    last operation ("U" for inserted or updated, "D" for deleted). A TRUNCATE
+    drops everything logged before it and sets `truncated`, since the index
+    then has to be emptied before applying the rest.
+    """
+    changed = {}
+    truncated = False
+    while True:
+        rows = (
+            supabase_client.table(CHANGES_TABLE)
+            .select("seq, doc_id, op")
+            .gt("seq", seq)
+            .order("seq")
+            .limit(page_size)
+            .execute()
+            .data
+            or []
+        )
+        for row in rows:
+            if row["op"] == "T":
+                changed = {}
+                truncated = True
+            else:
+                changed[str(row["doc_id"])] = row["op"]
+        if rows:
+            seq = rows[-1]["seq"]
+        if len(rows) < page_size:
+            return changed, seq, truncated
+
+def fetch_rows(supabase_client, ids, columns, table_name="documents", batch_size=100):
+    """Current rows for `ids`, fetched in batches; ids that no longer exist are simply absent."""
+    ids = list(ids)
+    rows = []
+    for i in range(0, len(ids), batch_size):
+        response = supabase_client.table(table_name).select(columns).in_("id", ids[i:i + batch_size]).execute()
+        rows.extend(response.data or [])
+    return rows
@@ -0,0 +1,204 @@
+import os
+from langchain_core.documents import Document
+
+def chunk_key(metadata):
+    """(source, chunk_index) identifying a chunk's position in its file, or None.
+
+    Positions are numbered per source, and every upload rewrites them on the
+    rows it keeps (see ContentAddressedStore.update_metadata), so they stay
+    contiguous after a sync.
+    """
+    if metadata.get("source") is None or metadata.get("chunk_index") is None:
+        return None
+    return (metadata["source"], int(metadata["chunk_index"]))
+
+def page_key(metadata):
+    """(source, page) for chunks that came from a PDF page, or None."""
+    if metadata.get("source") is None or metadata.get("page") is None:
+        return None
+    return (metadata["source"], int(metadata["page"]))
+
+def overlap_length(previous, current, max_overlap=1000, min_overlap=20):
+    """Length of the longest prefix of `current` that is also a suffix of `previous`.
+
+    Adjacent chunks from the text splitter share up to chunk_overlap
+    characters; overlaps shorter than `min_overlap` are treated as chance.
+    """
+    limit = min(len(previous), len(current), max_overlap)
+    if limit < min_overlap:
+        return 0
+    probe = current[:min_overlap]
+    start = len(previous) - limit
+    while True:
+        # The earliest match is the longest suffix, so the first full match wins
+        pos = previous.find(probe, start)
+        if pos == -1:
+            return 0
+        if current.startswith(previous[pos:]):
+            return len(previous) - pos
+        start = pos + 1
+
+def strip_overlap(previous, current, max_overlap=1000):
+    """Return `current` without the text it repeats from the end of `previous`."""
+    return current[overlap_length(previous, current, max_overlap=max_overlap):]
+
+def join_chunks(contents, max_overlap=1000):
+    """Concatenate consecutive chunk texts, keeping each overlapping stretch once."""
+    passage = ""
+    for content in contents:
+        if not passage:
+            passage = content
+            continue
+        overlap = overlap_length(passage, content, max_overlap=max_overlap)
+        passage += content[overlap:] if overlap else "\n" + content
+    return passage
+
+def _quote(value):
+    """Quote a value for a PostgREST logic-tree filter."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+class NeighbourExpansionPostProcessor:
+    """Retriever post-processor that widens each hit into a passage.
+
+    `mode="neighbours"` adds the chunks within `window` positions of the hit
+    in the same source; `mode="page"` adds every chunk from
+    the hit's PDF page. Positions are resolved against the in-memory BM25 index
+    when it is loaded, otherwise with one batched read of the documents table.
+    Hits whose windows overlap or touch are merged into one contiguous passage
+    scored by its best hit.
+    """
+
+    fetch_k = 0
+
+    def __init__(self, lexical_index=None, supabase_client=None, table_name="documents", window=1, mode="neighbours"):
+        self.lexical_index = lexical_index
+        self.supabase_client = supabase_client
+        self.table_name = table_name
+        self.window = window
+        self.mode = mode
+
+    def _use_local(self):
+        return self.lexical_index is not None and len(self.lexical_index) > 0
+
+    def _fetch_rows(self, query_filter):
+        response = (
+            self.supabase_client.table(self.table_name)
+            .select("id, content, metadata")
+            .or_(query_filter)
+            .execute()
+        )
+        return response.data or []
+
+    def _clause(self, source, column, values):
+        return f"and(metadata->>source.eq.{_quote(source)},metadata->>{column}.in.({','.join(map(str, sorted(values)))}))"
+
+    def _neighbour_rows(self, hit_keys):
+        wanted = {
+            (source, i)
+            for source, index in hit_keys
+            for i in range(max(0, index - self.window), index + self.window + 1)
+        }
+        if self._use_local():
+            return self.lexical_index.chunks_at(wanted)
+        if self.supabase_client is None:
+            return {}
+        by_source = {}
+        for source, index in wanted:
+            by_source.setdefault(source, set()).add(index)
+        clauses = [self._clause(source, "chunk_index", indexes) for source, indexes in by_source.items()]
+        rows = {}
+        for row in self._fetch_rows(",".join(clauses)):
+            key = chunk_key(row.get("metadata") or {})
+            if key in wanted:
+                rows[key] = row
+        return rows
+
+    def _page_rows(self, hit_pages):
+        if self._use_local():
+            pages = self.lexical_index.page_chunks(hit_pages)
+        elif self.supabase_client is None:
+            return {}
+        else:
+            by_source = {}
+            for source, page in hit_pages:
+                by_source.setdefault(source, set()).add(page)
+            clauses = [self._clause(source, "page", pages) for source, pages in by_source.items()]
+            pages = {}
+            for row in self._fetch_rows(",".join(clauses)):
+                key = page_key(row.get("metadata") or {})
+                if key in hit_pages:
+                    pages.setdefault(key, []).append(row)
+        rows = {}
+        for page_rows in pages.values():
+            for row in page_rows:
+                key = chunk_key(row.get("metadata") or {})
+                if key is not None:
+                    rows[key] = row
+        return rows
+
+    def process(self, query, results, k):
+        """Return up to k (passage document, score) pairs built around the hits in `results`."""
+        results = results[:k]
+        hit_keys = [chunk_key(doc.metadata) for doc, _ in results]
+        if self.mode == "page":
+            rows = self._page_rows({page_key(doc.metadata) for doc, _ in results} - {None})
+        else:
+            rows = self._neighbour_rows({key for key in hit_keys if key is not None})
+
+        # Each hit covers an index range within its source
+        spans = []
+        for (doc, score), key in zip(results, hit_keys):
+            if key is None:
+                spans.append([None, None, None, score, doc])
+                continue
+            group = key[:1]
+            if self.mode == "page":
+                page = page_key(doc.metadata)
+                covered = [
+                    row_key[1] for row_key, row in rows.items()
+                    if row_key[:1] == group and page_key(row.get("metadata") or {}) == page
+                ]
+            else:
+                covered = [i for i in range(key[1] - self.window, key[1] + self.window + 1) if group + (i,) in rows]
+            covered.append(key[1])
+            spans.append([group, min(covered), max(covered), score, doc])
+
+        # Merge spans in the same group that overlap or touch; a merged passage keeps its best hit
+        merged = [span for span in spans if span[0] is None]
+        for span in sorted((span for span in spans if span[0] is not None), key=lambda span: (span[0], span[1])):
+            last = next((m for m in reversed(merged) if m[0] == span[0]), None)
+            if last is not None and span[1] <= last[2] + 1:
+                last[2] = max(last[2], span[2])
+                if span[3] > last[3]:
+                    last[3], last[4] = span[3], span[4]
+            else:
+                merged.append(span)
+        merged.sort(key=lambda span: -span[3])
+
+        passages = []
+        for group, low, high, score, doc in merged:
+            if group is None:
+                passages.append((doc, score))
+                continue
+            contents = []
+            for index in range(low, high + 1):
+                row = rows.get(group + (index,))
+                if row is not None:
+                    contents.append(row["content"])
+                elif index == chunk_key(doc.metadata)[1]:
+                    contents.append(doc.page_content)
+            metadata = dict(doc.metadata, chunk_range=[low, high])
+            passages.append((Document(id=doc.id, page_content=join_chunks(contents), metadata=metadata), score))
+        return passages
+
+def get_expansion_post_processor(lexical_index=None, supabase_client=None):
+    """Expansion post-processor from EXPAND_MODE ("neighbours", "page" or "none") and EXPAND_WINDOW, or None."""
+    mode = os.environ.get("EXPAND_MODE", "neighbours").lower()
+    if mode == "none":
+        return None
+    return NeighbourExpansionPostProcessor(
+        lexical_index=lexical_index,
+        supabase_client=supabase_client,
+        window=int(os.environ.get("EXPAND_WINDOW", 1)),
+        mode=mode,
+    )
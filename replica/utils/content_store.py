@@ -0,0 +1,237 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import numpy as np
+
+try:
+    from .embedding_cache import EMBEDDING_MODEL
+except ImportError:
+    from embedding_cache import EMBEDDING_MODEL
+
+def content_hash(text, model_name=EMBEDDING_MODEL):
+    """sha256 of the embedding model name followed by the chunk text, as hex.
+
+    Matches encode(sha256(convert_to(model || content, 'UTF8')), 'hex') in
+    Postgres, which add_content_hash.sql uses to backfill existing rows.
+    """
+    return hashlib.sha256((model_name + text).encode("utf-8")).hexdigest()
+
+def chunk_hash(text, source, model_name=EMBEDDING_MODEL):
+    """The documents row key: sha256 of content_hash() followed by the chunk's source, as hex.
+
+    Scoping the key to the source gives each file its own row (and its own
+    source, upload_batch and position metadata) for text it shares with
+    another file; the vector is still embedded once, since the document
+    cache is keyed by content_hash(). Matches
+    encode(sha256(convert_to(hash || source, 'UTF8')), 'hex') in Postgres.
+    """
+    return hashlib.sha256((content_hash(text, model_name) + (source or "")).encode("utf-8")).hexdigest()
+
+def position_metadata(metadata):
+    """The part of a chunk's metadata that places it in its file: chunk_index and, for PDFs, page."""
+    return {key: metadata[key] for key in ("chunk_index", "page") if key in metadata}
+
+class DocumentEmbeddingCache:
+    """Persistent content-hash -> document vector store in a local SQLite file.
+
+    Unlike the query cache in embedding_cache.py, entries never expire: a
+    hash pins both the text and the model, so its vector can't go stale.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS document_embeddings (hash TEXT PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+
+    def get_many(self, hashes):
+        """{hash: vector} for the hashes that are cached."""
+        found = {}
+        hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(hashes), 500):
+                part = hashes[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM document_embeddings WHERE hash IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store (hash, vector) pairs."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO document_embeddings (hash, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+            self._db.commit()
+
+_document_cache = None
+_document_cache_lock = threading.Lock()
+
+def get_document_embedding_cache():
+    """Process-wide document vector cache at DOCUMENT_EMBEDDING_CACHE_PATH
+    (default document_embeddings.db; an empty value disables it)."""
+    global _document_cache
+    path = os.environ.get("DOCUMENT_EMBEDDING_CACHE_PATH", "document_embeddings.db")
+    if not path:
+        return None
+    with _document_cache_lock:
+        if _document_cache is None:
+            _document_cache = DocumentEmbeddingCache(path)
+    return _document_cache
+
+class ContentAddressedStore:
+    """Writes chunks to the documents table keyed by chunk_hash (the content_hash column).
+
+    Chunks whose hash is already in the table (or repeated within the same
+    call) are skipped, vectors for the rest come from the local document
+    cache when possible and from `embed_documents` otherwise, and inserts use
+    ON CONFLICT (content_hash) DO NOTHING so concurrent uploads of the same
+    file can't create duplicates either.
+    """
+
+    def __init__(self, supabase_client, embed_documents, cache=None, table_name="documents", model_name=EMBEDDING_MODEL):
+        self.supabase = supabase_client
+        self.embed_documents = embed_documents
+        self.cache = cache
+        self.table_name = table_name
+        self.model_name = model_name
+
+    def existing_hashes(self, hashes):
+        """The subset of `hashes` already stored in the table."""
+        hashes = list(hashes)
+        existing = set()
+        for i in range(0, len(hashes), 100):
+            response = (
+                self.supabase.table(self.table_name)
+                .select("content_hash")
+                .in_("content_hash", hashes[i:i + 100])
+                .execute()
+            )
+            existing.update(row["content_hash"] for row in response.data or [])
+        return existing
+
+    def stored_ids(self, hashes):
+        """{content_hash: id} for the hashes already stored in the table."""
+        hashes = list(hashes)
+        ids = {}
+        for i in range(0, len(hashes), 100):
+            response = (
+                self.supabase.table(self.table_name)
+                .select("id, content_hash")
+                .in_("content_hash", hashes[i:i + 100])
+                .execute()
+            )
+            ids.update((row["content_hash"], row["id"]) for row in response.data or [])
+        return ids
+
+    def new_chunks(self, docs):
+        """(docs, hashes) for the chunks of `docs` that aren't stored yet, in order."""
+        hashes = [chunk_hash(doc.page_content, (doc.metadata or {}).get("source"), self.model_name) for doc in docs]
+        skip = self.existing_hashes(set(hashes))
+        new_docs, new_hashes = [], []
+        for doc, key in zip(docs, hashes):
+            if key not in skip:
+                skip.add(key)
+                new_docs.append(doc)
+                new_hashes.append(key)
+        return new_docs, new_hashes
+
+    def embed(self, texts):
+        """Vectors for `texts`, only calling the embedding API for texts not in the cache."""
+        hashes = [content_hash(text, self.model_name) for text in texts]
+        cached = self.cache.get_many(hashes) if self.cache is not None else {}
+        missing = [i for i, key in enumerate(hashes) if key not in cached]
+        if missing:
+            vectors = self.embed_documents([texts[i] for i in missing])
+            fresh = [(hashes[i], vector) for i, vector in zip(missing, vectors)]
+            if self.cache is not None:
+                self.cache.put_many(fresh)
+            cached.update(fresh)
+        return [cached[key] for key in hashes]
+
+    def embed_batches(self, batches, embed_batches):
+        """embed() over batches of texts, yielding each batch's vectors in order.
+
+        The cache misses go through `embed_batches` (e.g.
+        EmbeddingExecutor.embed_batches) so several batches can be in flight.
+        """
+        batches = [(texts, [content_hash(text, self.model_name) for text in texts]) for texts in batches]
+        cached = self.cache.get_many([key for _, hashes in batches for key in hashes]) if self.cache is not None else {}
+        missing = [[i for i, key in enumerate(hashes) if key not in cached] for _, hashes in batches]
+        embedded = embed_batches([texts[i] for i in indexes] for (texts, _), indexes in zip(batches, missing))
+        for (texts, hashes), indexes in zip(batches, missing):
+            vectors = next(embedded)
+            fresh = [(hashes[i], vector) for i, vector in zip(indexes, vectors)]
+            if fresh and self.cache is not None:
+                self.cache.put_many(fresh)
+            found = dict(fresh)
+            yield [found[key] if key in found else cached[key] for key in hashes]
+
+    def rows(self, docs, hashes, vectors, extra_metadata=None):
+        return [
+            {
+                # Don't include 'id' - let the database auto-generate it
+                "content": doc.page_content,
+                "metadata": {**(doc.metadata or {}), **(extra_metadata or {})},
+                "embedding": vector,
+                "content_hash": key,
+            }
+            for doc, key, vector in zip(docs, hashes, vectors)
+        ]
+
+    def insert(self, rows):
+        """Insert rows, skipping any whose content_hash landed meanwhile; returns the inserted rows."""
+        response = (
+            self.supabase.table(self.table_name)
+            .upsert(rows, on_conflict="content_hash", ignore_duplicates=True)
+            .execute()
+        )
+        return response.data or []
+
+    def update_metadata(self, patches, batch_size=500):
+        """Merge {content_hash: metadata patch} into the stored rows; returns the rows that changed.
+
+        Runs through the update_chunk_metadata function (add_update_chunk_metadata.sql),
+        one call per `batch_size` rows; rows already carrying the patch aren't written.
+        """
+        items = [{"content_hash": key, "metadata": patch} for key, patch in patches.items()]
+        updated = []
+        try:
+            for i in range(0, len(items), batch_size):
+                response = self.supabase.rpc("update_chunk_metadata", {"updates": items[i:i + batch_size]}).execute()
+                updated.extend(response.data or [])
+        except Exception as e:
+            print(f"Could not update chunk metadata ({str(e)}); run add_update_chunk_metadata.sql", file=sys.stderr)
+        return updated
+
+    def update_positions(self, docs):
+        """Rewrite chunk_index (and page) on stored rows for `docs` that were already stored.
+
+        Chunks skipped as already stored keep the position their first upload
+        gave them; this moves them to where they are in the file now, so
+        neighbour expansion stays contiguous. Returns the rows that changed.
+        """
+        patches = {
+            chunk_hash(doc.page_content, (doc.metadata or {}).get("source"), self.model_name): position_metadata(doc.metadata or {})
+            for doc in docs
+        }
+        patches = {key: patch for key, patch in patches.items() if patch}
+        return self.update_metadata(patches) if patches else []
+
+    def store(self, docs, extra_metadata=None):
+        """Embed and insert whichever of `docs` aren't stored yet; returns the inserted rows."""
+        docs, hashes = self.new_chunks(docs)
+        if not docs:
+            return []
+        vectors = self.embed([doc.page_content for doc in docs])
+        return self.insert(self.rows(docs, hashes, vectors, extra_metadata))
@@ -0,0 +1,116 @@
+import math
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+try:
+    from .chunk_expansion import overlap_length
+except ImportError:
+    from chunk_expansion import overlap_length
+
+# Default prompt-context budgets in tokens; override with CONTEXT_BUDGET_<ROUTE>
+DEFAULT_BUDGETS = {"agent": 2000, "direct_qa": 1500, "voice": 800}
+
+_scoped_route = ContextVar("scoped_route", default=None)
+
+def estimate_tokens(text):
+    """Rough Gemini token count (about 4 characters per token); no tokenizer call needed."""
+    return math.ceil(len(text) / 4)
+
+@contextmanager
+def context_route(route):
+    """Make every context packed in this context use `route`'s budget (e.g. "voice")."""
+    token = _scoped_route.set(route)
+    try:
+        yield
+    finally:
+        _scoped_route.reset(token)
+
+def context_budget(default_route):
+    """Token budget for the scoped route, or for `default_route` when none is scoped."""
+    route = _scoped_route.get() or default_route
+    value = os.environ.get(f"CONTEXT_BUDGET_{route.upper()}")
+    return int(value) if value else DEFAULT_BUDGETS.get(route, DEFAULT_BUDGETS["agent"])
+
+def _span(doc):
+    """(source, first chunk, last chunk) of a chunk or expanded passage, or None if unpositioned."""
+    metadata = doc.metadata
+    if metadata.get("source") is None or metadata.get("chunk_index") is None:
+        return None
+    low, high = metadata.get("chunk_range") or (metadata["chunk_index"], metadata["chunk_index"])
+    return metadata["source"], int(low), int(high)
+
+def dedupe_overlaps(docs):
+    """Texts for `docs` with the text each adjacent chunk repeats from its predecessor removed.
+
+    Chunks are adjacent when they come from the same source and their chunk
+    indexes touch. Expanded passages can share whole chunks,
+    so the repeated text is matched against the passage that reaches furthest
+    without a length cap, and a passage whose chunks are all covered already
+    is emptied, as are identical texts.
+    """
+    texts = [doc.page_content for doc in docs]
+    positioned = sorted(
+        (span + (i,) for i, span in ((i, _span(doc)) for i, doc in enumerate(docs)) if span is not None),
+        key=lambda item: (item[0], item[1]),
+    )
+    # source -> (last chunk index covered so far, position of the passage that covers it)
+    reach = {}
+    for group, low, high, cur in positioned:
+        covered = reach.get(group)
+        if covered is not None and low <= covered[0] + 1:
+            if high <= covered[0]:
+                texts[cur] = ""
+                continue
+            previous = texts[covered[1]]
+            texts[cur] = texts[cur][overlap_length(previous, texts[cur], max_overlap=len(texts[cur])):]
+        reach[group] = (high, cur)
+
+    seen = set()
+    for i, text in enumerate(texts):
+        if text in seen:
+            texts[i] = ""
+        seen.add(text)
+    return texts
+
+def pack_context(results, budget_tokens, min_tail_tokens=100):
+    """Fit (document, score) pairs into `budget_tokens`, best-scored first.
+
+    Overlap between adjacent chunks is stripped first. Passages are added in
+    score order until the next one doesn't fit; that one is truncated into
+    the remaining room if at least `min_tail_tokens` are left, then packing
+    stops. Returns the packed Documents.
+    """
+    results = sorted(results, key=lambda pair: pair[1], reverse=True)
+    docs = [doc for doc, _ in results]
+    texts = dedupe_overlaps(docs)
+
+    packed, used = [], 0
+    for doc, text in zip(docs, texts):
+        text = text.strip()
+        if not text:
+            continue
+        tokens = estimate_tokens(text)
+        if used + tokens > budget_tokens:
+            remaining = budget_tokens - used
+            if remaining >= min_tail_tokens or not packed:
+                packed.append(Document(id=doc.id, page_content=text[:remaining * 4], metadata=doc.metadata))
+            break
+        packed.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+        used += tokens
+    return packed
+
+class PackedRetriever(BaseRetriever):
+    """Wraps a retriever with a `search(query)` method and packs its results into a route's token budget."""
+
+    retriever: Any
+    route: str = "direct_qa"
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return pack_context(self.retriever.search(query), context_budget(self.route))
@@ -0,0 +1,160 @@
+import os
+import sys
+import threading
+import time
+
+try:
+    from .source_manifest import SourceManifest
+    from .ingest_checkpoint import discard_checkpoint
+    from .change_log import latest_change, changes_since, fetch_rows
+    from .lexical_index import lexical_index_loaded, update_lexical_index, reset_lexical_index, remove_from_lexical_index
+    from .vector_index import vector_index_loaded, update_vector_index, reset_vector_index, remove_from_vector_index
+except ImportError:
+    from source_manifest import SourceManifest
+    from ingest_checkpoint import discard_checkpoint
+    from change_log import latest_change, changes_since, fetch_rows
+    from lexical_index import lexical_index_loaded, update_lexical_index, reset_lexical_index, remove_from_lexical_index
+    from vector_index import vector_index_loaded, update_vector_index, reset_vector_index, remove_from_vector_index
+
+_corpus_version = 0
+_corpus_version_lock = threading.Lock()
+
+# Shared version from the corpus_state row, which a trigger on the documents
+# table bumps on every write, whichever process makes it
+_shared_client = None
+_shared_version = None
+_shared_checked = None
+
+# Position in the document_changes log up to which the in-process BM25 and
+# vector indexes are current, and ids this process inserted (and indexed)
+# itself, whose log entries need no fetch
+_change_seq = None
+_change_lock = threading.Lock()
+_own_writes = set()
+
+def watch_shared_corpus_version(supabase_client):
+    """Make get_corpus_version() and the in-process indexes follow writes by other processes.
+
+    Call it before the indexes are built: changes logged after this point are
+    applied to them whenever corpus_state moves.
+    """
+    global _shared_client, _change_seq
+    seq = latest_change(supabase_client)
+    with _change_lock:
+        _change_seq = seq
+    with _corpus_version_lock:
+        _shared_client = supabase_client
+
+def _apply_shared_changes(client):
+    """Apply the document_changes entries since the last call to the in-process indexes."""
+    global _change_seq
+    with _change_lock:
+        if _change_seq is None:
+            return
+        try:
+            changed, seq, truncated = changes_since(client, _change_seq)
+            if truncated:
+                reset_lexical_index()
+                reset_vector_index()
+            deleted = [doc_id for doc_id, op in changed.items() if op == "D"]
+            upserted = [doc_id for doc_id, op in changed.items() if op != "D" and doc_id not in _own_writes]
+            _own_writes.difference_update(changed)
+            if upserted and (lexical_index_loaded() or vector_index_loaded()):
+                columns = "id, content, metadata, embedding" if vector_index_loaded() else "id, content, metadata"
+                rows = fetch_rows(client, upserted, columns)
+                found = {str(row["id"]) for row in rows}
+                # Inserted and deleted again since the log entry was read
+                deleted.extend(doc_id for doc_id in upserted if doc_id not in found)
+                update_lexical_index(rows)
+                update_vector_index(rows)
+            remove_from_lexical_index(deleted)
+            remove_from_vector_index(deleted)
+            _change_seq = seq
+        except Exception as e:
+            # Keep the watermark: the same entries are retried on the next version change
+            print(f"Could not apply document changes: {str(e)}", file=sys.stderr)
+
+def _shared_corpus_version():
+    """corpus_state.version, re-read at most every CORPUS_VERSION_TTL seconds (default 1; 0 reads every time)."""
+    global _shared_client, _shared_version, _shared_checked, _corpus_version
+    with _corpus_version_lock:
+        client = _shared_client
+        ttl = float(os.environ.get("CORPUS_VERSION_TTL", 1))
+        if client is None or (_shared_checked is not None and time.monotonic() - _shared_checked < ttl):
+            return _shared_version
+        _shared_checked = time.monotonic()
+    try:
+        rows = client.table("corpus_state").select("version").eq("id", 1).execute().data
+        version = rows[0]["version"] if rows else None
+    except Exception as e:
+        with _corpus_version_lock:
+            if _shared_version is None:
+                # Never read successfully: the table is most likely missing
+                print(f"Could not read corpus_state ({str(e)}); caches only see this process's writes. "
+                      "Run add_corpus_state.sql to share the corpus version.", file=sys.stderr)
+                _shared_client = None
+            else:
+                # Can't tell whether the corpus changed, so assume it did
+                print(f"Could not read corpus_state: {str(e)}", file=sys.stderr)
+                _corpus_version += 1
+            return _shared_version
+    if version != _shared_version:
+        # Update the indexes before publishing the version, so nothing is cached under it from stale ones
+        _apply_shared_changes(client)
+    with _corpus_version_lock:
+        _shared_version = version
+    return version
+
+def get_corpus_version():
+    """Identifies the current contents of the documents table.
+
+    Combines a counter bumped by this process's writes, which takes effect
+    immediately, with the shared corpus_state version once
+    watch_shared_corpus_version() has been called, which picks up writes from
+    other processes within CORPUS_VERSION_TTL seconds.
+    """
+    shared = _shared_corpus_version()
+    return (shared, _corpus_version)
+
+def bump_corpus_version():
+    global _corpus_version
+    with _corpus_version_lock:
+        _corpus_version += 1
+        return _corpus_version
+
+def documents_inserted(rows):
+    """Propagate rows just inserted into the documents table to every in-process index."""
+    update_lexical_index(rows)
+    update_vector_index(rows)
+    if _change_seq is not None:
+        _own_writes.update(str(row["id"]) for row in rows if row.get("id") is not None)
+    bump_corpus_version()
+
+def documents_deleted(ids):
+    """Remove rows just deleted from the documents table from every in-process index."""
+    ids = [str(doc_id) for doc_id in ids]
+    remove_from_lexical_index(ids)
+    remove_from_vector_index(ids)
+    bump_corpus_version()
+
+def documents_cleared():
+    """Empty every in-process index after the documents table has been cleared."""
+    reset_lexical_index()
+    reset_vector_index()
+    bump_corpus_version()
+
+def clear_documents(supabase_client, table_name="documents", discard_ingest_checkpoint=True):
+    """Delete every row of the documents table, plus everything that describes it.
+
+    The document_sources manifest is cleared too (otherwise a sync upload
+    would take its files for already stored), the ingest checkpoint is
+    deleted and the in-process indexes are emptied. Every clear or replace
+    should go through here.
+    """
+    # id is a uuid, so match every row with the nil uuid
+    response = supabase_client.table(table_name).delete().neq("id", "00000000-0000-0000-0000-000000000000").execute()
+    SourceManifest(supabase_client, documents_table=table_name).clear()
+    if discard_ingest_checkpoint:
+        discard_checkpoint()
+    documents_cleared()
+    return response
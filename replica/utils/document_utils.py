@@ -1,13 +1,30 @@
 import os
 import tempfile
+import uuid
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import SupabaseVectorStore
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from supabase.client import create_client
 import sys
 
+try:
+    from .corpus_sync import documents_inserted, clear_documents
+    from .vector_search import TopKSupabaseVectorStore
+    from .embedding_cache import get_cached_embeddings
+    from .parallel_parsing import parse_files
+    from .ingest_pipeline import IngestPipeline
+    from .embedding_executor import get_embedding_executor
+    from .content_store import ContentAddressedStore, get_document_embedding_cache
+    from .bulk_writer import get_bulk_writer
+except ImportError:
+    from corpus_sync import documents_inserted, clear_documents
+    from vector_search import TopKSupabaseVectorStore
+    from embedding_cache import get_cached_embeddings
+    from parallel_parsing import parse_files
+    from ingest_pipeline import IngestPipeline
+    from embedding_executor import get_embedding_executor
+    from content_store import ContentAddressedStore, get_document_embedding_cache
+    from bulk_writer import get_bulk_writer
+
 # Function to get environment variable or Streamlit secret
 def get_env_var(key):
     # First try environment variables
@@ -24,124 +41,52 @@ def get_env_var(key):
 def process_uploaded_files(uploaded_files):
     """Process Streamlit uploaded files and convert them to document chunks."""
     with tempfile.TemporaryDirectory() as temp_dir:
-        documents = []
-        file_details = []
-        
+        named_paths = []
         for uploaded_file in uploaded_files:
             file_path = os.path.join(temp_dir, uploaded_file.name)
             with open(file_path, "wb") as f:
                 f.write(uploaded_file.getbuffer())
-            
-            file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-            try:
-                if file_extension == ".pdf":
-                    loader = PyPDFLoader(file_path)
-                    docs = loader.load()
-                    for doc in docs:
-                        doc.metadata["source"] = uploaded_file.name
-                        doc.metadata["file_type"] = "pdf"
-                    documents.extend(docs)
-                    file_details.append({"name": uploaded_file.name, "type": "pdf", "chunks": len(docs)})
-                elif file_extension == ".txt":
-                    loader = TextLoader(file_path)
-                    docs = loader.load()
-                    for doc in docs:
-                        doc.metadata["source"] = uploaded_file.name
-                        doc.metadata["file_type"] = "txt"
-                    documents.extend(docs)
-                    file_details.append({"name": uploaded_file.name, "type": "txt", "chunks": len(docs)})
-                elif file_extension == ".csv":
-                    loader = CSVLoader(file_path)
-                    docs = loader.load()
-                    for doc in docs:
-                        doc.metadata["source"] = uploaded_file.name
-                        doc.metadata["file_type"] = "csv"
-                    documents.extend(docs)
-                    file_details.append({"name": uploaded_file.name, "type": "csv", "chunks": len(docs)})
-                else:
-                    if 'st' in globals():
-                        st.warning(f"Unsupported file format: {file_extension}")
-                
-                if 'st' in globals() and hasattr(st.session_state, 'debug_info'):
-                    st.session_state.debug_info += f"Loaded {len(docs)} documents from {uploaded_file.name}\n"
-            except Exception as e:
-                if 'st' in globals():
-                    st.error(f"Error processing {uploaded_file.name}: {str(e)}")
-                    if hasattr(st.session_state, 'debug_info'):
-                        st.session_state.debug_info += f"Error with {uploaded_file.name}: {str(e)}\n"
+            named_paths.append((file_path, uploaded_file.name))
         
-        if not documents:
-            return None, None
+        # Files (and page ranges of large PDFs) are parsed across PARSE_WORKERS processes
+        document_chunks, file_details, errors = parse_files(named_paths)
         
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        document_chunks = text_splitter.split_documents(documents)
+        for name, message in errors:
+            if 'st' in globals():
+                if message.startswith("Unsupported file format"):
+                    st.warning(message)
+                else:
+                    st.error(f"Error processing {name}: {message}")
+                if hasattr(st.session_state, 'debug_info'):
+                    st.session_state.debug_info += f"Error with {name}: {message}\n"
         
-        for i, chunk in enumerate(document_chunks):
-            if "source" not in chunk.metadata:
-                chunk.metadata["source"] = f"unknown_source_{i}"
-            chunk.metadata["chunk_index"] = i
+        if not document_chunks:
+            return None, None
         
         if 'st' in globals() and hasattr(st.session_state, 'debug_info'):
-            st.session_state.debug_info += f"Created {len(document_chunks)} chunks from {len(documents)} documents\n"
+            for detail in file_details:
+                st.session_state.debug_info += f"Loaded {detail['chunks']} documents from {detail['name']}\n"
+            st.session_state.debug_info += f"Created {len(document_chunks)} chunks from {sum(detail['chunks'] for detail in file_details)} documents\n"
             st.session_state.debug_info += f"File details: {str(file_details)}\n"
         
         return document_chunks, file_details
 
 def process_files_from_paths(file_paths):
-    documents = []
-    file_details = []
+    # Files (and page ranges of large PDFs) are parsed across PARSE_WORKERS processes
+    named_paths = [(file_path, os.path.basename(file_path)) for file_path in file_paths]
+    document_chunks, file_details, errors = parse_files(named_paths)
     
-    for file_path in file_paths:
-        file_name = os.path.basename(file_path)
-        file_extension = os.path.splitext(file_name)[1].lower()
-        try:
-            if file_extension == ".pdf":
-                loader = PyPDFLoader(file_path)
-                docs = loader.load()
-                for doc in docs:
-                    doc.metadata["source"] = file_name
-                    doc.metadata["file_type"] = "pdf"
-                documents.extend(docs)
-                file_details.append({"name": file_name, "type": "pdf", "chunks": len(docs)})
-            elif file_extension == ".txt":
-                loader = TextLoader(file_path)
-                docs = loader.load()
-                for doc in docs:
-                    doc.metadata["source"] = file_name
-                    doc.metadata["file_type"] = "txt"
-                documents.extend(docs)
-                file_details.append({"name": file_name, "type": "txt", "chunks": len(docs)})
-            elif file_extension == ".csv":
-                loader = CSVLoader(file_path)
-                docs = loader.load()
-                for doc in docs:
-                    doc.metadata["source"] = file_name
-                    doc.metadata["file_type"] = "csv"
-                documents.extend(docs)
-                file_details.append({"name": file_name, "type": "csv", "chunks": len(docs)})
-            else:
-                print(f"Unsupported file format: {file_extension}", file=sys.stderr)
-            
-            print(f"Loaded {len(docs)} documents from {file_name}")
-        except Exception as e:
-            print(f"Error processing {file_name}: {str(e)}", file=sys.stderr)
-    
-    if not documents:
+    if not document_chunks:
         return None, None
     
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    document_chunks = text_splitter.split_documents(documents)
-    
-    for i, chunk in enumerate(document_chunks):
-        if "source" not in chunk.metadata:
-            chunk.metadata["source"] = f"unknown_source_{i}"
-        chunk.metadata["chunk_index"] = i
-    
-    print(f"Created {len(document_chunks)} chunks from {len(documents)} documents")
+    print(f"Created {len(document_chunks)} chunks from {sum(detail['chunks'] for detail in file_details)} documents")
     print(f"File details: {str(file_details)}")
+    
     return document_chunks, file_details
 
-def store_documents_in_supabase(docs, mode="append"):
+def store_documents_in_supabase(docs, mode="append", upload_batch=None):
+    # Every chunk from one call shares an upload_batch id, so retrieval can be scoped to it
+    upload_batch = upload_batch or uuid.uuid4().hex
     try:
         supabase_url = get_env_var("SUPABASE_URL")
         supabase_key = get_env_var("SUPABASE_SERVICE_KEY")
@@ -155,78 +100,114 @@ def store_documents_in_supabase(docs, mode="append"):
         if mode == "replace":
             try:
                 print("Attempting to clear existing documents...")
-                response = supabase.table("documents").delete().neq("id", -1).execute()
+                response = clear_documents(supabase)
                 print(f"Successfully cleared existing documents. Response: {response}")
             except Exception as e:
                 print(f"Error clearing documents: {str(e)}", file=sys.stderr)
         
-        print(f"Generating embeddings for {len(docs)} documents...")
+        # Chunks already stored for the same source are skipped; cached vectors are reused
+        executor = get_embedding_executor(embeddings)
+        store = ContentAddressedStore(supabase, executor.embed, cache=get_document_embedding_cache())
+        new_docs, hashes = store.new_chunks(docs)
+        print(f"Generating embeddings for {len(new_docs)} of {len(docs)} documents (upload batch {upload_batch}); "
+              f"{len(docs) - len(new_docs)} already stored")
         
-        # Process documents in batches
+        # Process documents in batches; several embedding requests run at once under the rate limit
         batch_size = 50
-        total_batches = (len(docs) - 1) // batch_size + 1
+        total_batches = (len(new_docs) - 1) // batch_size + 1
+        batches = [
+            (new_docs[i:i+batch_size], hashes[i:i+batch_size])
+            for i in range(0, len(new_docs), batch_size)
+        ]
         
-        for i in range(0, len(docs), batch_size):
-            batch = docs[i:i+batch_size]
-            batch_num = i // batch_size + 1
-            print(f"Processing batch {batch_num}/{total_batches} ({len(batch)} chunks)...")
-            
-            # Generate embeddings for this batch
-            texts = [doc.page_content for doc in batch]
-            embeddings_list = embeddings.embed_documents(texts)
-            
-            # Prepare documents for insertion
-            documents_to_insert = []
-            for j, doc in enumerate(batch):
-                document_data = {
-                    # Don't include 'id' - let the database auto-generate it
-                    "content": doc.page_content,
-                    "metadata": doc.metadata if doc.metadata else {},
-                    "embedding": embeddings_list[j]
-                }
-                documents_to_insert.append(document_data)
+        # Inserts are sized by payload bytes and several run at once; a failed batch is retried in halves
+        writer = get_bulk_writer(store.insert, on_inserted=documents_inserted, lookup=store.stored_ids)
+        
+        try:
+            embedded = store.embed_batches(
+                ([doc.page_content for doc in batch] for batch, _ in batches),
+                executor.embed_batches,
+            )
+            for batch_num, ((batch, batch_hashes), embeddings_list) in enumerate(zip(batches, embedded), start=1):
+                print(f"Processing batch {batch_num}/{total_batches} ({len(batch)} chunks)...")
+                
+                # Prepare documents for insertion
+                writer.add(store.rows(batch, batch_hashes, embeddings_list, {"upload_batch": upload_batch}))
             
-            # Insert documents into Supabase
-            try:
-                response = supabase.table("documents").insert(documents_to_insert).execute()
-                print(f"Successfully stored batch {batch_num}: {len(response.data)} documents inserted")
-            except Exception as e:
-                print(f"Error inserting batch {batch_num}: {str(e)}", file=sys.stderr)
-                raise
+            failed = writer.flush()
+            print(f"Inserted {writer.inserted} documents in {writer.requests} requests")
+            if failed:
+                raise RuntimeError(f"{len(failed)} documents could not be inserted: {failed[0][1]}")
+            # Chunks already stored move to their position in this upload
+            new = {id(doc) for doc in new_docs}
+            moved = store.update_positions([doc for doc in docs if id(doc) not in new])
+            if moved:
+                documents_inserted(moved)
+        finally:
+            executor.close()
+            writer.close()
         
         # Create and return a vector store instance for querying
-        vector_store = SupabaseVectorStore(
+        vector_store = TopKSupabaseVectorStore(
             client=supabase,
             embedding=embeddings,
-            table_name="documents"
-            # Remove query_name since the function doesn't exist yet
+            table_name="documents",
+            query_name="match_documents"
         )
         
-        print(f"Successfully stored all {len(docs)} document chunks")
+        print(f"Successfully stored all {len(new_docs)} new document chunks")
         return vector_store
         
     except Exception as e:
         print(f"Error storing documents in Supabase: {str(e)}", file=sys.stderr)
         raise
 
+def ingest_files(named_paths, mode="append", upload_batch=None, columns=None):
+    """Parse, embed and store (path, display name) pairs as one stream.
+
+    Unlike process_files_from_paths + store_documents_in_supabase, embedding
+    and inserting start while later files are still being parsed, and only a
+    few batches are held in memory at a time. mode="sync" re-ingests
+    incrementally: unchanged files are skipped and changed ones only have
+    their stale chunks replaced. `columns` picks the CSV columns to embed
+    (default CSV_COLUMNS, else all).
+    """
+    supabase = create_client(get_env_var("SUPABASE_URL"), get_env_var("SUPABASE_SERVICE_KEY"))
+    embeddings = GoogleGenerativeAIEmbeddings(
+        model="models/embedding-001",
+        google_api_key=get_env_var("GEMINI_API_KEY"),
+    )
+    try:
+        return IngestPipeline(supabase, embeddings).run(named_paths, mode=mode, upload_batch=upload_batch, columns=columns)
+    except Exception as e:
+        print(f"Error storing documents in Supabase: {str(e)}", file=sys.stderr)
+        raise
+
+def ingest_uploaded_files(uploaded_files, mode="append", columns=None):
+    """ingest_files for Streamlit uploads."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        named_paths = []
+        for uploaded_file in uploaded_files:
+            file_path = os.path.join(temp_dir, uploaded_file.name)
+            with open(file_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
+            named_paths.append((file_path, uploaded_file.name))
+        return ingest_files(named_paths, mode=mode, columns=columns)
+
 def get_vector_store():
     try:
         supabase_url = get_env_var("SUPABASE_URL")
         supabase_key = get_env_var("SUPABASE_SERVICE_KEY")
         supabase = create_client(supabase_url, supabase_key)
         
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=get_env_var("GEMINI_API_KEY"),
-        )
+        embeddings = get_cached_embeddings(get_env_var("GEMINI_API_KEY"))
         
-        # Create a simple vector store without the match_documents function
-        # We'll handle similarity search manually in the agent tools
-        vector_store = SupabaseVectorStore(
+        # match_documents takes match_count, so k is applied server-side
+        vector_store = TopKSupabaseVectorStore(
             client=supabase,
             embedding=embeddings,
-            table_name="documents"
-            # Remove query_name since the function doesn't exist
+            table_name="documents",
+            query_name="match_documents"
         )
         print("Vector store initialized successfully.")
         return vector_store
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+EMBEDDING_MODEL = "models/embedding-001"
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a query, used as the cache key."""
+    return " ".join(text.split()).casefold()
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that caches query vectors.
+
+    Lookups go through a bounded in-memory LRU with a per-entry TTL, then an
+    optional SQLite file shared across restarts and processes. Keys combine the
+    model name with the normalized query text. Document embeddings are passed
+    straight through, since ingestion rarely repeats a chunk.
+    """
+
+    def __init__(self, embeddings, model_name=EMBEDDING_MODEL, max_size=1024, ttl=3600, persist_path=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB, created REAL)"
+            )
+            self._db.commit()
+
+    def _key(self, text):
+        return f"{self.model_name}\x00{normalize_text(text)}"
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, created = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return vector
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector, created FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self._remember(key, vector, row[1])
+                    return vector
+        return None
+
+    def _remember(self, key, vector, created):
+        self._entries[key] = (vector, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def embed_query(self, text):
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        created = time.time()
+        with self._lock:
+            self._remember(key, vector, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector, created) VALUES (?, ?, ?)",
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), created),
+                )
+                self._db.commit()
+        return vector
+
+    def embed_queries(self, texts):
+        """Embed several queries, sending every cache miss in a single embed_documents call."""
+        keys = [self._key(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if not missing:
+            return vectors
+
+        missing_texts = [texts[i] for i in missing]
+        if isinstance(self.embeddings, GoogleGenerativeAIEmbeddings):
+            # Same task type embed_query uses, so batched and single query vectors match
+            embedded = self.embeddings.embed_documents(missing_texts, task_type="RETRIEVAL_QUERY")
+        else:
+            embedded = self.embeddings.embed_documents(missing_texts)
+        created = time.time()
+        with self._lock:
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                self._remember(keys[i], vector, created)
+                if self._db is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (key, vector, created) VALUES (?, ?, ?)",
+                        (keys[i], np.asarray(vector, dtype=np.float32).tobytes(), created),
+                    )
+            if self._db is not None:
+                self._db.commit()
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+_cached_embeddings = None
+_cached_embeddings_lock = threading.Lock()
+
+def get_cached_embeddings(google_api_key):
+    """Return the process-wide cached Gemini embeddings.
+
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL (seconds) and EMBEDDING_CACHE_PATH
+    (SQLite file) configure the cache.
+    """
+    global _cached_embeddings
+    with _cached_embeddings_lock:
+        if _cached_embeddings is None:
+            _cached_embeddings = CachedEmbeddings(
+                GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=google_api_key),
+                max_size=int(os.environ.get("EMBEDDING_CACHE_SIZE", 1024)),
+                ttl=float(os.environ.get("EMBEDDING_CACHE_TTL", 3600)),
+                persist_path=os.environ.get("EMBEDDING_CACHE_PATH") or None,
+            )
+    return _cached_embeddings
@@ -0,0 +1,171 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_RETRYABLE_MESSAGE = re.compile(
+    r"\b(429|500|502|503|504)\b|resource.?exhausted|rate.?limit|quota|unavailable|deadline.?exceeded",
+    re.IGNORECASE,
+)
+
+def is_retryable(error):
+    """True for rate-limit (429) and server (5xx) errors, looking through wrapped causes.
+
+    langchain_google_genai re-raises API errors as GoogleGenerativeAIError, so
+    the status is read from the original exception's `code`/`status_code` when
+    it is chained, and from the message otherwise.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        for attr in ("code", "status_code"):
+            value = getattr(error, attr, None)
+            if isinstance(value, int):
+                return value in RETRYABLE_STATUS
+        response = getattr(error, "response", None)
+        if isinstance(getattr(response, "status_code", None), int):
+            return response.status_code in RETRYABLE_STATUS
+        if _RETRYABLE_MESSAGE.search(str(error)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Process-wide embedding request limiter (EMBED_REQUESTS_PER_MINUTE, default 1500).
+
+    The Gemini quota is per API key, so every executor in the process shares it.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            per_minute = float(os.environ.get("EMBED_REQUESTS_PER_MINUTE", 1500))
+            # Allow about a second's worth of burst
+            _rate_limiter = TokenBucket(per_minute / 60, capacity=max(1.0, per_minute / 60))
+    return _rate_limiter
+
+class EmbeddingExecutor:
+    """Runs embed_documents calls concurrently under the Gemini rate limit.
+
+    Texts are split into requests of the current batch size and up to
+    `max_in_flight` requests run at once, each taking a token from the shared
+    bucket first. 429 and 5xx errors are retried up to `max_retries` times with
+    full-jitter exponential backoff. The batch size adapts: it halves after a
+    retryable error, shrinks when a request takes longer than
+    `target_latency` seconds and grows again while requests stay under it.
+    """
+
+    def __init__(self, embeddings, rate_limiter=None, max_in_flight=4, batch_size=50, min_batch_size=5,
+                 max_batch_size=100, target_latency=5.0, max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        self.embeddings = embeddings
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+
+    def _adapt(self, latency=None, throttled=False):
+        with self._lock:
+            if throttled:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif latency > self.target_latency:
+                self.batch_size = max(self.min_batch_size, int(self.batch_size * 0.75))
+            else:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 10))
+
+    def _embed_request(self, texts):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            start = time.monotonic()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self._adapt(throttled=True)
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                with self._lock:
+                    self.retries += 1
+                print(f"Embedding request for {len(texts)} texts failed ({str(e)}), retrying in {delay:.1f}s", file=sys.stderr)
+                time.sleep(delay)
+                continue
+            with self._lock:
+                self.requests += 1
+            self._adapt(latency=time.monotonic() - start)
+            return vectors
+
+    def submit(self, texts):
+        """Start embedding `texts`; returns the request futures, in text order."""
+        futures = []
+        start = 0
+        while start < len(texts):
+            size = self.batch_size
+            futures.append(self._pool.submit(self._embed_request, texts[start:start + size]))
+            start += size
+        return futures
+
+    def embed(self, texts):
+        """Embed `texts`, running its requests concurrently; returns vectors in order."""
+        return [vector for future in self.submit(list(texts)) for vector in future.result()]
+
+    def embed_batches(self, batches):
+        """Yield the vectors for each batch of texts in order, keeping several batches in flight."""
+        pending = deque()
+        for texts in batches:
+            pending.append(self.submit(list(texts)))
+            while sum(len(futures) for futures in pending) > self.max_in_flight:
+                yield [vector for future in pending.popleft() for vector in future.result()]
+        while pending:
+            yield [vector for future in pending.popleft() for vector in future.result()]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+def get_embedding_executor(embeddings):
+    """EmbeddingExecutor configured from EMBED_* environment variables."""
+    return EmbeddingExecutor(
+        embeddings,
+        max_in_flight=int(os.environ.get("EMBED_MAX_IN_FLIGHT", 4)),
+        batch_size=int(os.environ.get("EMBED_BATCH_SIZE", 50)),
+        max_batch_size=int(os.environ.get("EMBED_MAX_BATCH_SIZE", 100)),
+        target_latency=float(os.environ.get("EMBED_TARGET_LATENCY_MS", 5000)) / 1000,
+        max_retries=int(os.environ.get("EMBED_MAX_RETRIES", 5)),
+    )
@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import numpy as np
+
+try:
+    from .vector_index import parse_embedding
+    from .quantization import ScalarQuantizer, CODES_FILE, QUANTIZER_FILE
+except ImportError:
+    from vector_index import parse_embedding
+    from quantization import ScalarQuantizer, CODES_FILE, QUANTIZER_FILE
+
+SEGMENT_VERSION = 1
+
+# Files that make up a segment directory
+_HEADER = "segment.json"
+_VECTORS = "vectors.bin"
+_IDS = "ids.npy"
+_OFFSETS = "offsets.npy"
+_RECORDS = "records.bin"
+
+def write_segment(path, rows, dtype="float32", change_seq=None):
+    """Stream documents rows ({"id", "content", "metadata", "embedding"}) into a segment directory.
+
+    Vectors are L2-normalized and appended to a raw float32/float16 file as they
+    arrive, so memory stays flat regardless of corpus size. The segment is
+    written to a sibling temp directory and swapped into place at the end.
+
+    `change_seq`, the document_changes position read before `rows` were
+    scanned, is kept in the header so the segment can later be reconciled
+    from the changes logged since.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype("float32"), np.dtype("float16")):
+        raise ValueError(f"Unsupported segment dtype: {dtype}")
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    ids = []
+    offsets = [0]
+    dim = None
+    with open(os.path.join(tmp_path, _VECTORS), "wb") as vectors_file, \
+            open(os.path.join(tmp_path, _RECORDS), "wb") as records_file:
+        for row in rows:
+            if row.get("id") is None or row.get("embedding") is None:
+                continue
+            vector = parse_embedding(row["embedding"])
+            if dim is None:
+                dim = vector.shape[0]
+            elif vector.shape[0] != dim:
+                raise ValueError(f"Embedding for {row['id']} has dimension {vector.shape[0]}, expected {dim}")
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+            vectors_file.write(vector.astype(dtype).tobytes())
+
+            record = json.dumps({"content": row.get("content", ""), "metadata": row.get("metadata") or {}}).encode("utf-8")
+            records_file.write(record)
+            offsets.append(offsets[-1] + len(record))
+            ids.append(str(row["id"]))
+
+    np.save(os.path.join(tmp_path, _IDS), np.array(ids, dtype="S"))
+    np.save(os.path.join(tmp_path, _OFFSETS), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_path, _HEADER), "w") as f:
+        json.dump({"version": SEGMENT_VERSION, "count": len(ids), "dim": dim or 0, "dtype": dtype.name,
+                   "change_seq": change_seq}, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return len(ids)
+
+class EmbeddingSegment:
+    """Read-only, memory-mapped view of a segment written by write_segment.
+
+    Opening a segment only reads the small header; vectors, ids, offsets and
+    records are mmapped, so the OS page cache is shared between processes.
+
+    If the segment has been through quantize_segment, searches scan the 8-bit
+    codes instead and re-score the best `rescore_k` candidates against the
+    full-precision vectors, which then only need to be paged in for those rows.
+    """
+
+    def __init__(self, path, rescore_k=200, quantized=True):
+        self.path = path
+        self.rescore_k = rescore_k
+        with open(os.path.join(path, _HEADER)) as f:
+            header = json.load(f)
+        if header.get("version") != SEGMENT_VERSION:
+            raise ValueError(f"Unsupported segment version {header.get('version')} in {path}")
+        self.count = header["count"]
+        self.dim = header["dim"]
+        self.dtype = np.dtype(header["dtype"])
+        # None for segments built without the change log
+        self.change_seq = header.get("change_seq")
+
+        if self.count:
+            self.vectors = np.memmap(os.path.join(path, _VECTORS), dtype=self.dtype, mode="r", shape=(self.count, self.dim))
+            self._records = np.memmap(os.path.join(path, _RECORDS), dtype=np.uint8, mode="r")
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=self.dtype)
+            self._records = np.zeros(0, dtype=np.uint8)
+        self._ids = np.load(os.path.join(path, _IDS), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, _OFFSETS), mmap_mode="r")
+
+        self.codes = None
+        self.quantizer = None
+        if quantized and self.count and os.path.exists(os.path.join(path, CODES_FILE)):
+            self.codes = np.memmap(os.path.join(path, CODES_FILE), dtype=np.uint8, mode="r", shape=(self.count, self.dim))
+            self.quantizer = ScalarQuantizer.load(os.path.join(path, QUANTIZER_FILE))
+
+    def __len__(self):
+        return self.count
+
+    def id_at(self, pos):
+        return self._ids[pos].decode("ascii")
+
+    def row_at(self, pos):
+        start, end = int(self._offsets[pos]), int(self._offsets[pos + 1])
+        record = json.loads(bytes(self._records[start:end]).decode("utf-8"))
+        return {"id": self.id_at(pos), "content": record["content"], "metadata": record["metadata"]}
+
+    def positions_by_id(self):
+        """Map every id to its row position. O(n), so only built when a delete needs it."""
+        return {self.id_at(pos): pos for pos in range(self.count)}
+
+    def search_batch(self, queries, k, alive=None, block_rows=65536):
+        """Top-k (score, position) pairs per query over the segment.
+
+        Scans the mmapped matrix in blocks so float16 segments and 8-bit codes
+        are upcast a block at a time rather than materialized in full.
+        `alive` masks deleted rows.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.codes is None:
+            scores, positions = self._blocked_top_k(
+                lambda start, end: queries @ np.asarray(self.vectors[start:end], dtype=np.float32).T,
+                len(queries), k, alive, block_rows,
+            )
+        else:
+            scores, positions = self._blocked_top_k(
+                lambda start, end: self.quantizer.scores(queries, self.codes[start:end]),
+                len(queries), max(k, self.rescore_k), alive, block_rows,
+            )
+            scores, positions = self._rescore(queries, positions, scores, k)
+
+        results = []
+        for row_scores, row_positions in zip(scores, positions):
+            order = np.argsort(-row_scores)
+            results.append([(float(row_scores[i]), int(row_positions[i])) for i in order if np.isfinite(row_scores[i])])
+        return results
+
+    def _blocked_top_k(self, score_block, n_queries, k, alive, block_rows):
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+        best_positions = np.zeros((n_queries, 0), dtype=np.int64)
+
+        for start in range(0, self.count, block_rows):
+            end = min(start + block_rows, self.count)
+            scores = score_block(start, end)
+            if alive is not None:
+                scores[:, ~alive[start:end]] = -np.inf
+            take = min(k, end - start)
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_positions = np.concatenate([best_positions, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_positions = np.take_along_axis(best_positions, keep, axis=1)
+        return best_scores, best_positions
+
+    def _rescore(self, queries, positions, approx_scores, k):
+        """Replace approximate scores with exact ones for the candidates and keep the top k."""
+        exact_scores = np.full(approx_scores.shape, -np.inf, dtype=np.float32)
+        for i, (query, row_positions) in enumerate(zip(queries, positions)):
+            valid = np.isfinite(approx_scores[i])
+            # Sorted positions keep the mmap reads sequential
+            order = np.argsort(row_positions[valid])
+            candidates = row_positions[valid][order]
+            vectors = np.asarray(self.vectors[candidates], dtype=np.float32)
+            row_exact = np.full(len(row_positions), -np.inf, dtype=np.float32)
+            row_exact[np.flatnonzero(valid)[order]] = vectors @ query
+            exact_scores[i] = row_exact
+
+        take = min(k, exact_scores.shape[1])
+        keep = np.argpartition(-exact_scores, take - 1, axis=1)[:, :take]
+        return np.take_along_axis(exact_scores, keep, axis=1), np.take_along_axis(positions, keep, axis=1)
@@ -0,0 +1,181 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+try:
+    from .corpus_sync import get_corpus_version
+    from .metadata_filter import get_scoped_filter, merge_filters
+except ImportError:
+    from corpus_sync import get_corpus_version
+    from metadata_filter import get_scoped_filter, merge_filters
+
+# Shared by every retriever instance so each query doesn't spin up its own threads
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-retriever")
+
+def doc_key(doc):
+    """Identity used to match the same chunk across result lists."""
+    return doc.id or doc.page_content
+
+def reciprocal_rank_fusion(ranked_lists, weights=None, rrf_k=60, limit=None):
+    """Fuse ranked document lists with weighted RRF: sum(w / (rrf_k + rank)).
+
+    Returns (document, fused_score) pairs, best first.
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    scores = {}
+    docs = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(ranked, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if limit is not None:
+        fused = fused[:limit]
+    return [(docs[key], score) for key, score in fused]
+
+def candidate_count(post_processors, k):
+    """How many first-stage candidates a post-processor chain needs to return k results."""
+    if not post_processors:
+        return k
+    return max(k, post_processors[0].fetch_k or k)
+
+def run_post_processors(post_processors, query, results, k):
+    """Run post-processors in order, each narrowing to what the next one fetches.
+
+    Returns (results, complete); a failing stage is skipped and reported as incomplete.
+    """
+    complete = True
+    for i, processor in enumerate(post_processors):
+        limit = candidate_count(post_processors[i + 1:], k)
+        try:
+            results = processor.process(query, results, limit)
+        except Exception as e:
+            complete = False
+            print(f"Retriever post-processor {type(processor).__name__} failed: {str(e)}", file=sys.stderr)
+    return results[:k], complete
+
+class HybridRetriever(BaseRetriever):
+    """Runs BM25 and vector search concurrently and fuses them with RRF.
+
+    `post_processors` (objects with `process(query, results, k)` and a
+    `fetch_k`) then run in order over the fused candidates, e.g. MMR and
+    reranking; each stage narrows to the next stage's fetch_k.
+    """
+
+    lexical_index: Any
+    vector_store: Any
+    vector_index: Any = None
+    cache: Any = None
+    k: int = 8
+    fetch_k: int = 20
+    lexical_weight: float = 1.0
+    vector_weight: float = 1.0
+    rrf_k: int = 60
+    post_processors: List[Any] = []
+
+    def _lexical_search_many(self, queries, fetch_k, filter):
+        return [
+            [
+                Document(id=str(row["id"]), page_content=row["content"], metadata=row["metadata"])
+                for _, row in self.lexical_index.search(query, k=fetch_k, filter=filter)
+            ]
+            for query in queries
+        ]
+
+    def _embed_queries(self, queries):
+        embeddings = self.vector_store.embeddings
+        if hasattr(embeddings, "embed_queries"):
+            return embeddings.embed_queries(queries)
+        return [embeddings.embed_query(query) for query in queries]
+
+    def _vector_search_many(self, queries, fetch_k, filter):
+        query_vectors = self._embed_queries(queries)
+        if not filter and self.vector_index is not None and len(self.vector_index) > 0:
+            # Local mirror: one matmul for every query, no match_documents round trip
+            return [
+                [
+                    Document(id=str(row["id"]), page_content=row["content"], metadata=row["metadata"])
+                    for _, row in hits
+                ]
+                for hits in self.vector_index.search_batch(query_vectors, k=fetch_k)
+            ]
+        # A filter is applied by match_documents through the metadata GIN index before ranking
+        if len(query_vectors) == 1:
+            results = [self.vector_store.similarity_search_by_vector_with_relevance_scores(
+                query_vectors[0], k=fetch_k, filter=filter
+            )]
+        else:
+            results = self.vector_store.similarity_search_many_by_vectors(query_vectors, fetch_k, filter=filter)
+        return [[doc for doc, _ in result] for result in results]
+
+    def search(self, query, k=None, filter=None):
+        """Return up to k (document, score) pairs for the query, scored by the last stage that ran.
+
+        `filter` restricts both legs to chunks whose metadata contains it; a
+        filter scoped to the current request (see scoped_filter) takes precedence.
+        """
+        return self.retrieve_many([query], k=k, filter=filter)[0]
+
+    def retrieve_many(self, queries, k=None, filter=None):
+        """Run several queries together and return one search() result list per query.
+
+        Cache misses are embedded with one call and searched with one batched
+        similarity query (none with the local vector index). Post-processing
+        then runs per query but only against in-process state: MMR takes its
+        vectors from the local vector index and neighbour expansion resolves
+        positions in the BM25 index, so it adds no round trips of its own.
+        """
+        k = k or self.k
+        filter = merge_filters(get_scoped_filter(), filter)
+        results = [None] * len(queries)
+        if self.cache is not None:
+            results = [self.cache.get(query, k, filter=filter) for query in queries]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        version = get_corpus_version()
+        pending_queries = [queries[i] for i in pending]
+
+        # Post-processors pick from a wider fused candidate set than k
+        candidate_k = candidate_count(self.post_processors, k)
+        fetch_k = max(self.fetch_k, candidate_k)
+        legs = [
+            (_executor.submit(self._lexical_search_many, pending_queries, fetch_k, filter), self.lexical_weight, "lexical"),
+            (_executor.submit(self._vector_search_many, pending_queries, fetch_k, filter), self.vector_weight, "vector"),
+        ]
+
+        leg_results, weights = [], []
+        for future, weight, name in legs:
+            try:
+                leg_results.append(future.result())
+                weights.append(weight)
+            except Exception as e:
+                # One failing leg shouldn't sink the query; the other still has results
+                print(f"Hybrid retriever {name} search failed: {str(e)}", file=sys.stderr)
+
+        def finish(j):
+            fused = reciprocal_rank_fusion(
+                [ranked[j] for ranked in leg_results], weights, rrf_k=self.rrf_k, limit=candidate_k
+            )
+            return run_post_processors(self.post_processors, pending_queries[j], fused, k)
+
+        if len(pending) == 1:
+            finished = [finish(0)]
+        else:
+            finished = list(_executor.map(finish, range(len(pending))))
+
+        for i, (result, complete) in zip(pending, finished):
+            results[i] = result
+            # Don't pin a partial result set when a leg or post-processor failed
+            if self.cache is not None and complete and len(leg_results) == len(legs):
+                self.cache.put(queries[i], k, result, filter=filter, version=version)
+        return results
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [doc for doc, _ in self.search(query)]
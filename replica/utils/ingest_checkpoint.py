@@ -0,0 +1,111 @@
+import json
+import os
+import sys
+import threading
+from collections import defaultdict
+
+def checkpoint_path():
+    """Where ingest_in_db.py keeps its checkpoint (INGEST_CHECKPOINT_PATH, default .ingest_checkpoint.jsonl)."""
+    return os.environ.get("INGEST_CHECKPOINT_PATH", ".ingest_checkpoint.jsonl")
+
+def discard_checkpoint(path=None):
+    """Delete the checkpoint file, e.g. after the documents table was cleared."""
+    path = path or checkpoint_path()
+    if os.path.exists(path):
+        os.remove(path)
+
+class IngestCheckpoint:
+    """Local, append-only record of ingestion progress for resuming a bulk load.
+
+    Each line of the JSON-lines file is one event: a run started (with its
+    mode), or for a source, content hashes of chunks now stored, the file
+    finished (with its fingerprint), or the file's progress discarded. Lines are flushed and fsynced as they are
+    written, so a crash loses at most the batch in flight; a truncated last
+    line is ignored on load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stored = defaultdict(set)
+        self._done = {}
+        self._run = None
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    print(f"Ignoring a truncated line in {self.path}", file=sys.stderr)
+                    continue
+                self._apply(entry)
+
+    def _apply(self, entry):
+        if "run" in entry:
+            self._run = entry["run"]
+            return
+        source = entry["source"]
+        if "stored" in entry:
+            self._stored[source].update(entry["stored"])
+        elif "done" in entry:
+            self._done[source] = entry["done"]
+            self._stored.pop(source, None)
+        elif entry.get("forget"):
+            self._done.pop(source, None)
+            self._stored.pop(source, None)
+
+    def _append(self, entry):
+        self._apply(entry)
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start_run(self, mode):
+        with self._lock:
+            self._append({"run": mode})
+
+    def interrupted_run(self):
+        """Mode of the run this checkpoint was left behind by, or None if there is nothing to resume."""
+        with self._lock:
+            return self._run
+
+    def is_done(self, source, fingerprint):
+        """True if `source` was fully ingested with this fingerprint."""
+        with self._lock:
+            return fingerprint is not None and self._done.get(source) == fingerprint
+
+    def stored_hashes(self, source):
+        """Content hashes of `source`'s chunks stored by an unfinished earlier run."""
+        with self._lock:
+            return set(self._stored.get(source, ()))
+
+    def record(self, source, hashes):
+        with self._lock:
+            new = sorted(set(hashes) - self._stored.get(source, set()))
+            if new:
+                self._append({"source": source, "stored": new})
+
+    def mark_done(self, source, fingerprint):
+        with self._lock:
+            self._append({"source": source, "done": fingerprint})
+
+    def forget(self, source):
+        with self._lock:
+            self._append({"source": source, "forget": True})
+
+    def reset(self):
+        """Discard all progress, e.g. after the documents table was cleared."""
+        with self._lock:
+            self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._stored.clear()
+            self._done.clear()
+            self._run = None
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,380 @@
+import os
+import queue
+import sys
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+
+try:
+    from .corpus_sync import clear_documents, documents_inserted, documents_deleted
+    from .embedding_executor import get_embedding_executor
+    from .content_store import ContentAddressedStore, chunk_hash, get_document_embedding_cache, position_metadata
+    from .source_manifest import SourceManifest, file_fingerprint
+    from .bulk_writer import get_bulk_writer
+    from .parallel_parsing import FILE_TYPES, csv_columns, csv_mode, deadline_pool, needs_page_deadline, parse_task, parse_workers as default_parse_workers, plan_parse_tasks, stream_task, CHUNK_OVERLAP
+except ImportError:
+    from corpus_sync import clear_documents, documents_inserted, documents_deleted
+    from embedding_executor import get_embedding_executor
+    from content_store import ContentAddressedStore, chunk_hash, get_document_embedding_cache, position_metadata
+    from source_manifest import SourceManifest, file_fingerprint
+    from bulk_writer import get_bulk_writer
+    from parallel_parsing import FILE_TYPES, csv_columns, csv_mode, deadline_pool, needs_page_deadline, parse_task, parse_workers as default_parse_workers, plan_parse_tasks, stream_task, CHUNK_OVERLAP
+
+_DONE = object()
+
+def _env_int(key, default):
+    return int(os.environ.get(key) or default)
+
+class IngestPipeline:
+    """Streaming parse -> split -> embed -> insert ingestion.
+
+    Parse tasks run in a process pool, at most `parse_workers` * 2 in flight.
+    Their chunks are released in task order (so chunk_index matches a serial
+    run), grouped into `batch_size` batches and passed through two bounded
+    queues to `embed_workers` embedding threads and an insert thread.
+    Embedding threads share one EmbeddingExecutor, which applies the Gemini
+    rate limit, retries and batch sizing; the insert thread feeds a
+    BulkWriter, which sizes inserts by bytes and keeps several in flight. Chunks whose content_hash is
+    already stored are dropped before embedding (see ContentAddressedStore).
+    A full queue blocks the stage feeding it, so a slow stage slows
+    the ones upstream instead of letting chunks pile up in memory.
+
+    With an IngestCheckpoint, every stored batch is recorded locally as it
+    lands and every finished file once it completes, so a rerun after a
+    failure skips finished files and the chunks already stored from
+    unfinished ones without calling the database or the embedding API. A run
+    that completes without failures empties the checkpoint.
+
+    Each ingested file's fingerprint and chunk hashes are recorded in the
+    SourceManifest. With mode="sync", files whose fingerprint is unchanged are
+    not even parsed, and a changed file only loses the chunks that are no
+    longer in it.
+    """
+
+    def __init__(self, supabase_client, embeddings, table_name="documents", batch_size=50,
+                 parse_workers=None, embed_workers=None, queue_size=None, cache=None, chunk_overlap=CHUNK_OVERLAP):
+        self.supabase = supabase_client
+        self.embeddings = embeddings
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.parse_workers = parse_workers or default_parse_workers()
+        self.embed_workers = embed_workers or _env_int("INGEST_EMBED_WORKERS", 4)
+        self.queue_size = queue_size or _env_int("INGEST_QUEUE_SIZE", 4)
+        self.cache = cache if cache is not None else get_document_embedding_cache()
+        self.manifest = SourceManifest(supabase_client, documents_table=table_name)
+        self.chunk_overlap = chunk_overlap
+
+    def _parsed_in_order(self, tasks, stop, columns=None):
+        """Yield parse_task results in task order with a bounded number of tasks in flight.
+
+        Grouped CSVs are read here, in this process, a group of chunks at a
+        time (see stream_task), so however large the file, only what the
+        queues hold is in memory; the pool keeps parsing the next tasks meanwhile.
+        """
+        if self.parse_workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.parse_workers, len(tasks))) as pool:
+                yield from self._parsed_in_pool(pool, tasks, stop, columns)
+        elif needs_page_deadline(tasks):
+            # A PDF page timeout needs a worker's main thread; reuse the shared pool rather than forking one
+            yield from self._parsed_in_pool(deadline_pool(), tasks, stop, columns)
+        else:
+            for task in tasks:
+                for result in stream_task(task, columns, chunk_overlap=self.chunk_overlap):
+                    if stop.is_set():
+                        return
+                    yield result
+
+    def _parsed_in_pool(self, pool, tasks, stop, columns):
+        def inline(task):
+            return task[3] == "csv" and csv_mode() == "grouped"
+
+        def submit(task):
+            return task if inline(task) else pool.submit(parse, task)
+
+        window = self.parse_workers * 2
+        parse = partial(parse_task, columns=columns, chunk_overlap=self.chunk_overlap)
+        pending = [submit(task) for task in tasks[:window]]
+        next_task = len(pending)
+        while pending:
+            if stop.is_set():
+                for future in pending:
+                    if isinstance(future, Future):
+                        future.cancel()
+                return
+            head = pending.pop(0)
+            if next_task < len(tasks):
+                pending.append(submit(tasks[next_task]))
+                next_task += 1
+            if isinstance(head, Future):
+                yield head.result()
+                continue
+            for result in stream_task(head, columns, chunk_overlap=self.chunk_overlap):
+                if stop.is_set():
+                    break
+                yield result
+
+    def _record_stored(self, checkpoint, sources_and_hashes):
+        by_source = {}
+        for source, key in sources_and_hashes:
+            by_source.setdefault(source, []).append(key)
+        for source, hashes in by_source.items():
+            checkpoint.record(source, hashes)
+
+    def _embed_stage(self, store, embed_queue, insert_queue, stop, errors, stats, lock, checkpoint, kept):
+        while True:
+            batch = embed_queue.get()
+            if batch is _DONE:
+                return
+            if stop.is_set():
+                continue
+            try:
+                docs, hashes = store.new_chunks(batch)
+                if len(docs) < len(batch):
+                    new = set(hashes)
+                    stored = [
+                        (doc, key)
+                        for doc, key in ((doc, chunk_hash(doc.page_content, doc.metadata["source"])) for doc in batch)
+                        if key not in new
+                    ]
+                    with lock:
+                        stats["skipped"] += len(stored)
+                        kept.update((key, position_metadata(doc.metadata)) for doc, key in stored)
+                    if checkpoint is not None:
+                        self._record_stored(checkpoint, [(doc.metadata["source"], key) for doc, key in stored])
+                if docs:
+                    vectors = store.embed([doc.page_content for doc in docs])
+                    insert_queue.put((docs, hashes, vectors))
+            except Exception as e:
+                errors.append(f"Embedding failed: {str(e)}")
+                stop.set()
+
+    def _insert_stage(self, writer, store, insert_queue, upload_batch, stop, errors):
+        while True:
+            item = insert_queue.get()
+            if item is _DONE:
+                break
+            if stop.is_set():
+                continue
+            docs, hashes, vectors = item
+            try:
+                writer.add(store.rows(docs, hashes, vectors, {"upload_batch": upload_batch}))
+            except Exception as e:
+                errors.append(f"Insert failed: {str(e)}")
+                stop.set()
+        failed = writer.flush()
+        if failed:
+            errors.append(f"Insert failed for {len(failed)} chunks: {failed[0][1]}")
+
+    def _delete_file_rows(self, upload_batch, name):
+        """Remove whatever was already stored for a file that later failed to parse."""
+        response = (
+            self.supabase.table(self.table_name)
+            .delete()
+            .eq("metadata->>upload_batch", upload_batch)
+            .eq("metadata->>source", name)
+            .execute()
+        )
+        if response.data:
+            documents_deleted([row["id"] for row in response.data])
+
+    def _fingerprint(self, path):
+        try:
+            return file_fingerprint(path)
+        except OSError:
+            # Let the parser report the error for this file
+            return None
+
+    def _update_manifests(self, store, named_paths, fingerprints, file_hashes, manifests, mode, kept):
+        """Record each ingested file's manifest; in sync mode also drop its stale chunks.
+
+        Chunks that were already stored (`kept`, content_hash -> position) move
+        to their position in the file as ingested now. When appending, chunks
+        the file no longer has stay stored but leave its neighbour chain.
+        """
+        deleted = []
+        for file_index, hashes in file_hashes.items():
+            name = named_paths[file_index][1]
+            old_hashes = manifests.get(name, {}).get("chunk_hashes", [])
+            if mode == "sync":
+                deleted.extend(self.manifest.remove_stale(name, old_hashes, hashes))
+            else:
+                current = set(hashes)
+                kept.update((key, {"chunk_index": None, "page": None}) for key in old_hashes if key not in current)
+                # Appending keeps the old chunks, so the manifest keeps listing them
+                hashes = list(dict.fromkeys(old_hashes + hashes))
+            self.manifest.save(name, fingerprints[file_index], hashes)
+        if deleted:
+            documents_deleted(deleted)
+        if kept:
+            moved = store.update_metadata(kept)
+            if moved:
+                documents_inserted(moved)
+        return len(deleted)
+
+    def run(self, named_paths, mode="append", upload_batch=None, checkpoint=None, columns=None):
+        """Ingest (path, display name) pairs.
+
+        `mode` is "append", "replace" (clear the table first) or "sync"
+        (incremental: skip unchanged files, replace only the changed chunks of
+        the others). Returns {"upload_batch", "chunks", "skipped", "deleted",
+        "unchanged", "file_details", "errors"}; "skipped" counts chunks that
+        were already stored, "deleted" stale chunks removed in sync mode,
+        "unchanged" names files left alone, and errors lists (name, message)
+        for files left out. Raises if embedding or inserting fails, as
+        store_documents_in_supabase does; with a `checkpoint`, the work done
+        so far is kept for the next run. `columns` limits which CSV columns
+        are embedded (default CSV_COLUMNS).
+        """
+        upload_batch = upload_batch or uuid.uuid4().hex
+        if mode == "replace" and checkpoint is not None and checkpoint.interrupted_run() == "replace":
+            # The table was cleared by the run being resumed; clearing again would lose its progress
+            print("Resuming an interrupted replace run; keeping the chunks it already stored")
+            manifests = {}
+        elif mode == "replace":
+            print("Attempting to clear existing documents...")
+            # This run's own checkpoint is reset below rather than deleted
+            clear_documents(self.supabase, self.table_name, discard_ingest_checkpoint=False)
+            if checkpoint is not None:
+                checkpoint.reset()
+            manifests = {}
+        else:
+            manifests = self.manifest.get(name for _, name in named_paths)
+
+        if checkpoint is not None and checkpoint.interrupted_run() != mode:
+            checkpoint.start_run(mode)
+
+        unchanged = []
+        fingerprints = []
+        pending_paths = []
+        for path, name in named_paths:
+            fingerprint = self._fingerprint(path)
+            if mode == "sync" and fingerprint is not None and manifests.get(name, {}).get("fingerprint") == fingerprint:
+                unchanged.append(name)
+                continue
+            if checkpoint is not None and checkpoint.is_done(name, fingerprint):
+                unchanged.append(name)
+                continue
+            fingerprints.append(fingerprint)
+            pending_paths.append((path, name))
+        if unchanged:
+            print(f"Skipping {len(unchanged)} unchanged files: {', '.join(unchanged)}")
+        named_paths = pending_paths
+
+        tasks = plan_parse_tasks(named_paths)
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        insert_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        stage_errors = []
+        stats = {"stored": 0, "skipped": 0}
+        # content_hash -> current position of chunks found already stored
+        kept = {}
+        lock = threading.Lock()
+        executor = get_embedding_executor(self.embeddings)
+        store = ContentAddressedStore(self.supabase, executor.embed, cache=self.cache, table_name=self.table_name)
+
+        embedders = [
+            threading.Thread(target=self._embed_stage, args=(store, embed_queue, insert_queue, stop, stage_errors, stats, lock, checkpoint, kept), daemon=True)
+            for _ in range(self.embed_workers)
+        ]
+
+        def on_inserted(rows):
+            documents_inserted(rows)
+            with lock:
+                stats["stored"] += len(rows)
+            print(f"Stored {len(rows)} chunks ({stats['stored']} so far)")
+            if checkpoint is not None:
+                self._record_stored(checkpoint, [(row["metadata"]["source"], row["content_hash"]) for row in rows])
+
+        writer = get_bulk_writer(store.insert, on_inserted=on_inserted, table_name=self.table_name, lookup=store.stored_ids)
+        inserter = threading.Thread(
+            target=self._insert_stage, args=(writer, store, insert_queue, upload_batch, stop, stage_errors), daemon=True
+        )
+        for thread in embedders + [inserter]:
+            thread.start()
+
+        chunk_index = {}
+        pages = {}
+        file_hashes = {}
+        failed = {}
+        batch = []
+        resumed = {name: checkpoint.stored_hashes(name) for _, name in named_paths} if checkpoint is not None else {}
+        try:
+            for file_index, loaded, chunks, error in self._parsed_in_order(tasks, stop, columns or csv_columns()):
+                if error is not None:
+                    failed.setdefault(file_index, error)
+                    continue
+                if file_index in failed:
+                    continue
+                pages[file_index] = pages.get(file_index, 0) + loaded
+                hashes = file_hashes.setdefault(file_index, [])
+                already_stored = resumed.get(named_paths[file_index][1], ())
+                for chunk in chunks:
+                    key = chunk_hash(chunk.page_content, chunk.metadata["source"])
+                    hashes.append(key)
+                    chunk.metadata["chunk_index"] = chunk_index.get(file_index, 0)
+                    chunk_index[file_index] = chunk.metadata["chunk_index"] + 1
+                    if key in already_stored:
+                        # Stored by an earlier, interrupted run
+                        with lock:
+                            stats["skipped"] += 1
+                            kept[key] = position_metadata(chunk.metadata)
+                        continue
+                    batch.append(chunk)
+                    if len(batch) == self.batch_size:
+                        # Blocks while the embedders are behind
+                        embed_queue.put(batch)
+                        batch = []
+            if batch and not stop.is_set():
+                embed_queue.put(batch)
+        finally:
+            for _ in embedders:
+                embed_queue.put(_DONE)
+            for thread in embedders:
+                thread.join()
+            insert_queue.put(_DONE)
+            inserter.join()
+            executor.close()
+            writer.close()
+
+        if stage_errors:
+            raise RuntimeError("; ".join(stage_errors))
+
+        errors = []
+        for file_index, message in sorted(failed.items()):
+            name = named_paths[file_index][1]
+            print(f"Error processing {name}: {message}", file=sys.stderr)
+            errors.append((name, message))
+            if file_index in pages:
+                self._delete_file_rows(upload_batch, name)
+            if checkpoint is not None:
+                checkpoint.forget(name)
+            file_hashes.pop(file_index, None)
+        # Files that failed get no manifest, so their already stored chunks aren't moved either
+        ingested = {key for hashes in file_hashes.values() for key in hashes}
+        kept = {key: position for key, position in kept.items() if key in ingested}
+        deleted = self._update_manifests(store, named_paths, fingerprints, file_hashes, manifests, mode, kept)
+        if checkpoint is not None:
+            if failed:
+                for file_index in file_hashes:
+                    checkpoint.mark_done(named_paths[file_index][1], fingerprints[file_index])
+            else:
+                # Nothing left to resume; the manifest decides what is unchanged from here on
+                checkpoint.reset()
+
+        file_details = [
+            {"name": name, "type": FILE_TYPES[os.path.splitext(name)[1].lower()], "chunks": pages[file_index]}
+            for file_index, (path, name) in enumerate(named_paths)
+            if file_index in pages and file_index not in failed
+        ]
+        print(f"Successfully stored {stats['stored']} new document chunks, skipped {stats['skipped']} already stored, "
+              f"deleted {deleted} stale (upload batch {upload_batch})")
+        return {
+            "upload_batch": upload_batch,
+            "chunks": stats["stored"],
+            "skipped": stats["skipped"],
+            "deleted": deleted,
+            "unchanged": unchanged,
+            "file_details": file_details,
+            "errors": errors,
+        }
@@ -0,0 +1,200 @@
+import heapq
+import math
+import re
+import sys
+import threading
+from collections import defaultdict
+
+try:
+    from .table_scan import scan_table
+    from .metadata_filter import matches_filter
+    from .chunk_expansion import chunk_key, page_key
+except ImportError:
+    from table_scan import scan_table
+    from metadata_filter import matches_filter
+    from chunk_expansion import chunk_key, page_key
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text):
+    """Lower-case word tokens used for both indexing and querying."""
+    return _TOKEN_RE.findall((text or "").lower())
+
+class BM25Index:
+    """In-memory inverted index over the documents table, scored with Okapi BM25.
+
+    Postings map each term to {doc_id: term frequency}, so a query only touches
+    the documents that contain at least one of its terms.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._docs = {}
+        self._total_len = 0
+        # (source, chunk_index) / (source, page) -> doc ids, for neighbour expansion
+        self._by_chunk = {}
+        self._by_page = defaultdict(set)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id, content, metadata=None):
+        tokens = tokenize(content)
+        counts = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove_locked(doc_id)
+            for term, tf in counts.items():
+                self._postings[term][doc_id] = tf
+            self._doc_terms[doc_id] = list(counts)
+            self._doc_len[doc_id] = len(tokens)
+            self._docs[doc_id] = {"id": doc_id, "content": content, "metadata": metadata or {}}
+            self._total_len += len(tokens)
+            chunk, page = chunk_key(metadata or {}), page_key(metadata or {})
+            if chunk is not None:
+                self._by_chunk[chunk] = doc_id
+            if page is not None:
+                self._by_page[page].add(doc_id)
+
+    def add_rows(self, rows):
+        """Index rows shaped like the documents table ({"id", "content", "metadata"})."""
+        count = 0
+        for row in rows:
+            if row.get("id") is None or not row.get("content"):
+                continue
+            self.add(row["id"], row["content"], row.get("metadata"))
+            count += 1
+        return count
+
+    def remove(self, doc_id):
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        for term in self._doc_terms.pop(doc_id, []):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+        row = self._docs.pop(doc_id, None)
+        if row is not None:
+            chunk, page = chunk_key(row["metadata"]), page_key(row["metadata"])
+            if chunk is not None and self._by_chunk.get(chunk) == doc_id:
+                del self._by_chunk[chunk]
+            if page is not None:
+                self._by_page[page].discard(doc_id)
+                if not self._by_page[page]:
+                    del self._by_page[page]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._docs.clear()
+            self._total_len = 0
+            self._by_chunk.clear()
+            self._by_page.clear()
+
+    def documents(self, limit=None):
+        """Return indexed rows in insertion order, optionally capped at `limit`."""
+        with self._lock:
+            rows = list(self._docs.values())
+        return rows if limit is None else rows[:limit]
+
+    def chunks_at(self, chunk_keys):
+        """Rows for the given chunk_key() tuples that are indexed, keyed by chunk key."""
+        with self._lock:
+            return {key: self._docs[self._by_chunk[key]] for key in chunk_keys if key in self._by_chunk}
+
+    def page_chunks(self, page_keys):
+        """All indexed rows on each of the given page_key() tuples, keyed by page key."""
+        with self._lock:
+            return {key: [self._docs[doc_id] for doc_id in self._by_page.get(key, ())] for key in page_keys}
+
+    def search(self, query, k=7, filter=None):
+        """Return up to k (score, row) pairs ranked by BM25 score, best first.
+
+        With a metadata `filter`, documents that don't match it are never scored.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._docs)
+            if not terms or n_docs == 0:
+                return []
+            avg_len = self._total_len / n_docs if self._total_len else 1.0
+
+            scores = defaultdict(float)
+            allowed = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    if filter:
+                        if doc_id not in allowed:
+                            allowed[doc_id] = matches_filter(self._docs[doc_id]["metadata"], filter)
+                        if not allowed[doc_id]:
+                            continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(score, self._docs[doc_id]) for doc_id, score in top]
+
+    def load_from_table(self, supabase_client, table_name="documents", page_size=1000):
+        """Build the index from every row of the documents table."""
+        self.add_rows(scan_table(supabase_client, "id, content, metadata", table_name=table_name, page_size=page_size))
+        return len(self)
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+def get_lexical_index(supabase_client):
+    """Return the process-wide BM25 index, building it from the table on first use."""
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            print("Building BM25 index from documents table...")
+            index = BM25Index()
+            try:
+                index.load_from_table(supabase_client)
+            except Exception as e:
+                print(f"Error building BM25 index: {str(e)}", file=sys.stderr)
+                return index
+            _lexical_index = index
+            print(f"BM25 index built with {len(index)} chunks.")
+    return _lexical_index
+
+def lexical_index_loaded():
+    return _lexical_index is not None
+
+def update_lexical_index(rows):
+    """Add freshly inserted rows to the index if it has already been built."""
+    if _lexical_index is not None:
+        _lexical_index.add_rows(rows)
+
+def reset_lexical_index():
+    """Empty the index after the documents table has been cleared."""
+    if _lexical_index is not None:
+        _lexical_index.clear()
+
+def remove_from_lexical_index(ids):
+    """Drop deleted rows from the index if it has already been built."""
+    if _lexical_index is not None:
+        for doc_id in ids:
+            _lexical_index.remove(doc_id)
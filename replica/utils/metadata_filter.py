@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Metadata keys that retrieval can be scoped by
+FILTER_KEYS = ("source", "file_type", "upload_batch", "tenant")
+
+_scoped_filter = ContextVar("scoped_filter", default=None)
+
+def build_filter(**values):
+    """Metadata filter for match_documents (`metadata @> filter`) from the non-empty FILTER_KEYS values."""
+    unknown = set(values) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unsupported metadata filter keys: {sorted(unknown)}")
+    return {key: value for key, value in values.items() if value not in (None, "")}
+
+def matches_filter(metadata, filter):
+    """Local equivalent of `metadata @> filter` for flat filters."""
+    if not filter:
+        return True
+    metadata = metadata or {}
+    return all(metadata.get(key) == value for key, value in filter.items())
+
+def merge_filters(*filters):
+    """Combine filters; keys set by earlier filters win over later ones."""
+    merged = {}
+    for filter in reversed(filters):
+        merged.update(filter or {})
+    return merged
+
+@contextmanager
+def scoped_filter(filter):
+    """Scope every retrieval made in this context (e.g. one /api/chat request) to `filter`."""
+    token = _scoped_filter.set(dict(filter or {}))
+    try:
+        yield
+    finally:
+        _scoped_filter.reset(token)
+
+def get_scoped_filter():
+    return dict(_scoped_filter.get() or {})
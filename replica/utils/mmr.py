@@ -0,0 +1,102 @@
+import os
+import numpy as np
+
+def maximal_marginal_relevance(relevance, doc_vectors, k, lambda_mult=0.5):
+    """Indices of up to k rows of `doc_vectors` in MMR selection order.
+
+    `relevance` holds each row's relevance to the query in [0, 1]. Each step
+    picks the row maximizing
+    lambda * relevance - (1 - lambda) * max sim(doc, already selected).
+    All pairwise similarities come from a single matrix product; each step
+    then only updates a running max, so there are no per-pair Python loops.
+    """
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    if docs.ndim != 2 or len(docs) == 0 or k <= 0:
+        return []
+    norms = np.linalg.norm(docs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    docs = docs / norms
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = docs @ docs.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(docs), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, len(docs)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+def relevance_from_scores(scores):
+    """Scale first-stage scores (best first) to [0, 1] relevance for MMR.
+
+    RRF and reranker scores aren't cosines, so they are min-max scaled; when
+    they can't be (missing or all equal), relevance falls off with rank.
+    """
+    try:
+        values = np.asarray(scores, dtype=np.float32)
+    except (TypeError, ValueError):
+        values = None
+    if values is None or not np.all(np.isfinite(values)) or values.max() == values.min():
+        return 1.0 - np.arange(len(scores), dtype=np.float32) / len(scores)
+    return (values - values.min()) / (values.max() - values.min())
+
+class MMRPostProcessor:
+    """Retriever post-processor that drops near-duplicate chunks with MMR.
+
+    Takes the first `fetch_k` (document, score) candidates and keeps k of
+    them. Relevance comes from the incoming scores, so the fused (RRF) order
+    is kept as the relevance signal, and chunk vectors come from the local
+    vector index. Candidates it doesn't hold are passed through in order
+    rather than fetched or embedded on every query.
+    """
+
+    def __init__(self, vector_index, lambda_mult=0.5, fetch_k=20):
+        self.vector_index = vector_index
+        self.lambda_mult = lambda_mult
+        self.fetch_k = fetch_k
+
+    def _doc_vectors(self, docs):
+        """Stacked vectors for `docs`, or None unless the local index holds every one of them."""
+        ids = [doc.id for doc in docs]
+        if not all(ids) or len(self.vector_index) == 0:
+            return None
+        found = self.vector_index.vectors_for(ids)
+        if len(found) < len(set(ids)):
+            return None
+        return np.stack([found[doc_id] for doc_id in ids])
+
+    def process(self, query, results, k):
+        """Return up to k of `results` ((document, score) pairs), relevant but mutually diverse."""
+        results = results[:self.fetch_k] if self.fetch_k else results
+        if len(results) <= k:
+            return results
+        vectors = self._doc_vectors([doc for doc, _ in results])
+        if vectors is None:
+            return results[:k]
+        relevance = relevance_from_scores([score for _, score in results])
+        order = maximal_marginal_relevance(relevance, vectors, k, self.lambda_mult)
+        return [results[i] for i in order]
+
+def mmr_enabled():
+    return os.environ.get("MMR_ENABLED", "1").lower() not in ("0", "false", "no")
+
+def get_mmr_post_processor(vector_index=None):
+    """MMR post-processor configured from MMR_LAMBDA and MMR_FETCH_K.
+
+    None when MMR_ENABLED is off or there is no local vector index to take
+    chunk vectors from.
+    """
+    if not mmr_enabled() or vector_index is None:
+        return None
+    return MMRPostProcessor(
+        vector_index,
+        lambda_mult=float(os.environ.get("MMR_LAMBDA", 0.5)),
+        fetch_k=int(os.environ.get("MMR_FETCH_K", 20)),
+    )
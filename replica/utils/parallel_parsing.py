@@ -0,0 +1,354 @@
+import csv
+import io
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from langchain_core.documents import Document
+from langchain_community.document_loaders import TextLoader, CSVLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+FILE_TYPES = {".pdf": "pdf", ".txt": "txt", ".csv": "csv"}
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+def parse_workers():
+    """Worker processes for parsing (PARSE_WORKERS, default one per CPU; 1 parses in-process)."""
+    value = os.environ.get("PARSE_WORKERS")
+    return max(1, int(value)) if value else (os.cpu_count() or 1)
+
+def csv_mode():
+    """How CSVs are chunked (CSV_MODE): "grouped" (default) packs rows into
+    chunks under one header; "rows" makes one document per row, as CSVLoader does."""
+    return os.environ.get("CSV_MODE", "grouped").lower()
+
+def csv_columns():
+    """Columns to keep from CSV uploads (CSV_COLUMNS, comma-separated; default all)."""
+    value = os.environ.get("CSV_COLUMNS")
+    return [column.strip() for column in value.split(",") if column.strip()] if value else None
+
+def pdf_page_timeout():
+    """Seconds one PDF page may take to extract (PDF_PAGE_TIMEOUT, default 30; 0 disables)."""
+    return float(os.environ.get("PDF_PAGE_TIMEOUT", 30))
+
+class PageTimeout(Exception):
+    pass
+
+@contextmanager
+def page_deadline(seconds):
+    """Raise PageTimeout if the block runs longer than `seconds`.
+
+    Uses SIGALRM, so it only applies on POSIX in a process's main thread,
+    which is where pool workers run tasks; elsewhere the block is unbounded.
+    """
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expired(signum, frame):
+        raise PageTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def needs_page_deadline(tasks):
+    """True if `tasks` include PDFs whose page timeout can't be enforced in this thread.
+
+    SIGALRM only fires in a process's main thread, and Flask and Streamlit
+    handle requests in other threads, so PDF tasks started from one have to
+    go to a worker process (see deadline_pool) even when there is only one.
+    """
+    return (
+        pdf_page_timeout() > 0
+        and hasattr(signal, "setitimer")
+        and threading.current_thread() is not threading.main_thread()
+        and any(task[3] == "pdf" for task in tasks)
+    )
+
+_deadline_pool = None
+_deadline_pool_lock = threading.Lock()
+
+def deadline_pool():
+    """Process-wide worker pool for PDFs parsed from request threads.
+
+    Created on first use and kept for the life of the process (PARSE_WORKERS
+    workers), so a single-file upload doesn't fork a new pool each time. A
+    pool broken by a crashed worker is replaced.
+    """
+    global _deadline_pool
+    with _deadline_pool_lock:
+        if _deadline_pool is None or getattr(_deadline_pool, "_broken", False):
+            _deadline_pool = ProcessPoolExecutor(max_workers=parse_workers())
+    return _deadline_pool
+
+def pdf_page_count(file_path):
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+def plan_parse_tasks(named_paths, pages_per_task=None):
+    """Split (path, display name) pairs into parse tasks, in file order.
+
+    PDFs with more than `pages_per_task` pages (PARSE_PAGES_PER_TASK, default
+    20) become one task per page range so a single large file can use several
+    workers. Ranges start at 2 pages and double up to `pages_per_task`, so the
+    first chunks of a large file are ready after a couple of pages rather
+    than a full range. Each task is (file_index, path, name, file_type,
+    page_range).
+    """
+    if pages_per_task is None:
+        pages_per_task = int(os.environ.get("PARSE_PAGES_PER_TASK", 20))
+    tasks = []
+    for file_index, (path, name) in enumerate(named_paths):
+        file_type = FILE_TYPES.get(os.path.splitext(name)[1].lower())
+        if file_type == "pdf":
+            try:
+                pages = pdf_page_count(path)
+            except Exception:
+                # Let the worker report the error for this file
+                pages = 0
+            if pages > pages_per_task:
+                start, size = 0, min(2, pages_per_task)
+                while start < pages:
+                    end = min(start + size, pages)
+                    tasks.append((file_index, path, name, file_type, (start, end)))
+                    start, size = end, min(size * 2, pages_per_task)
+                continue
+        tasks.append((file_index, path, name, file_type, None))
+    return tasks
+
+def _pdf_metadata(reader):
+    """Document-level metadata normalized the way PyPDFLoader does (producer, creator, creationdate, ...)."""
+    metadata = {}
+    for key, value in {"producer": "PyPDF", "creator": "PyPDF", "creationdate": "", **(reader.metadata or {})}.items():
+        key = key.lstrip("/").lower()
+        value = value if isinstance(value, (str, int)) else str(value)
+        if key in ("creationdate", "moddate"):
+            try:
+                value = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                pass
+        metadata[key] = value.strip() if isinstance(value, str) else value
+    return metadata
+
+def iter_pdf_pages(path, name, page_range=None, page_timeout=None):
+    """Yield one Document per PDF page, extracting each only when it's asked for.
+
+    Metadata matches what PyPDFLoader gives, except that source is the
+    display name and file_type is added. A page that takes longer than
+    `page_timeout` seconds to extract is yielded empty, with a warning,
+    instead of stalling the whole file.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    total_pages = len(reader.pages)
+    start, end = page_range or (0, total_pages)
+    labels = reader.page_labels
+    file_metadata = _pdf_metadata(reader)
+    for page in range(start, end):
+        try:
+            with page_deadline(page_timeout):
+                text = reader.pages[page].extract_text(extraction_mode="plain").strip()
+        except PageTimeout:
+            print(f"Skipping page {page + 1} of {name}: extraction took longer than {page_timeout}s", file=sys.stderr)
+            text = ""
+        yield Document(
+            page_content=text,
+            metadata={
+                **file_metadata,
+                "source": name,
+                "page": page,
+                "page_label": labels[page],
+                "total_pages": total_pages,
+                "file_type": "pdf",
+            },
+        )
+
+def load_pdf_pages(path, name, page_range=None, page_timeout=None):
+    """One Document per PDF page, with the page metadata PyPDFLoader would give."""
+    return list(iter_pdf_pages(path, name, page_range, page_timeout))
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(values)
+    return buffer.getvalue()
+
+def _abbreviate_header(header_line, limit):
+    """Cut a header line to at most `limit` characters, at a field boundary, marking the cut with "..."."""
+    if len(header_line) <= limit:
+        return header_line
+    cut = header_line.rfind(",", 0, limit - 3)
+    return header_line[:cut if cut > 0 else limit - 3] + ",..."
+
+def iter_csv_chunks(path, name, columns=None, chunk_size=CHUNK_SIZE):
+    """Yield (rows read, chunk) pairs, reading the CSV one row at a time.
+
+    Rows are packed into chunks of up to `chunk_size` characters, each
+    starting with the header line so it reads as a small CSV on its own. The
+    header counts toward that size; a header longer than a quarter of it is
+    abbreviated. A row too long for one chunk is split like any other text,
+    with the header repeated on every piece. With `columns`, only those
+    columns are in the chunk text (and so embedded). Metadata records the
+    first and last row (0-based, as CSVLoader's `row`); like CSVLoader, blank
+    lines are skipped and not counted. The file must be UTF-8.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        try:
+            header = next(reader, None)
+            if header is None:
+                return
+            if columns:
+                missing = [column for column in columns if column not in header]
+                if missing:
+                    raise ValueError(f"Unknown CSV columns: {', '.join(missing)}")
+                positions = [header.index(column) for column in columns]
+            else:
+                positions = None
+            header_line = _abbreviate_header(
+                _csv_line(header if positions is None else [header[i] for i in positions]), chunk_size // 4
+            )
+            room = chunk_size - len(header_line) - 1
+            splitter = RecursiveCharacterTextSplitter(chunk_size=room, chunk_overlap=min(CHUNK_OVERLAP, room // 4))
+
+            def chunk(lines, first_row, last_row):
+                metadata = {"source": name, "file_type": "csv", "row": first_row, "row_end": last_row}
+                return Document(page_content="\n".join([header_line] + lines), metadata=metadata)
+
+            lines, size, first_row, last_row = [], len(header_line), 0, 0
+            for row_number, row in enumerate(row for row in reader if row):
+                line = _csv_line(row if positions is None else [row[i] if i < len(row) else "" for i in positions])
+                if lines and size + 1 + len(line) > chunk_size:
+                    yield len(lines), chunk(lines, first_row, last_row)
+                    lines, size = [], len(header_line)
+                if len(line) > room:
+                    for piece_number, piece in enumerate(splitter.split_text(line)):
+                        yield (1 if piece_number == 0 else 0), chunk([piece], row_number, row_number)
+                    continue
+                if not lines:
+                    first_row = row_number
+                lines.append(line)
+                size += 1 + len(line)
+                last_row = row_number
+            if lines:
+                yield len(lines), chunk(lines, first_row, last_row)
+        except UnicodeDecodeError as e:
+            raise ValueError(f"{name} is not UTF-8 encoded ({e.reason}); save it as UTF-8 and upload it again") from e
+
+def stream_task(task, columns=None, group=50, chunk_overlap=CHUNK_OVERLAP):
+    """Like parse_task, but yields a grouped CSV in pieces of `group` chunks as it is read.
+
+    Meant for running in-process, so a large CSV never sits in memory as a
+    whole; other tasks produce their single parse_task result.
+    """
+    file_index, path, name, file_type, page_range = task
+    if file_type != "csv" or csv_mode() != "grouped":
+        yield parse_task(task, columns, chunk_overlap)
+        return
+    rows, chunks = 0, []
+    try:
+        for rows_read, chunk in iter_csv_chunks(path, name, columns):
+            rows += rows_read
+            chunks.append(chunk)
+            if len(chunks) == group:
+                yield file_index, rows, chunks, None
+                rows, chunks = 0, []
+    except Exception as e:
+        yield file_index, 0, [], str(e)
+        return
+    if chunks:
+        yield file_index, rows, chunks, None
+
+def parse_task(task, columns=None, chunk_overlap=CHUNK_OVERLAP):
+    """Load and split one task. Runs in a worker process; returns (file_index, pages loaded, chunks, error).
+
+    For a grouped CSV, "pages loaded" counts rows and `columns` picks the columns kept.
+    """
+    file_index, path, name, file_type, page_range = task
+    try:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=chunk_overlap)
+        if file_type == "pdf":
+            # Split each page as it is extracted; chunks never span pages, so this matches splitting them all at once
+            pages, chunks = 0, []
+            for page in iter_pdf_pages(path, name, page_range, pdf_page_timeout()):
+                pages += 1
+                chunks.extend(splitter.split_documents([page]))
+            return file_index, pages, chunks, None
+        elif file_type == "txt":
+            docs = TextLoader(path).load()
+        elif file_type == "csv" and csv_mode() == "grouped":
+            chunks = list(iter_csv_chunks(path, name, columns))
+            return file_index, sum(rows for rows, _ in chunks), [chunk for _, chunk in chunks], None
+        elif file_type == "csv":
+            docs = CSVLoader(path).load()
+        else:
+            return file_index, 0, [], f"Unsupported file format: {os.path.splitext(name)[1].lower()}"
+        for doc in docs:
+            doc.metadata["source"] = name
+            doc.metadata["file_type"] = file_type
+        return file_index, len(docs), splitter.split_documents(docs), None
+    except Exception as e:
+        return file_index, 0, [], str(e)
+
+def parse_files(named_paths, workers=None, columns=None):
+    """Parse and split (path, display name) pairs, in parallel when workers > 1.
+
+    Results are merged in file order and page order regardless of which
+    worker finishes first, so `chunk_index` numbering matches a serial run;
+    it counts each source's chunks from 0.
+    Returns (document_chunks, file_details, errors) where errors is a list of
+    (name, message). CSV `columns` default to CSV_COLUMNS.
+    """
+    workers = workers or parse_workers()
+    columns = columns or csv_columns()
+    tasks = plan_parse_tasks(named_paths)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(partial(parse_task, columns=columns), tasks))
+    elif needs_page_deadline(tasks):
+        results = list(deadline_pool().map(partial(parse_task, columns=columns), tasks))
+    else:
+        results = [parse_task(task, columns) for task in tasks]
+
+    loaded = {}
+    file_chunks = {}
+    errors = {}
+    for file_index, pages, chunks, error in results:
+        if error is not None:
+            errors.setdefault(file_index, error)
+            continue
+        loaded[file_index] = loaded.get(file_index, 0) + pages
+        file_chunks.setdefault(file_index, []).extend(chunks)
+
+    # A file that failed anywhere is left out entirely, as a serial load would
+    document_chunks = []
+    for file_index in sorted(file_chunks):
+        if file_index not in errors:
+            document_chunks.extend(file_chunks[file_index])
+
+    positions = {}
+    for i, chunk in enumerate(document_chunks):
+        if "source" not in chunk.metadata:
+            chunk.metadata["source"] = f"unknown_source_{i}"
+        chunk.metadata["chunk_index"] = positions.get(chunk.metadata["source"], 0)
+        positions[chunk.metadata["source"]] = chunk.metadata["chunk_index"] + 1
+
+    file_details = []
+    for file_index, (path, name) in enumerate(named_paths):
+        if file_index in loaded and file_index not in errors:
+            file_type = FILE_TYPES[os.path.splitext(name)[1].lower()]
+            file_details.append({"name": name, "type": file_type, "chunks": loaded[file_index]})
+            print(f"Loaded {loaded[file_index]} documents from {name}")
+    error_list = [(named_paths[file_index][1], message) for file_index, message in sorted(errors.items())]
+    for name, message in error_list:
+        print(f"Error processing {name}: {message}", file=sys.stderr)
+    return document_chunks, file_details, error_list
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+
+# Files added to a segment directory by quantize_segment
+CODES_FILE = "codes.bin"
+QUANTIZER_FILE = "quantizer.npz"
+
+class ScalarQuantizer:
+    """Per-dimension 8-bit scalar quantizer.
+
+    Each dimension's [min, max] range is mapped onto 256 levels, so a vector
+    takes 1 byte per dimension instead of 4. Dot products are computed
+    directly against the codes: q . x ~= (q * scale) . code + q . offset.
+    """
+
+    def __init__(self, offset=None, scale=None):
+        self.offset = offset
+        self.scale = scale
+
+    def fit(self, vectors, block_rows=65536):
+        """Learn per-dimension ranges, reading `vectors` (possibly mmapped) in blocks."""
+        low, high = None, None
+        for start in range(0, len(vectors), block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            block_low, block_high = block.min(axis=0), block.max(axis=0)
+            low = block_low if low is None else np.minimum(low, block_low)
+            high = block_high if high is None else np.maximum(high, block_high)
+        self.offset = low.astype(np.float32)
+        scale = (high - low) / 255.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return np.clip(np.rint((vectors - self.offset) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes):
+        return codes.astype(np.float32) * self.scale + self.offset
+
+    def scores(self, queries, codes):
+        """Approximate query . vector for every row of `codes`."""
+        queries = np.asarray(queries, dtype=np.float32)
+        return (queries * self.scale) @ codes.astype(np.float32).T + (queries @ self.offset)[:, None]
+
+    def save(self, path):
+        np.savez(path, offset=self.offset, scale=self.scale)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(offset=data["offset"], scale=data["scale"])
+
+def quantize_segment(path, block_rows=65536):
+    """Add 8-bit codes and the fitted quantizer to an existing segment directory."""
+    try:
+        from .embedding_segment import EmbeddingSegment
+    except ImportError:
+        from embedding_segment import EmbeddingSegment
+
+    segment = EmbeddingSegment(path)
+    quantizer = ScalarQuantizer().fit(segment.vectors, block_rows=block_rows)
+
+    tmp_codes = os.path.join(path, f"{CODES_FILE}.tmp")
+    with open(tmp_codes, "wb") as f:
+        for start in range(0, len(segment), block_rows):
+            f.write(quantizer.encode(segment.vectors[start:start + block_rows]).tobytes())
+    quantizer.save(os.path.join(path, QUANTIZER_FILE))
+    os.replace(tmp_codes, os.path.join(path, CODES_FILE))
+    return quantizer
@@ -0,0 +1,96 @@
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+try:
+    from .lexical_index import tokenize
+except ImportError:
+    from lexical_index import tokenize
+
+# Reranking runs off the request thread so a slow model can be abandoned at the budget
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="reranker")
+
+class LexicalOverlapReranker:
+    """Scores candidates by how much of the query they cover.
+
+    Each query term a chunk contains counts log(1 + n / df), with df taken
+    over the candidate set, so rare terms like names and part numbers
+    outweigh common ones. Pure Python, well under a millisecond for 20 chunks.
+    """
+
+    def score(self, query, docs):
+        terms = set(tokenize(query))
+        doc_terms = [set(tokenize(doc.page_content)) for doc in docs]
+        if not terms or not docs:
+            return [0.0] * len(docs)
+        df = {term: sum(1 for tokens in doc_terms if term in tokens) for term in terms}
+        weights = {term: math.log(1 + len(docs) / count) for term, count in df.items() if count}
+        total = sum(weights.values()) or 1.0
+        return [sum(weights.get(term, 0.0) for term in terms & tokens) / total for tokens in doc_terms]
+
+class CrossEncoderReranker:
+    """Scores (query, chunk) pairs with a sentence-transformers cross-encoder on CPU."""
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query, docs):
+        return [float(score) for score in self.model.predict([(query, doc.page_content) for doc in docs])]
+
+class RerankPostProcessor:
+    """Retriever post-processor that re-scores the first `fetch_k` candidates with a reranker.
+
+    The reranker gets `time_budget` seconds per request; if it runs over or
+    fails, the candidates keep their first-stage order. Ties keep first-stage
+    order too.
+    """
+
+    def __init__(self, reranker, fetch_k=12, time_budget=0.2):
+        self.reranker = reranker
+        self.fetch_k = fetch_k
+        self.time_budget = time_budget
+        self.timeouts = 0
+
+    def process(self, query, results, k):
+        """Return the top k of `results` ((document, score) pairs) by reranker score."""
+        results = results[:self.fetch_k] if self.fetch_k else results
+        if len(results) <= 1:
+            return results[:k]
+        future = _executor.submit(self.reranker.score, query, [doc for doc, _ in results])
+        try:
+            scores = future.result(timeout=self.time_budget)
+        except TimeoutError:
+            future.cancel()
+            self.timeouts += 1
+            print(f"Reranker exceeded its {self.time_budget * 1000:.0f} ms budget; keeping first-stage order", file=sys.stderr)
+            return results[:k]
+        except Exception as e:
+            print(f"Reranker failed: {str(e)}; keeping first-stage order", file=sys.stderr)
+            return results[:k]
+        order = sorted(range(len(results)), key=lambda i: -scores[i])
+        return [(results[i][0], scores[i]) for i in order[:k]]
+
+def get_reranker():
+    """Reranker named by RERANKER: "lexical" (default), "cross-encoder" (RERANK_MODEL) or "none"."""
+    name = os.environ.get("RERANKER", "lexical").lower()
+    if name == "none":
+        return None
+    if name == "cross-encoder":
+        try:
+            return CrossEncoderReranker(os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+        except Exception as e:
+            print(f"Could not load cross-encoder reranker ({str(e)}); using lexical overlap", file=sys.stderr)
+    return LexicalOverlapReranker()
+
+def get_rerank_post_processor():
+    """Rerank post-processor configured from RERANKER, RERANK_FETCH_K and RERANK_TIME_BUDGET_MS, or None."""
+    reranker = get_reranker()
+    if reranker is None:
+        return None
+    return RerankPostProcessor(
+        reranker,
+        fetch_k=int(os.environ.get("RERANK_FETCH_K", 12)),
+        time_budget=float(os.environ.get("RERANK_TIME_BUDGET_MS", 200)) / 1000,
+    )
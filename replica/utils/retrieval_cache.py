@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from .corpus_sync import get_corpus_version
+    from .embedding_cache import normalize_text
+except ImportError:
+    from corpus_sync import get_corpus_version
+    from embedding_cache import normalize_text
+
+class RetrievalCache:
+    """Size-bounded LRU of retrieval results keyed on (query, k, filter, corpus_version).
+
+    The corpus version is bumped on every insert or clear (by other processes
+    too, see corpus_sync.get_corpus_version), so a lookup made after an
+    upload can't match an entry computed before it. Entries from
+    older versions are dropped as soon as a newer version is seen.
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+    def _key(self, query, k, filter, version):
+        return (normalize_text(query), k, json.dumps(filter or {}, sort_keys=True), version)
+
+    def get(self, query, k, filter=None):
+        version = get_corpus_version()
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            results = self._entries.get(self._key(query, k, filter, version))
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(self._key(query, k, filter, version))
+            self.hits += 1
+            return list(results)
+
+    def put(self, query, k, results, filter=None, version=None):
+        """Store results computed against `version` (read it before retrieving)."""
+        version = get_corpus_version() if version is None else version
+        with self._lock:
+            if version != self._version:
+                # The corpus changed while these results were being computed
+                return
+            self._entries[self._key(query, k, filter, version)] = list(results)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "corpus_version": self._version,
+        }
+
+_retrieval_cache = None
+_retrieval_cache_lock = threading.Lock()
+
+def get_retrieval_cache():
+    """Return the process-wide retrieval cache (size from RETRIEVAL_CACHE_SIZE)."""
+    global _retrieval_cache
+    with _retrieval_cache_lock:
+        if _retrieval_cache is None:
+            _retrieval_cache = RetrievalCache(max_size=int(os.environ.get("RETRIEVAL_CACHE_SIZE", 512)))
+    return _retrieval_cache
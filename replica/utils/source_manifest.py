@@ -0,0 +1,75 @@
+import hashlib
+from datetime import datetime, timezone
+
+def file_fingerprint(path):
+    """sha256 of a file's bytes, as hex."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class SourceManifest:
+    """Per-source fingerprint and chunk manifest in the document_sources table.
+
+    Each source (file name) records the sha256 of the file last ingested
+    under that name and the content hashes of its chunks, in order. A
+    re-upload with the same fingerprint can be skipped outright; otherwise
+    the new manifest is diffed against the old one and only the chunks that
+    disappeared are deleted.
+    """
+
+    def __init__(self, supabase_client, table_name="document_sources", documents_table="documents"):
+        self.supabase = supabase_client
+        self.table_name = table_name
+        self.documents_table = documents_table
+
+    def get(self, sources):
+        """{source: {"fingerprint", "chunk_hashes"}} for the sources that have a manifest."""
+        sources = list(dict.fromkeys(sources))
+        manifests = {}
+        for i in range(0, len(sources), 100):
+            response = (
+                self.supabase.table(self.table_name)
+                .select("source, fingerprint, chunk_hashes")
+                .in_("source", sources[i:i + 100])
+                .execute()
+            )
+            for row in response.data or []:
+                manifests[row["source"]] = {"fingerprint": row["fingerprint"], "chunk_hashes": row["chunk_hashes"] or []}
+        return manifests
+
+    def save(self, source, fingerprint, chunk_hashes):
+        self.supabase.table(self.table_name).upsert(
+            {
+                "source": source,
+                "fingerprint": fingerprint,
+                "chunk_hashes": list(chunk_hashes),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            },
+            on_conflict="source",
+        ).execute()
+
+    def clear(self):
+        self.supabase.table(self.table_name).delete().neq("source", "").execute()
+
+    def remove_stale(self, source, old_hashes, new_hashes):
+        """Delete this source's rows whose hash is in the old manifest but not the new one.
+
+        Row hashes are scoped to their source (see chunk_hash), so no other
+        source can be sharing these rows. Returns the deleted row ids.
+        """
+        stale = sorted(set(old_hashes) - set(new_hashes))
+        if not stale:
+            return []
+        deleted = []
+        for i in range(0, len(stale), 100):
+            response = (
+                self.supabase.table(self.documents_table)
+                .delete()
+                .in_("content_hash", stale[i:i + 100])
+                .eq("metadata->>source", source)
+                .execute()
+            )
+            deleted.extend(row["id"] for row in response.data or [])
+        return deleted
@@ -0,0 +1,25 @@
+def scan_table(client, columns="id, content, metadata", table_name="documents", filters=None, page_size=1000):
+    """Yield rows of a table one page at a time, projecting only `columns`.
+
+    Pages are fetched with keyset pagination (`id > last_id ORDER BY id`), which
+    stays fast deep into the table where OFFSET-based paging slows down, and
+    rows are yielded as they arrive so callers never hold the whole table.
+    `filters` maps column expressions (e.g. "metadata->>source") to equality values.
+    """
+    selected = [column.strip() for column in columns.split(",")]
+    if "id" not in selected:
+        selected.insert(0, "id")
+    projection = ", ".join(selected)
+
+    last_id = None
+    while True:
+        query = client.table(table_name).select(projection)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(page_size).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1]["id"]
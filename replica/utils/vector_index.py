@@ -0,0 +1,277 @@
+import json
+import os
+import sys
+import threading
+import numpy as np
+
+try:
+    from .table_scan import scan_table
+    from .change_log import changes_since, fetch_rows
+except ImportError:
+    from table_scan import scan_table
+    from change_log import changes_since, fetch_rows
+
+def parse_embedding(value):
+    """Coerce an embedding from PostgREST (pgvector comes back as "[0.1,...]") to float32."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, best first, via argpartition."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+class LocalVectorIndex:
+    """In-process mirror of the documents table's embeddings.
+
+    Vectors are L2-normalized on insert and kept in one contiguous float32
+    matrix, so a cosine search is a single matrix-vector product followed by
+    argpartition. Capacity doubles as rows are appended.
+
+    An optional read-only EmbeddingSegment serves as the base layer: its
+    mmapped vectors are searched in place, rows deleted from it are masked
+    out, and anything inserted afterwards lands in the in-memory matrix.
+    """
+
+    def __init__(self, dim=768, initial_capacity=1024, segment=None):
+        self.dim = segment.dim if segment is not None and segment.dim else dim
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((initial_capacity, self.dim), dtype=np.float32)
+        self._size = 0
+        self._rows = []
+        self._id_to_pos = {}
+        self._segment = segment
+        self._segment_alive = np.ones(len(segment), dtype=bool) if segment is not None else None
+        self._segment_live = len(segment) if segment is not None else 0
+        self._segment_positions = None
+
+    def __len__(self):
+        return self._size + self._segment_live
+
+    def _ensure_capacity(self, extra):
+        needed = self._size + extra
+        if needed <= self._matrix.shape[0]:
+            return
+        capacity = max(needed, self._matrix.shape[0] * 2)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def add_rows(self, rows):
+        """Index rows shaped like the documents table ({"id", "content", "metadata", "embedding"})."""
+        rows = [row for row in rows if row.get("id") is not None and row.get("embedding") is not None]
+        if not rows:
+            return 0
+        vectors = _normalize(np.stack([parse_embedding(row["embedding"]) for row in rows]))
+
+        with self._lock:
+            if len(self) == 0 and vectors.shape[1] != self.dim:
+                self.dim = vectors.shape[1]
+                self._matrix = np.zeros((self._matrix.shape[0], self.dim), dtype=np.float32)
+            for row in rows:
+                self._remove_locked(row["id"])
+            self._ensure_capacity(len(rows))
+            start = self._size
+            self._matrix[start:start + len(rows)] = vectors
+            for offset, row in enumerate(rows):
+                self._id_to_pos[row["id"]] = start + offset
+                self._rows.append({"id": row["id"], "content": row.get("content", ""), "metadata": row.get("metadata") or {}})
+            self._size += len(rows)
+        return len(rows)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        if self._segment_live:
+            if self._segment_positions is None:
+                self._segment_positions = self._segment.positions_by_id()
+            seg_pos = self._segment_positions.pop(doc_id, None)
+            if seg_pos is not None and self._segment_alive[seg_pos]:
+                self._segment_alive[seg_pos] = False
+                self._segment_live -= 1
+
+        pos = self._id_to_pos.pop(doc_id, None)
+        if pos is None:
+            return
+        # Swap the last row into the hole so the matrix stays dense
+        last = self._size - 1
+        if pos != last:
+            self._matrix[pos] = self._matrix[last]
+            self._rows[pos] = self._rows[last]
+            self._id_to_pos[self._rows[pos]["id"]] = pos
+        self._rows.pop()
+        self._size -= 1
+
+    def clear(self):
+        with self._lock:
+            self._rows = []
+            self._id_to_pos = {}
+            self._size = 0
+            self._segment = None
+            self._segment_alive = None
+            self._segment_live = 0
+            self._segment_positions = None
+
+    def vectors_for(self, ids):
+        """Map each of `ids` held by the index to its normalized vector; unknown ids are left out."""
+        with self._lock:
+            found = {}
+            for doc_id in ids:
+                pos = self._id_to_pos.get(doc_id)
+                if pos is not None:
+                    found[doc_id] = self._matrix[pos].copy()
+            missing = [doc_id for doc_id in ids if doc_id not in found]
+            if missing and self._segment_live:
+                if self._segment_positions is None:
+                    self._segment_positions = self._segment.positions_by_id()
+                for doc_id in missing:
+                    seg_pos = self._segment_positions.get(doc_id)
+                    if seg_pos is not None and self._segment_alive[seg_pos]:
+                        found[doc_id] = np.asarray(self._segment.vectors[seg_pos], dtype=np.float32)
+            return found
+
+    def search(self, query_vector, k=8):
+        """Return up to k (similarity, row) pairs for one query vector."""
+        return self.search_batch(np.asarray(query_vector, dtype=np.float32)[None, :], k)[0]
+
+    def search_batch(self, query_vectors, k=8):
+        """Score a batch of query vectors with one matmul; returns one result list per query."""
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        with self._lock:
+            results = [[] for _ in range(len(queries))]
+            if self._size:
+                scores = queries @ self._matrix[:self._size].T
+                for result, row_scores in zip(results, scores):
+                    result.extend((float(row_scores[i]), self._rows[i]) for i in _top_k(row_scores, k))
+            if self._segment_live:
+                alive = None if self._segment_live == len(self._segment) else self._segment_alive
+                for result, pairs in zip(results, self._segment.search_batch(queries, k, alive=alive)):
+                    result.extend((score, self._segment.row_at(pos)) for score, pos in pairs)
+                results = [sorted(result, key=lambda pair: pair[0], reverse=True)[:k] for result in results]
+            return results
+
+    def load_from_table(self, supabase_client, table_name="documents", page_size=1000):
+        """Populate the index from every row of the documents table, one page at a time."""
+        page = []
+        for row in scan_table(supabase_client, "id, content, metadata, embedding", table_name=table_name, page_size=page_size):
+            page.append(row)
+            if len(page) == page_size:
+                self.add_rows(page)
+                page = []
+        self.add_rows(page)
+        return len(self)
+
+    def reconcile_with_table(self, supabase_client, table_name="documents", page_size=1000):
+        """Bring a segment-backed index up to date with the documents table.
+
+        The segment is a snapshot from build time, and what was layered on it
+        in memory is gone after a restart. If the segment recorded its
+        document_changes position, only the rows logged since are masked or
+        fetched; otherwise this scans the table's ids (no embeddings), masks
+        segment rows that no longer exist and fetches the rows added since the
+        build. Returns (added, removed).
+        """
+        change_seq = self._segment.change_seq if self._segment is not None else None
+        if change_seq is not None:
+            return self._apply_changes_since(supabase_client, change_seq, table_name)
+        live = {str(row["id"]) for row in scan_table(supabase_client, "id", table_name=table_name, page_size=page_size)}
+        with self._lock:
+            if self._segment_positions is None and self._segment is not None:
+                self._segment_positions = self._segment.positions_by_id()
+            known = set(self._segment_positions or ()) | set(self._id_to_pos)
+            stale = [doc_id for doc_id in known if doc_id not in live]
+            for doc_id in stale:
+                self._remove_locked(doc_id)
+        missing = sorted(live - known)
+        for i in range(0, len(missing), 100):
+            response = (
+                supabase_client.table(table_name)
+                .select("id, content, metadata, embedding")
+                .in_("id", missing[i:i + 100])
+                .execute()
+            )
+            self.add_rows(response.data or [])
+        return len(missing), len(stale)
+
+    def _apply_changes_since(self, supabase_client, change_seq, table_name):
+        changed, _, truncated = changes_since(supabase_client, change_seq)
+        if truncated:
+            self.clear()
+        upserted = [doc_id for doc_id, op in changed.items() if op != "D"]
+        rows = fetch_rows(supabase_client, upserted, "id, content, metadata, embedding", table_name=table_name)
+        found = {str(row["id"]) for row in rows}
+        # Logged as written but gone by now count as deleted
+        removed = [doc_id for doc_id, op in changed.items() if op == "D" or doc_id not in found]
+        with self._lock:
+            for doc_id in removed:
+                self._remove_locked(doc_id)
+        self.add_rows(rows)
+        return len(rows), len(removed)
+
+def local_vector_index_enabled():
+    return os.environ.get("LOCAL_VECTOR_INDEX", "").lower() in ("1", "true", "yes")
+
+_vector_index = None
+_vector_index_lock = threading.Lock()
+
+def get_vector_index(supabase_client):
+    """Return the process-wide local vector index, or None when LOCAL_VECTOR_INDEX is off."""
+    global _vector_index
+    if not local_vector_index_enabled():
+        return None
+    with _vector_index_lock:
+        if _vector_index is None:
+            segment_path = os.environ.get("VECTOR_SEGMENT_PATH")
+            try:
+                if segment_path and os.path.isdir(segment_path):
+                    # mmap the prebuilt segment: constant-time startup, pages shared across workers
+                    try:
+                        from .embedding_segment import EmbeddingSegment
+                    except ImportError:
+                        from embedding_segment import EmbeddingSegment
+                    print(f"Opening embedding segment at {segment_path}...")
+                    rescore_k = int(os.environ.get("VECTOR_RESCORE_K", 200))
+                    index = LocalVectorIndex(segment=EmbeddingSegment(segment_path, rescore_k=rescore_k))
+                    # The segment is a build-time snapshot; a failure here falls back to the RPC
+                    added, removed = index.reconcile_with_table(supabase_client)
+                    print(f"Segment reconciled with the documents table: {added} rows added, {removed} removed.")
+                else:
+                    print("Loading local vector index from documents table...")
+                    index = LocalVectorIndex()
+                    index.load_from_table(supabase_client)
+            except Exception as e:
+                print(f"Error loading local vector index: {str(e)}", file=sys.stderr)
+                return None
+            _vector_index = index
+            print(f"Local vector index loaded with {len(index)} vectors.")
+    return _vector_index
+
+def vector_index_loaded():
+    return _vector_index is not None
+
+def update_vector_index(rows):
+    """Add freshly inserted rows to the index if it has already been loaded."""
+    if _vector_index is not None:
+        _vector_index.add_rows(rows)
+
+def reset_vector_index():
+    """Empty the index after the documents table has been cleared."""
+    if _vector_index is not None:
+        _vector_index.clear()
+
+def remove_from_vector_index(ids):
+    """Drop deleted rows from the index if it has already been built."""
+    if _vector_index is not None:
+        for doc_id in ids:
+            _vector_index.remove(doc_id)
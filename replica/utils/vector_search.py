@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+from typing import Any, List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import SupabaseVectorStore
+
+try:
+    from .hybrid_retriever import candidate_count, run_post_processors
+except ImportError:
+    from hybrid_retriever import candidate_count, run_post_processors
+
+def _row_document(row):
+    return Document(
+        id=str(row["id"]) if row.get("id") is not None else None,
+        page_content=row.get("content", ""),
+        metadata=row.get("metadata") or {},
+    )
+
+class TopKSupabaseVectorStore(SupabaseVectorStore):
+    """SupabaseVectorStore that asks match_documents for exactly k rows.
+
+    The stock implementation only applies a PostgREST `limit` to the RPC result,
+    which still makes Postgres rank the whole table. Passing `match_count` lets
+    the function's ORDER BY ... LIMIT use the HNSW index instead.
+    """
+
+    def __init__(self, *args, ef_search=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if ef_search is None and os.environ.get("HNSW_EF_SEARCH"):
+            ef_search = int(os.environ["HNSW_EF_SEARCH"])
+        self.ef_search = ef_search
+
+    def match_args(self, query, filter, k=None):
+        params = {"query_embedding": query, "filter": filter or {}}
+        if k is not None:
+            params["match_count"] = k
+        if self.ef_search is not None:
+            params["ef_search"] = self.ef_search
+        return params
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, query, k, filter=None, postgrest_filter=None, score_threshold=None
+    ):
+        query_builder = self._client.rpc(self.query_name, self.match_args(query, filter, k))
+        if postgrest_filter:
+            query_builder.params = query_builder.params.set("and", f"({postgrest_filter})")
+
+        response = query_builder.execute()
+
+        results = [
+            (_row_document(row), row.get("similarity", 0.0))
+            for row in response.data or []
+            if row.get("content")
+        ]
+
+        if score_threshold is not None:
+            results = [(doc, similarity) for doc, similarity in results if similarity >= score_threshold]
+        return results
+
+    def similarity_search_many_by_vectors(self, queries, k, filter=None):
+        """Top-k (document, similarity) pairs for each query vector from one match_documents_many call.
+
+        Falls back to one match_documents call per vector on databases that
+        don't have match_documents_many yet.
+        """
+        params = {
+            # pgvector text form; PostgREST passes the array through as text[]
+            "query_embeddings": [json.dumps([float(x) for x in query]) for query in queries],
+            "match_count": k,
+            "filter": filter or {},
+        }
+        if self.ef_search is not None:
+            params["ef_search"] = self.ef_search
+        try:
+            response = self._client.rpc("match_documents_many", params).execute()
+        except Exception as e:
+            print(f"match_documents_many failed ({str(e)}); querying one vector at a time", file=sys.stderr)
+            return [
+                self.similarity_search_by_vector_with_relevance_scores(query, k=k, filter=filter)
+                for query in queries
+            ]
+
+        results = [[] for _ in queries]
+        for row in response.data or []:
+            if row.get("content"):
+                results[row["query_index"]].append((_row_document(row), row.get("similarity", 0.0)))
+        for result in results:
+            result.sort(key=lambda pair: pair[1], reverse=True)
+        return results
+
+class PostProcessedRetriever(BaseRetriever):
+    """Plain vector-store retriever with the same `post_processors` hook as HybridRetriever."""
+
+    vector_store: Any
+    k: int = 8
+    post_processors: List[Any] = []
+
+    def search(self, query, k=None, filter=None):
+        """Return up to k (document, similarity) pairs for the query."""
+        k = k or self.k
+        results = self.vector_store.similarity_search_with_relevance_scores(
+            query, k=candidate_count(self.post_processors, k), filter=filter
+        )
+        return run_post_processors(self.post_processors, query, results, k)[0]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [doc for doc, _ in self.search(query)]
@@ -18,6 +18,7 @@ def setup_database():
         print("\n🗑️ Dropping existing table and functions...")
         try:
             # Try to drop the existing table
+            supabase.rpc('sql', {'query': 'DROP FUNCTION IF EXISTS match_documents_many CASCADE'}).execute()
             supabase.rpc('sql', {'query': 'DROP FUNCTION IF EXISTS match_documents CASCADE'}).execute()
             print("✅ Dropped match_documents function")
         except Exception as e:
@@ -25,7 +26,8 @@ def setup_database():
             
         try:
             supabase.rpc('sql', {'query': 'DROP TABLE IF EXISTS documents CASCADE'}).execute()
-            print("✅ Dropped documents table")
+            supabase.rpc('sql', {'query': 'DROP TABLE IF EXISTS document_sources CASCADE'}).execute()
+            print("✅ Dropped documents and document_sources tables")
         except Exception as e:
             print(f"⚠️ Could not drop table (might not exist): {e}")
         
@@ -37,7 +39,8 @@ def setup_database():
           id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
           content text, 
           metadata jsonb, 
-          embedding vector(768)
+          embedding vector(768),
+          content_hash text
         );
         """
         
@@ -54,7 +57,9 @@ def setup_database():
         create_function_sql = """
         CREATE OR REPLACE FUNCTION match_documents (
           query_embedding vector(768),
-          filter jsonb default '{}'
+          match_count int default null,
+          filter jsonb default '{}',
+          ef_search int default 40
         ) RETURNS TABLE (
           id uuid,
           content text,
@@ -63,6 +68,73 @@ def setup_database():
         ) LANGUAGE plpgsql AS $$
         #variable_conflict use_column
         BEGIN
+          -- A selective filter (under 10000 matching rows, counted through the GIN index)
+          -- is ranked exactly; a broad one goes through HNSW with the filter applied
+          -- during the scan, over-fetching so enough matching rows survive.
+          IF filter IS NOT NULL AND filter <> '{}'::jsonb THEN
+            IF match_count IS NULL OR (
+              SELECT count(*) FROM (SELECT 1 FROM documents WHERE documents.metadata @> filter LIMIT 10000) matching
+            ) < 10000 THEN
+              RETURN QUERY
+              WITH candidates AS MATERIALIZED (
+                SELECT documents.id, documents.content, documents.metadata, documents.embedding
+                FROM documents
+                WHERE documents.metadata @> filter
+              )
+              SELECT
+                candidates.id,
+                candidates.content,
+                candidates.metadata,
+                1 - (candidates.embedding <=> query_embedding) AS similarity
+              FROM candidates
+              ORDER BY candidates.embedding <=> query_embedding
+              LIMIT match_count;
+              RETURN;
+            END IF;
+
+            PERFORM set_config('hnsw.ef_search', LEAST(1000, GREATEST(ef_search, match_count * 10))::text, true);
+            BEGIN
+              -- pgvector 0.8+ keeps scanning until match_count rows pass the filter
+              PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+            EXCEPTION WHEN OTHERS THEN
+              NULL; -- older pgvector: the larger ef_search is the over-fetch
+            END;
+            RETURN QUERY
+            WITH nearest AS MATERIALIZED (
+              SELECT
+                documents.id,
+                documents.content,
+                documents.metadata,
+                documents.embedding <=> query_embedding AS distance
+              FROM documents
+              WHERE documents.metadata @> filter
+              ORDER BY documents.embedding <=> query_embedding
+              LIMIT match_count
+            )
+            -- relaxed_order can return rows slightly out of order
+            SELECT nearest.id, nearest.content, nearest.metadata, 1 - nearest.distance AS similarity
+            FROM nearest
+            ORDER BY nearest.distance;
+            RETURN;
+          END IF;
+
+          -- An HNSW scan returns at most hnsw.ef_search rows (1000 at most), so
+          -- larger or unlimited requests rank every row exactly; "+ 0" keeps the index out
+          IF match_count IS NULL OR match_count > 1000 THEN
+            RETURN QUERY
+            SELECT
+              documents.id,
+              documents.content,
+              documents.metadata,
+              1 - (documents.embedding <=> query_embedding) AS similarity
+            FROM documents
+            ORDER BY (documents.embedding <=> query_embedding) + 0
+            LIMIT match_count;
+            RETURN;
+          END IF;
+
+          -- HNSW can only return as many rows as its candidate list holds
+          PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::text, true);
           RETURN QUERY
           SELECT
             documents.id,
@@ -70,8 +142,8 @@ def setup_database():
             documents.metadata,
             1 - (documents.embedding <=> query_embedding) AS similarity
           FROM documents
-          WHERE documents.metadata @> filter
-          ORDER BY documents.embedding <=> query_embedding;
+          ORDER BY documents.embedding <=> query_embedding
+          LIMIT match_count;
         END;
         $$;
         """
@@ -83,6 +155,219 @@ def setup_database():
             print(f"❌ Error creating function: {e}")
             return False
         
+        print("\n🔧 Creating match_documents_many function...")
+        
+        # Batched variant: one round trip for several query embeddings (pgvector text form)
+        create_many_function_sql = """
+        CREATE OR REPLACE FUNCTION match_documents_many (
+          query_embeddings text[],
+          match_count int default 10,
+          filter jsonb default '{}',
+          ef_search int default 40
+        ) RETURNS TABLE (
+          query_index int,
+          id uuid,
+          content text,
+          metadata jsonb,
+          similarity float
+        ) LANGUAGE sql AS $$
+          SELECT
+            (queries.ordinality - 1)::int AS query_index,
+            matches.id,
+            matches.content,
+            matches.metadata,
+            matches.similarity
+          FROM unnest(query_embeddings) WITH ORDINALITY AS queries(embedding, ordinality)
+          CROSS JOIN LATERAL match_documents(queries.embedding::vector(768), match_count, filter, ef_search) AS matches;
+        $$;
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_many_function_sql}).execute()
+            print("✅ Created match_documents_many function")
+        except Exception as e:
+            print(f"❌ Error creating batched match function: {e}")
+            return False
+        
+        print("\n📇 Creating HNSW index on documents.embedding...")
+        
+        # Build parameters trade index build time/memory for recall; see pgvector docs
+        hnsw_m = int(os.environ.get("HNSW_M", 16))
+        hnsw_ef_construction = int(os.environ.get("HNSW_EF_CONSTRUCTION", 64))
+        create_index_sql = f"""
+        CREATE INDEX IF NOT EXISTS documents_embedding_hnsw_idx
+        ON documents USING hnsw (embedding vector_cosine_ops)
+        WITH (m = {hnsw_m}, ef_construction = {hnsw_ef_construction});
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_index_sql}).execute()
+            print(f"✅ Created HNSW index (m={hnsw_m}, ef_construction={hnsw_ef_construction})")
+        except Exception as e:
+            print(f"❌ Error creating vector index: {e}")
+            return False
+        
+        print("\n📇 Creating GIN index on documents.metadata...")
+        
+        # jsonb_path_ops covers the @> containment used by match_documents filters
+        create_metadata_index_sql = """
+        CREATE INDEX IF NOT EXISTS documents_metadata_gin_idx
+        ON documents USING gin (metadata jsonb_path_ops);
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_metadata_index_sql}).execute()
+            print("✅ Created metadata GIN index")
+        except Exception as e:
+            print(f"❌ Error creating metadata index: {e}")
+            return False
+        
+        print("\n📇 Creating unique index on documents.content_hash...")
+        
+        # Uploads insert with ON CONFLICT (content_hash) DO NOTHING, so a chunk is stored once per source
+        create_hash_index_sql = """
+        CREATE UNIQUE INDEX IF NOT EXISTS documents_content_hash_idx
+        ON documents (content_hash);
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_hash_index_sql}).execute()
+            print("✅ Created content_hash unique index")
+        except Exception as e:
+            print(f"❌ Error creating content_hash index: {e}")
+            return False
+        
+        print("\n🗂️ Creating document_sources manifest table...")
+        
+        # One row per source file: its fingerprint and the content hashes of its chunks
+        create_sources_sql = """
+        CREATE TABLE IF NOT EXISTS document_sources (
+          source text PRIMARY KEY,
+          fingerprint text,
+          chunk_hashes text[] NOT NULL DEFAULT '{}',
+          updated_at timestamptz DEFAULT now()
+        );
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_sources_sql}).execute()
+            print("✅ Created document_sources table")
+        except Exception as e:
+            print(f"❌ Error creating document_sources table: {e}")
+            return False
+        
+        print("\n🧭 Creating update_chunk_metadata function...")
+        
+        # Uploads move already stored chunks to their current position in the file
+        create_update_metadata_sql = """
+        CREATE OR REPLACE FUNCTION update_chunk_metadata(updates jsonb)
+        RETURNS SETOF documents
+        LANGUAGE sql
+        AS $$
+          UPDATE documents d
+          SET metadata = d.metadata || u.value->'metadata'
+          FROM jsonb_array_elements(updates) AS u
+          WHERE d.content_hash = u.value->>'content_hash'
+            AND NOT d.metadata @> u.value->'metadata'
+          RETURNING d.*;
+        $$;
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_update_metadata_sql}).execute()
+            print("✅ Created update_chunk_metadata function")
+        except Exception as e:
+            print(f"❌ Error creating update_chunk_metadata function: {e}")
+            return False
+        
+        print("\n🔢 Creating corpus_state version table...")
+        
+        # Bumped by a trigger on every write to documents, so caches in every process see it
+        create_corpus_state_sql = """
+        CREATE TABLE IF NOT EXISTS corpus_state (
+          id int primary key default 1 check (id = 1),
+          version bigint not null default 0,
+          updated_at timestamptz default now()
+        );
+
+        INSERT INTO corpus_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+        CREATE OR REPLACE FUNCTION bump_corpus_version() RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+          UPDATE corpus_state SET version = version + 1, updated_at = now() WHERE id = 1;
+          RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS documents_corpus_version ON documents;
+        CREATE TRIGGER documents_corpus_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON documents
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_corpus_state_sql}).execute()
+            print("✅ Created corpus_state table and trigger")
+        except Exception as e:
+            print(f"❌ Error creating corpus_state table: {e}")
+            return False
+        
+        print("\n📜 Creating document_changes log...")
+        
+        # Ids written to documents, so in-process indexes and segments catch up on other processes' writes
+        create_changes_sql = """
+        CREATE TABLE IF NOT EXISTS document_changes (
+          seq bigserial primary key,
+          doc_id uuid,
+          op char(1) not null,
+          changed_at timestamptz default now()
+        );
+
+        CREATE OR REPLACE FUNCTION log_document_changes() RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+          IF TG_OP = 'DELETE' THEN
+            INSERT INTO document_changes (doc_id, op) SELECT id, 'D' FROM old_rows;
+          ELSIF TG_OP = 'TRUNCATE' THEN
+            INSERT INTO document_changes (doc_id, op) VALUES (NULL, 'T');
+          ELSE
+            INSERT INTO document_changes (doc_id, op) SELECT id, 'U' FROM new_rows;
+          END IF;
+          RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS documents_log_insert ON documents;
+        CREATE TRIGGER documents_log_insert
+        AFTER INSERT ON documents REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+        DROP TRIGGER IF EXISTS documents_log_update ON documents;
+        CREATE TRIGGER documents_log_update
+        AFTER UPDATE ON documents REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+        DROP TRIGGER IF EXISTS documents_log_delete ON documents;
+        CREATE TRIGGER documents_log_delete
+        AFTER DELETE ON documents REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+        DROP TRIGGER IF EXISTS documents_log_truncate ON documents;
+        CREATE TRIGGER documents_log_truncate
+        AFTER TRUNCATE ON documents
+        FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+        """
+        
+        try:
+            supabase.rpc('sql', {'query': create_changes_sql}).execute()
+            print("✅ Created document_changes table and triggers")
+        except Exception as e:
+            print(f"❌ Error creating document_changes table: {e}")
+            return False
+        
         print("\n🧪 Testing the setup...")
         
         # Test inserting a document
@@ -100,6 +385,7 @@ def setup_database():
             # Test the match function
             response = supabase.rpc('match_documents', {
                 'query_embedding': [0.1] * 768,
+                'match_count': 5,
                 'filter': {}
             }).execute()
             print(f"✅ match_documents function works: found {len(response.data)} documents")
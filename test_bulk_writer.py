@@ -0,0 +1,76 @@
+import threading
+from replica.utils.bulk_writer import BulkWriter
+
+class FakeTable:
+    """Stands in for store.insert/stored_ids: rejects rows marked bad, can commit then fail once."""
+
+    def __init__(self, commit_then_fail=False):
+        self.rows = {}
+        self.calls = 0
+        self.commit_then_fail = commit_then_fail
+        self.lock = threading.Lock()
+
+    def insert(self, rows):
+        with self.lock:
+            self.calls += 1
+            if any(row["content"] == "bad" for row in rows):
+                raise ValueError("400 invalid input syntax")
+            inserted = []
+            for row in rows:
+                if row["content_hash"] not in self.rows:
+                    self.rows[row["content_hash"]] = f"id-{row['content_hash']}"
+                    inserted.append(dict(row, id=self.rows[row["content_hash"]]))
+            if self.commit_then_fail:
+                # The write landed but the response was lost
+                self.commit_then_fail = False
+                raise ValueError("400 connection closed")
+            return inserted
+
+    def stored_ids(self, hashes):
+        with self.lock:
+            return {key: self.rows[key] for key in hashes if key in self.rows}
+
+def _rows(count, bad=()):
+    return [{"content": "bad" if i in bad else f"chunk {i}", "content_hash": f"h{i}"} for i in range(count)]
+
+def test_bad_row_costs_only_itself():
+    """A rejected batch is bisected until only the bad row fails"""
+    table, reported = FakeTable(), []
+    writer = BulkWriter(table.insert, on_inserted=reported.extend, max_batch_rows=16, max_retries=0)
+    writer.add(_rows(16, bad={5}))
+    failed = writer.flush()
+    writer.close()
+
+    assert [row["content_hash"] for row, _ in failed] == ["h5"]
+    assert len(reported) == 15 and len(table.rows) == 15
+    print("✅ Bad row isolated by bisection")
+
+def test_batches_sized_by_bytes():
+    """Requests are cut at max_batch_bytes, not at a row count"""
+    table = FakeTable()
+    writer = BulkWriter(table.insert, max_batch_bytes=200, max_batch_rows=500)
+    writer.add(_rows(20))
+    writer.flush()
+    writer.close()
+
+    assert writer.inserted == 20 and writer.requests > 1
+    print(f"✅ 20 rows sent in {writer.requests} byte-sized requests")
+
+def test_committed_failure_still_reported():
+    """Rows a failed request committed anyway are looked up and reported, not retried"""
+    table, reported = FakeTable(commit_then_fail=True), []
+    writer = BulkWriter(table.insert, on_inserted=reported.extend, lookup=table.stored_ids, max_retries=0)
+    writer.add(_rows(8))
+    failed = writer.flush()
+    writer.close()
+
+    assert failed == []
+    assert sorted(row["id"] for row in reported) == sorted(table.rows.values())
+    assert table.calls == 1
+    print("✅ Committed rows of a failed request reported")
+
+if __name__ == "__main__":
+    print("🧪 Testing the bisecting bulk writer...")
+    test_bad_row_costs_only_itself()
+    test_batches_sized_by_bytes()
+    test_committed_failure_still_reported()
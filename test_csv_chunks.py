@@ -0,0 +1,71 @@
+import csv
+import os
+import tempfile
+from langchain_community.document_loaders import CSVLoader
+from replica.utils.parallel_parsing import iter_csv_chunks
+
+def _write_csv(directory, name, header, rows):
+    path = os.path.join(directory, name)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return path
+
+def test_rows_grouped_under_header():
+    """Rows are packed into chunks that each start with the header and stay within chunk_size"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = _write_csv(directory, "people.csv", ["name", "city"], [[f"person {i}", f"city {i}"] for i in range(200)])
+        chunks = list(iter_csv_chunks(path, "people.csv", chunk_size=300))
+
+        assert sum(rows for rows, _ in chunks) == 200
+        assert all(chunk.page_content.startswith("name,city\n") for _, chunk in chunks)
+        assert max(len(chunk.page_content) for _, chunk in chunks) <= 300
+        # Row ranges are contiguous and cover the file
+        ranges = [(chunk.metadata["row"], chunk.metadata["row_end"]) for _, chunk in chunks]
+        assert ranges[0][0] == 0 and ranges[-1][1] == 199
+        assert all(end + 1 == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    print("✅ Rows grouped under the header")
+
+def test_wide_header_counts_toward_chunk_size():
+    """A header wider than the chunk is abbreviated instead of overflowing every chunk"""
+    with tempfile.TemporaryDirectory() as directory:
+        header = [f"column_name_{i}" for i in range(100)]
+        path = _write_csv(directory, "wide.csv", header, [[f"v{r}_{i}" for i in range(100)] for r in range(20)])
+        chunks = [chunk for _, chunk in iter_csv_chunks(path, "wide.csv", chunk_size=1000)]
+
+        assert max(len(chunk.page_content) for chunk in chunks) <= 1000
+        first_line = chunks[0].page_content.split("\n")[0]
+        assert len(first_line) <= 250 and first_line.endswith(",...")
+    print("✅ Wide header abbreviated within the chunk budget")
+
+def test_selected_columns_keep_metadata_small():
+    """Only the chosen columns are embedded, and full rows aren't copied into metadata"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = _write_csv(directory, "orders.csv", ["id", "note", "total"], [[i, "x" * 200, i * 10] for i in range(30)])
+        chunks = [chunk for _, chunk in iter_csv_chunks(path, "orders.csv", columns=["id", "total"])]
+
+        assert chunks[0].page_content.startswith("id,total\n0,0\n")
+        assert "x" * 200 not in chunks[0].page_content
+        assert set(chunks[0].metadata) == {"source", "file_type", "row", "row_end"}
+    print("✅ Selected columns embedded, metadata kept small")
+
+def test_blank_lines_match_csvloader():
+    """Blank lines are skipped and not counted, empty-field rows are kept, as CSVLoader does"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "gaps.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("a,b\n1,2\n\n,\n3,4\n")
+        chunks = [chunk for _, chunk in iter_csv_chunks(path, "gaps.csv", chunk_size=12)]
+        loader_rows = [doc.metadata["row"] for doc in CSVLoader(path).load()]
+
+        covered = [row for chunk in chunks for row in range(chunk.metadata["row"], chunk.metadata["row_end"] + 1)]
+        assert covered == loader_rows == [0, 1, 2]
+    print("✅ Blank lines handled like CSVLoader")
+
+if __name__ == "__main__":
+    print("🧪 Testing grouped CSV chunking...")
+    test_rows_grouped_under_header()
+    test_wide_header_counts_toward_chunk_size()
+    test_selected_columns_keep_metadata_small()
+    test_blank_lines_match_csvloader()
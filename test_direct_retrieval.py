@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from supabase.client import create_client
+from replica.utils.table_scan import scan_table
 
 # Load environment variables
 load_dotenv()
@@ -18,8 +19,7 @@ try:
     print(f"Testing query: '{query}'")
     
     # Get all documents
-    response = supabase.table("documents").select("*").execute()
-    all_docs = response.data
+    all_docs = list(scan_table(supabase, "id, content, metadata"))
     
     print(f"Found {len(all_docs)} total documents in database")
     
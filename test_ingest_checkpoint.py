@@ -0,0 +1,68 @@
+import os
+import tempfile
+from replica.utils.ingest_checkpoint import IngestCheckpoint, discard_checkpoint
+
+def test_progress_survives_reopen():
+    """A reopened checkpoint resumes with the interrupted run's mode and stored hashes"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checkpoint.jsonl")
+        checkpoint = IngestCheckpoint(path)
+        checkpoint.start_run("append")
+        checkpoint.record("a.pdf", ["h1", "h2"])
+        checkpoint.record("a.pdf", ["h2", "h3"])
+        checkpoint.record("b.pdf", ["h4"])
+        checkpoint.mark_done("b.pdf", "fp-b")
+        checkpoint.close()
+
+        resumed = IngestCheckpoint(path)
+        assert resumed.interrupted_run() == "append"
+        assert resumed.stored_hashes("a.pdf") == {"h1", "h2", "h3"}
+        # Finishing a file replaces its partial progress
+        assert resumed.stored_hashes("b.pdf") == set()
+        assert resumed.is_done("b.pdf", "fp-b")
+        assert not resumed.is_done("b.pdf", "fp-changed") and not resumed.is_done("b.pdf", None)
+        resumed.close()
+    print("✅ Progress survives a reopen")
+
+def test_truncated_last_line_ignored():
+    """A line cut off by a crash is skipped; everything before it is kept"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checkpoint.jsonl")
+        checkpoint = IngestCheckpoint(path)
+        checkpoint.record("a.pdf", ["h1"])
+        checkpoint.close()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"source": "a.pdf", "stor')
+
+        resumed = IngestCheckpoint(path)
+        assert resumed.stored_hashes("a.pdf") == {"h1"}
+        resumed.close()
+    print("✅ Truncated line ignored")
+
+def test_forget_and_reset():
+    """forget drops one file's progress, reset and discard_checkpoint drop everything"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checkpoint.jsonl")
+        checkpoint = IngestCheckpoint(path)
+        checkpoint.start_run("replace")
+        checkpoint.record("a.pdf", ["h1"])
+        checkpoint.mark_done("b.pdf", "fp-b")
+        checkpoint.forget("b.pdf")
+        assert not checkpoint.is_done("b.pdf", "fp-b")
+        assert checkpoint.stored_hashes("a.pdf") == {"h1"}
+
+        checkpoint.reset()
+        checkpoint.close()
+        resumed = IngestCheckpoint(path)
+        assert resumed.interrupted_run() is None and resumed.stored_hashes("a.pdf") == set()
+        resumed.close()
+
+        discard_checkpoint(path)
+        assert not os.path.exists(path)
+    print("✅ Forget and reset drop progress")
+
+if __name__ == "__main__":
+    print("🧪 Testing the ingest checkpoint...")
+    test_progress_survives_reopen()
+    test_truncated_last_line_ignored()
+    test_forget_and_reset()
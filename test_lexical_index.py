@@ -0,0 +1,94 @@
+from replica.utils.change_log import changes_since
+from replica.utils.lexical_index import BM25Index
+
+def _index():
+    index = BM25Index()
+    index.add("a", "pumps and valves for the cooling loop", {"source": "manual.pdf", "chunk_index": 0, "page": 1})
+    index.add("b", "valves need a yearly inspection", {"source": "manual.pdf", "chunk_index": 1, "page": 1})
+    index.add("c", "the cooling loop runs at low pressure", {"source": "manual.pdf", "chunk_index": 2, "page": 2})
+    return index
+
+def test_deleted_rows_leave_no_trace():
+    """A removed row is no longer scored, and its postings and neighbour keys are gone"""
+    index = _index()
+    index.remove("b")
+
+    assert len(index) == 2
+    assert [row["id"] for _, row in index.search("valves")] == ["a"]
+    assert "inspection" not in index._postings
+    assert index.chunks_at([("manual.pdf", 1)]) == {}
+    assert [row["id"] for row in index.page_chunks([("manual.pdf", 1)])[("manual.pdf", 1)]] == ["a"]
+    assert index._total_len == sum(index._doc_len.values())
+    print("✅ Deleted row leaves no trace")
+
+def test_readding_replaces_row():
+    """Adding an id again replaces its text and metadata instead of duplicating it"""
+    index = _index()
+    index.add("c", "the loop was drained", {"source": "manual.pdf", "chunk_index": 5})
+
+    assert len(index) == 3
+    assert index.search("pressure") == []
+    assert index.chunks_at([("manual.pdf", 2), ("manual.pdf", 5)]).keys() == {("manual.pdf", 5)}
+    print("✅ Re-adding a row replaces it")
+
+def test_clear_empties_everything():
+    index = _index()
+    index.clear()
+    assert len(index) == 0 and index.search("cooling") == [] and not index._postings
+    print("✅ Clear empties the index")
+
+class _ChangesQuery:
+    """Just enough of a PostgREST query over document_changes for changes_since."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.after = None
+        self.count = None
+
+    def select(self, columns):
+        return self
+
+    def gt(self, column, value):
+        self.after = value
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def execute(self):
+        rows = [entry for entry in self.entries if entry["seq"] > self.after][:self.count]
+        return type("Response", (), {"data": rows})()
+
+class _ChangesClient:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def table(self, name):
+        return _ChangesQuery(self.entries)
+
+def test_changes_collapse_to_last_operation():
+    """The change log collapses to each row's last operation; a truncate drops what came before"""
+    entries = [
+        {"seq": 1, "doc_id": "a", "op": "U"},
+        {"seq": 2, "doc_id": "b", "op": "U"},
+        {"seq": 3, "doc_id": "a", "op": "D"},
+        {"seq": 4, "doc_id": None, "op": "T"},
+        {"seq": 5, "doc_id": "c", "op": "U"},
+        {"seq": 6, "doc_id": "c", "op": "D"},
+        {"seq": 7, "doc_id": "d", "op": "U"},
+    ]
+    assert changes_since(_ChangesClient(entries), 0, page_size=2) == ({"c": "D", "d": "U"}, 7, True)
+    assert changes_since(_ChangesClient(entries[:3]), 1) == ({"b": "U", "a": "D"}, 3, False)
+    assert changes_since(_ChangesClient(entries), 7) == ({}, 7, False)
+    print("✅ Change log collapsed")
+
+if __name__ == "__main__":
+    print("🧪 Testing BM25 index deletes...")
+    test_deleted_rows_leave_no_trace()
+    test_readding_replaces_row()
+    test_clear_empties_everything()
+    test_changes_collapse_to_last_operation()
@@ -0,0 +1,54 @@
+import numpy as np
+from langchain_core.documents import Document
+from replica.utils.mmr import MMRPostProcessor, maximal_marginal_relevance, relevance_from_scores
+from replica.utils.vector_index import LocalVectorIndex
+
+VECTORS = {
+    "alpha": [1.0, 0.0, 0.0],
+    "alpha-copy": [1.0, 0.02, 0.0],
+    "beta": [0.0, 1.0, 0.0],
+    "gamma": [0.0, 0.0, 1.0],
+}
+
+def _index():
+    index = LocalVectorIndex(dim=3)
+    index.add_rows([{"id": doc_id, "content": doc_id, "embedding": vector} for doc_id, vector in VECTORS.items()])
+    return index
+
+def _results(pairs):
+    return [(Document(id=doc_id, page_content=doc_id), score) for doc_id, score in pairs]
+
+def test_near_duplicate_dropped():
+    """MMR skips a near-copy of the top hit in favour of the next distinct one"""
+    results = _results([("alpha", 0.032), ("alpha-copy", 0.031), ("beta", 0.02), ("gamma", 0.016)])
+    kept = MMRPostProcessor(_index(), lambda_mult=0.5).process("query", results, 2)
+    assert [doc.id for doc, _ in kept] == ["alpha", "beta"]
+    print("✅ Near-duplicate dropped")
+
+def test_relevance_follows_incoming_order():
+    """With lambda 1.0 the incoming (fused) order is kept exactly"""
+    results = _results([("gamma", 0.05), ("alpha", 0.04), ("beta", 0.03), ("alpha-copy", 0.01)])
+    kept = MMRPostProcessor(_index(), lambda_mult=1.0).process("query", results, 3)
+    assert [doc.id for doc, _ in kept] == ["gamma", "alpha", "beta"]
+    print("✅ Incoming order used as relevance")
+
+def test_unindexed_candidates_pass_through():
+    """Candidates missing from the local index keep their order rather than being fetched"""
+    results = _results([("alpha", 0.03), ("alpha-copy", 0.02), ("unknown", 0.01)])
+    kept = MMRPostProcessor(_index()).process("query", results, 2)
+    assert [doc.id for doc, _ in kept] == ["alpha", "alpha-copy"]
+    print("✅ Unindexed candidates passed through")
+
+def test_relevance_scaling():
+    """Scores are min-max scaled; ties fall back to rank"""
+    assert np.allclose(relevance_from_scores([0.5, 0.3, 0.1]), [1.0, 0.5, 0.0])
+    assert np.allclose(relevance_from_scores([0.2, 0.2]), [1.0, 0.5])
+    assert maximal_marginal_relevance([0.0, 1.0], [[1.0, 0.0], [0.0, 1.0]], 1) == [1]
+    print("✅ Relevance scaled")
+
+if __name__ == "__main__":
+    print("🧪 Testing MMR ordering...")
+    test_near_duplicate_dropped()
+    test_relevance_follows_incoming_order()
+    test_unindexed_candidates_pass_through()
+    test_relevance_scaling()
@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from supabase.client import create_client
+from replica.utils.table_scan import scan_table
 
 # Load environment variables
 load_dotenv()
@@ -30,24 +31,25 @@ def test_document_retrieval():
             "What is the problem statement?"
         ]
         
+        # Fetch the HMI chunks once rather than re-reading them for every query
+        hmi_docs = list(scan_table(supabase, "id, content", filters={"metadata->>source": "HMI Poster.pdf"}))
+        
         for query in test_queries:
             print(f"\n📋 Query: {query}")
             
             # Generate embedding for the query
             query_embedding = embeddings.embed_query(query)
             
-            # Get all documents and find relevant ones manually
+            # Find relevant chunks manually
             # (since we don't have the match_documents function)
-            response = supabase.table("documents").select("*").eq("metadata->>source", "HMI Poster.pdf").execute()
-            
-            if response.data:
-                print(f"✅ Found {len(response.data)} relevant document chunks")
+            if hmi_docs:
+                print(f"✅ Found {len(hmi_docs)} relevant document chunks")
                 
                 # Show most relevant content (simple approach)
                 best_match = None
                 best_score = -1
                 
-                for doc in response.data:
+                for doc in hmi_docs:
                     content_lower = doc["content"].lower()
                     query_lower = query.lower()
                     
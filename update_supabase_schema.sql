@@ -1,21 +1,143 @@
 -- Drop existing function first
+DROP FUNCTION IF EXISTS match_documents_many;
 DROP FUNCTION IF EXISTS match_documents;
 
 -- Drop existing table (WARNING: This will delete all your existing documents)
 DROP TABLE IF EXISTS documents;
+DROP TABLE IF EXISTS document_sources;
 
 -- Recreate table with 768 dimensions for Gemini
 CREATE TABLE documents (
   id uuid primary key,
   content text, -- corresponds to Document.pageContent
   metadata jsonb, -- corresponds to Document.metadata
-  embedding vector(768) -- 768 dimensions for Google's embedding-001 model
+  embedding vector(768), -- 768 dimensions for Google's embedding-001 model
+  content_hash text -- sha256(model name || content), see replica/utils/content_store.py
 );
 
--- Recreate the function with 768 dimensions
+-- Approximate nearest-neighbour index for cosine distance.
+-- Raise m / ef_construction for better recall at the cost of build time and memory.
+CREATE INDEX documents_embedding_hnsw_idx
+ON documents USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- Containment index for metadata filters (source, file_type, upload_batch, tenant).
+-- jsonb_path_ops only supports @>, which is all match_documents uses, and is smaller than the default opclass.
+CREATE INDEX documents_metadata_gin_idx
+ON documents USING gin (metadata jsonb_path_ops);
+
+-- One row per chunk text per source: uploads insert with ON CONFLICT (content_hash) DO NOTHING.
+-- Rows without a hash (NULL) never conflict.
+CREATE UNIQUE INDEX documents_content_hash_idx
+ON documents (content_hash);
+
+-- Per-source manifest for incremental re-ingestion: the sha256 of the file last
+-- ingested under each name and the content_hash of each of its chunks.
+CREATE TABLE document_sources (
+  source text primary key,
+  fingerprint text,
+  chunk_hashes text[] not null default '{}',
+  updated_at timestamptz default now()
+);
+
+-- Moves already stored chunks to their current position in their file on each
+-- upload, so neighbour expansion stays contiguous after a sync.
+CREATE OR REPLACE FUNCTION update_chunk_metadata(updates jsonb)
+RETURNS SETOF documents
+LANGUAGE sql
+AS $$
+  UPDATE documents d
+  SET metadata = d.metadata || u.value->'metadata'
+  FROM jsonb_array_elements(updates) AS u
+  WHERE d.content_hash = u.value->>'content_hash'
+    AND NOT d.metadata @> u.value->'metadata'
+  RETURNING d.*;
+$$;
+
+-- Shared corpus version: bumped by a statement-level trigger on every write to
+-- documents, so every process's retrieval and answer caches see uploads and
+-- deletes made elsewhere (see replica/utils/corpus_sync.py).
+CREATE TABLE IF NOT EXISTS corpus_state (
+  id int primary key default 1 check (id = 1),
+  version bigint not null default 0,
+  updated_at timestamptz default now()
+);
+
+INSERT INTO corpus_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_corpus_version() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE corpus_state SET version = version + 1, updated_at = now() WHERE id = 1;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS documents_corpus_version ON documents;
+CREATE TRIGGER documents_corpus_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON documents
+FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+
+-- Document change log: the id of every row written to documents, so each
+-- process applies other processes' writes to its in-process BM25 and vector
+-- indexes and a prebuilt embedding segment is reconciled from the entries
+-- since its build (see replica/utils/change_log.py).
+CREATE TABLE IF NOT EXISTS document_changes (
+  seq bigserial primary key,
+  doc_id uuid,
+  op char(1) not null,
+  changed_at timestamptz default now()
+);
+
+CREATE OR REPLACE FUNCTION log_document_changes() RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    INSERT INTO document_changes (doc_id, op) SELECT id, 'D' FROM old_rows;
+  ELSIF TG_OP = 'TRUNCATE' THEN
+    INSERT INTO document_changes (doc_id, op) VALUES (NULL, 'T');
+  ELSE
+    INSERT INTO document_changes (doc_id, op) SELECT id, 'U' FROM new_rows;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS documents_log_insert ON documents;
+CREATE TRIGGER documents_log_insert
+AFTER INSERT ON documents REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+DROP TRIGGER IF EXISTS documents_log_update ON documents;
+CREATE TRIGGER documents_log_update
+AFTER UPDATE ON documents REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+DROP TRIGGER IF EXISTS documents_log_delete ON documents;
+CREATE TRIGGER documents_log_delete
+AFTER DELETE ON documents REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+DROP TRIGGER IF EXISTS documents_log_truncate ON documents;
+CREATE TRIGGER documents_log_truncate
+AFTER TRUNCATE ON documents
+FOR EACH STATEMENT EXECUTE FUNCTION log_document_changes();
+
+-- Recreate the function with 768 dimensions.
+-- match_count limits the result set server-side. An HNSW scan returns at most
+-- hnsw.ef_search rows, and ef_search is capped at 1000, so NULL (every row) or a
+-- count above 1000 ranks the whole table exactly instead of using the index;
+-- ef_search is the HNSW candidate list size used otherwise (raised to match_count).
+-- A selective filter narrows to the matching rows through the GIN index and ranks
+-- them exactly; a broad one (10000+ rows) uses HNSW with the filter applied in the
+-- scan, iterative (pgvector 0.8+) or over-fetched, since an exact scan would be slow.
 CREATE FUNCTION match_documents (
   query_embedding vector(768),
-  filter jsonb default '{}'
+  match_count int default null,
+  filter jsonb default '{}',
+  ef_search int default 40
 ) RETURNS TABLE (
   id uuid,
   content text,
@@ -24,6 +146,71 @@ CREATE FUNCTION match_documents (
 ) LANGUAGE plpgsql AS $$
 #variable_conflict use_column
 BEGIN
+  -- A selective filter (under 10000 matching rows, counted through the GIN index)
+  -- is ranked exactly; a broad one goes through HNSW with the filter applied
+  -- during the scan, over-fetching so enough matching rows survive.
+  IF filter IS NOT NULL AND filter <> '{}'::jsonb THEN
+    IF match_count IS NULL OR (
+      SELECT count(*) FROM (SELECT 1 FROM documents WHERE documents.metadata @> filter LIMIT 10000) matching
+    ) < 10000 THEN
+      RETURN QUERY
+      WITH candidates AS MATERIALIZED (
+        SELECT documents.id, documents.content, documents.metadata, documents.embedding
+        FROM documents
+        WHERE documents.metadata @> filter
+      )
+      SELECT
+        candidates.id,
+        candidates.content,
+        candidates.metadata,
+        1 - (candidates.embedding <=> query_embedding) AS similarity
+      FROM candidates
+      ORDER BY candidates.embedding <=> query_embedding
+      LIMIT match_count;
+      RETURN;
+    END IF;
+
+    PERFORM set_config('hnsw.ef_search', LEAST(1000, GREATEST(ef_search, match_count * 10))::text, true);
+    BEGIN
+      -- pgvector 0.8+ keeps scanning until match_count rows pass the filter
+      PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN OTHERS THEN
+      NULL; -- older pgvector: the larger ef_search is the over-fetch
+    END;
+    RETURN QUERY
+    WITH nearest AS MATERIALIZED (
+      SELECT
+        documents.id,
+        documents.content,
+        documents.metadata,
+        documents.embedding <=> query_embedding AS distance
+      FROM documents
+      WHERE documents.metadata @> filter
+      ORDER BY documents.embedding <=> query_embedding
+      LIMIT match_count
+    )
+    -- relaxed_order can return rows slightly out of order
+    SELECT nearest.id, nearest.content, nearest.metadata, 1 - nearest.distance AS similarity
+    FROM nearest
+    ORDER BY nearest.distance;
+    RETURN;
+  END IF;
+
+  IF match_count IS NULL OR match_count > 1000 THEN
+    -- "+ 0" keeps the planner off the HNSW index
+    RETURN QUERY
+    SELECT
+      id,
+      content,
+      metadata,
+      1 - (documents.embedding <=> query_embedding) AS similarity
+    FROM documents
+    ORDER BY (documents.embedding <=> query_embedding) + 0
+    LIMIT match_count;
+    RETURN;
+  END IF;
+
+  PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::text, true);
   RETURN QUERY
   SELECT
     id,
@@ -31,7 +218,31 @@ BEGIN
     metadata,
     1 - (documents.embedding <=> query_embedding) AS similarity
   FROM documents
-  WHERE metadata @> filter
-  ORDER BY documents.embedding <=> query_embedding;
+  ORDER BY documents.embedding <=> query_embedding
+  LIMIT match_count;
 END;
-$$; 
\ No newline at end of file
+$$;
+
+-- Several queries in one call (one result set, tagged with the 0-based query_index).
+-- Embeddings are passed in pgvector's text form, e.g. '[0.1,0.2,...]'.
+CREATE FUNCTION match_documents_many (
+  query_embeddings text[],
+  match_count int default 10,
+  filter jsonb default '{}',
+  ef_search int default 40
+) RETURNS TABLE (
+  query_index int,
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+) LANGUAGE sql AS $$
+  SELECT
+    (queries.ordinality - 1)::int AS query_index,
+    matches.id,
+    matches.content,
+    matches.metadata,
+    matches.similarity
+  FROM unnest(query_embeddings) WITH ORDINALITY AS queries(embedding, ordinality)
+  CROSS JOIN LATERAL match_documents(queries.embedding::vector(768), match_count, filter, ef_search) AS matches;
+$$;